@@ -0,0 +1,130 @@
+"""
+Micro-benchmark: decode the values of a synthetic subscription response.
+
+Compares the table driven value decoder (cached per subscription response and
+variable) against the previous if-chain parser and the range comparisons in
+read_subscription, both reproduced below.
+
+usage (from the repository root):
+    PYTHONPATH=. python benchmarks/bench_decoder.py [number_of_persons]
+"""
+import sys
+import timeit
+
+from synthetic import subscription_response
+
+from flowcontrol.crownetcontrol.traci import constants_vadere as tc
+from flowcontrol.crownetcontrol.traci.connection import BaseTraCIConnection
+from flowcontrol.crownetcontrol.traci.domains.domain import SubscriptionResults
+from flowcontrol.crownetcontrol.traci.domains.VaderePersonAPI import VaderePersonAPI
+from flowcontrol.crownetcontrol.traci.exceptions import FatalTraCIError
+from flowcontrol.crownetcontrol.traci.storage import Storage
+
+
+def _legacy_parse(valueFunc, varID, data):
+    varType = data.read("!B")[0]
+    if varID in valueFunc:
+        return valueFunc[varID](data)
+    if varType in (tc.POSITION_2D, tc.POSITION_LON_LAT):
+        return data.read("!dd")
+    if varType in (tc.POSITION_3D, tc.POSITION_LON_LAT_ALT):
+        return data.read("!ddd")
+    if varType == tc.TYPE_POLYGON:
+        return data.readShape()
+    if varType == tc.TYPE_UBYTE:
+        return data.read("!B")[0]
+    if varType == tc.TYPE_BYTE:
+        return data.read("!b")[0]
+    if varType == tc.TYPE_INTEGER:
+        return data.readInt()
+    if varType == tc.TYPE_DOUBLE:
+        return data.readDouble()
+    if varType == tc.TYPE_STRING:
+        return data.readString()
+    if varType == tc.TYPE_STRINGLIST:
+        return data.readStringList()
+    if varType == tc.TYPE_DOUBLELIST:
+        return data.readDoubleList()
+    if varType == tc.TYPE_COMPOUND:
+        nr_components = data.read("!i")[0]
+        return [_legacy_parse(valueFunc, varID, data) for _ in range(nr_components)]
+    if varType == tc.TYPE_COLOR:
+        return data.read("!BBBB")
+    raise FatalTraCIError(
+        "Unknown variable %02x or invalid type %02x." % (varID, varType)
+    )
+
+
+class LegacySubscriptionResults(SubscriptionResults):
+    def add(self, refID, varID, data):
+        if refID not in self._results:
+            self._results[refID] = {}
+        self._results[refID][varID] = _legacy_parse(self._valueFunc, varID, data)
+
+
+class LegacyConnection(BaseTraCIConnection):
+    """variable subscriptions only, as read before the lookup table"""
+
+    def read_subscription(self, result):
+        result.readLength()
+        response = result.read("!B")[0]
+        is_variable_subscription = (
+            tc.RESPONSE_SUBSCRIBE_INDUCTIONLOOP_VARIABLE
+            <= response
+            <= tc.RESPONSE_SUBSCRIBE_BUSSTOP_VARIABLE
+        ) or (
+            tc.RESPONSE_SUBSCRIBE_PARKINGAREA_VARIABLE
+            <= response
+            <= tc.RESPONSE_SUBSCRIBE_OVERHEADWIRE_VARIABLE
+        )
+        assert is_variable_subscription
+        object_id = result.readString()
+        num_vars = result.read("!B")[0]
+        while num_vars > 0:
+            var_id, status = result.read("!BB")
+            if status:
+                print("Error!", result.readTypedString())
+            elif response in self.subscriptionMapping:
+                self.subscriptionMapping[response].add(object_id, var_id, result)
+            num_vars -= 1
+        return response, object_id
+
+
+def _legacy_connection():
+    connection = LegacyConnection(None, default_domains=[VaderePersonAPI()])
+    response = tc.RESPONSE_SUBSCRIBE_V_PERSON_VARIABLE
+    current = connection.subscriptionMapping[response]
+    legacy = LegacySubscriptionResults(current._valueFunc, *current.managed_domain_cmds)
+    connection.subscriptionMapping[response] = legacy
+    return connection
+
+
+def decode(connection, content):
+    connection.parse_subscription_result(Storage(content))
+    return connection.subscriptionMapping[tc.RESPONSE_SUBSCRIBE_V_PERSON_VARIABLE].get()
+
+
+def main(number_of_persons=10000, repeat=5):
+    content = subscription_response(number_of_persons)
+    connections = {
+        "if-chain": _legacy_connection(),
+        "table": BaseTraCIConnection(None, default_domains=[VaderePersonAPI()]),
+    }
+
+    expected, actual = [
+        {k: dict(v) for k, v in decode(c, content).items()} for c in connections.values()
+    ]
+    assert expected == actual, "decoders disagree"
+
+    print(f"payload: {len(content) / 1e6:.2f} MB, {number_of_persons} persons")
+    timings = {}
+    for name, connection in connections.items():
+        timings[name] = min(
+            timeit.repeat(lambda: decode(connection, content), number=1, repeat=repeat)
+        )
+        print(f"{name:>10}: {timings[name] * 1e3:8.1f} ms")
+    print(f"speedup: {timings['if-chain'] / timings['table']:.2f}x")
+
+
+if __name__ == "__main__":
+    main(*[int(a) for a in sys.argv[1:2]])
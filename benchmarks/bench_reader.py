@@ -0,0 +1,87 @@
+"""
+Loopback benchmark: receive 1 KB, 1 MB and 50 MB TraCI messages.
+
+Compares the MessageReader (recv_into a reusable bytearray) used by
+Connection.recv_exact against the previous reader that concatenated bytes.
+
+usage (from the repository root):
+    PYTHONPATH=. python benchmarks/bench_reader.py
+"""
+import socket
+import struct
+import threading
+import time
+
+from flowcontrol.crownetcontrol.traci.reader import MessageReader
+
+SIZES = {"1 KB": 1024, "1 MB": 1024 ** 2, "50 MB": 50 * 1024 ** 2}
+
+
+def concat_recv_exact(_socket):
+    """previous Connection.recv_exact without the Storage wrapper"""
+    result = bytes()
+    while len(result) < 4:
+        t = _socket.recv(4 - len(result))
+        if not t:
+            return None
+        result += t
+    length = struct.unpack("!i", result)[0] - 4
+    result = bytes()
+    while len(result) < length:
+        t = _socket.recv(length - len(result))
+        if not t:
+            return None
+        result += t
+    return result
+
+
+def loopback_pair():
+    server = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    server.bind(("127.0.0.1", 0))
+    server.listen(1)
+    client = socket.create_connection(server.getsockname())
+    accepted, _ = server.accept()
+    server.close()
+    return client, accepted
+
+
+def measure(receive, size, repeat):
+    sender, receiver = loopback_pair()
+    message = struct.pack("!i", size + 4) + bytes(size)
+
+    def send():
+        for _ in range(repeat):
+            sender.sendall(message)
+
+    thread = threading.Thread(target=send)
+    start = time.perf_counter()
+    thread.start()
+    for _ in range(repeat):
+        assert len(receive(receiver)) == size
+    elapsed = time.perf_counter() - start
+    thread.join()
+    sender.close()
+    receiver.close()
+    return elapsed / repeat
+
+
+def main():
+    for label, size in SIZES.items():
+        repeat = max(1, min(1000, 2 * 1024 ** 2 // size))
+        old = measure(concat_recv_exact, size, repeat)
+        reader = {}
+
+        def recv_into(_socket):
+            if _socket not in reader:
+                reader[_socket] = MessageReader(_socket)
+            return reader[_socket].read_message()
+
+        new = measure(recv_into, size, repeat)
+        print(
+            f"{label:>6}: bytes += {old * 1e3:9.3f} ms, recv_into {new * 1e3:9.3f} ms, "
+            f"speedup {old / new:6.2f}x"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,85 @@
+"""
+Micro-benchmark: decode a synthetic 10k-person subscription response.
+
+Compares the memoryview based Storage against the previous slicing reader
+(struct.calcsize + bytes slice per field) that is reproduced below.
+
+usage (from the repository root):
+    PYTHONPATH=. python benchmarks/bench_storage.py [number_of_persons]
+"""
+import struct
+import sys
+import timeit
+
+from synthetic import subscription_response
+
+from flowcontrol.crownetcontrol.traci import constants_vadere as tc
+from flowcontrol.crownetcontrol.traci.connection import BaseTraCIConnection
+from flowcontrol.crownetcontrol.traci.domains.VaderePersonAPI import VaderePersonAPI
+from flowcontrol.crownetcontrol.traci.storage import Storage
+
+
+class SlicingStorage(Storage):
+    """reader as it was before Storage wrapped a memoryview"""
+
+    def __init__(self, content):
+        self._content = bytes(content)
+        self._pos = 0
+
+    def read(self, format):
+        oldPos = self._pos
+        self._pos += struct.calcsize(format)
+        return struct.unpack(format, self._content[oldPos : self._pos])
+
+    def readInt(self):
+        return self.read("!i")[0]
+
+    def readDouble(self):
+        return self.read("!d")[0]
+
+    def readLength(self):
+        length = self.read("!B")[0]
+        if length > 0:
+            return length
+        return self.read("!i")[0]
+
+    def readString(self):
+        length = self.read("!i")[0]
+        return str(self.read("!%ss" % length)[0].decode("latin1"))
+
+    def readStringList(self):
+        n = self.read("!i")[0]
+        return tuple([self.readString() for i in range(n)])
+
+    def readDoubleList(self):
+        n = self.read("!i")[0]
+        return tuple([self.readDouble() for i in range(n)])
+
+
+def decode(connection, storage_cls, content):
+    connection.parse_subscription_result(storage_cls(content))
+    return connection.subscriptionMapping[tc.RESPONSE_SUBSCRIBE_V_PERSON_VARIABLE].get()
+
+
+def main(number_of_persons=10000, repeat=5):
+    content = subscription_response(number_of_persons)
+    connection = BaseTraCIConnection(None, default_domains=[VaderePersonAPI()])
+
+    expected = {k: dict(v) for k, v in decode(connection, SlicingStorage, content).items()}
+    actual = {k: dict(v) for k, v in decode(connection, Storage, content).items()}
+    assert expected == actual, "decoders disagree"
+
+    print(f"payload: {len(content) / 1e6:.2f} MB, {number_of_persons} persons")
+    timings = {}
+    for storage_cls in (SlicingStorage, Storage):
+        timings[storage_cls] = min(
+            timeit.repeat(
+                lambda: decode(connection, storage_cls, content), number=1, repeat=repeat
+            )
+        )
+        print(f"{storage_cls.__name__:>15}: {timings[storage_cls] * 1e3:8.1f} ms")
+    print(f"speedup: {timings[SlicingStorage] / timings[Storage]:.2f}x")
+
+
+if __name__ == "__main__":
+    main(*[int(a) for a in sys.argv[1:2]])
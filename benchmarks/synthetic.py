@@ -0,0 +1,63 @@
+"""
+Synthetic TraCI payloads shared by the benchmark scripts.
+
+The messages follow the layout Vadere sends for a CMD_SIMSTEP response:
+number of subscription responses followed by one variable subscription
+response per pedestrian.
+"""
+import struct
+
+from flowcontrol.crownetcontrol.traci import constants_vadere as tc
+
+PERSON_VARS = {
+    "pos": tc.VAR_POSITION,
+    "speed": tc.VAR_SPEED,
+    "angle": tc.VAR_ANGLE,
+    "target_list": tc.VAR_TARGET_LIST,
+}
+
+
+def _string(value):
+    value = value.encode("latin1")
+    return struct.pack("!i", len(value)) + value
+
+
+def _string_list(values):
+    return struct.pack("!Bi", tc.TYPE_STRINGLIST, len(values)) + b"".join(
+        _string(v) for v in values
+    )
+
+
+def _with_length(cmd):
+    length = len(cmd) + 1
+    if length <= 255:
+        return struct.pack("!B", length) + cmd
+    return struct.pack("!Bi", 0, length + 4) + cmd
+
+
+def person_response(ped_id, x, y):
+    """variable subscription response of one pedestrian with all PERSON_VARS"""
+    cmd = struct.pack("!B", tc.RESPONSE_SUBSCRIBE_V_PERSON_VARIABLE)
+    cmd += _string(ped_id)
+    cmd += struct.pack("!B", len(PERSON_VARS))
+    cmd += struct.pack("!BBBdd", tc.VAR_POSITION, 0, tc.POSITION_2D, x, y)
+    cmd += struct.pack("!BBBd", tc.VAR_SPEED, 0, tc.TYPE_DOUBLE, 1.34)
+    cmd += struct.pack("!BBBd", tc.VAR_ANGLE, 0, tc.TYPE_DOUBLE, 90.0)
+    cmd += struct.pack("!BB", tc.VAR_TARGET_LIST, 0) + _string_list(["2", "3"])
+    return _with_length(cmd)
+
+
+def id_list_response(ped_ids):
+    cmd = struct.pack("!B", tc.RESPONSE_SUBSCRIBE_V_PERSON_VARIABLE)
+    cmd += _string("")
+    cmd += struct.pack("!BBB", 1, tc.VAR_ID_LIST, 0) + _string_list(ped_ids)
+    return _with_length(cmd)
+
+
+def subscription_response(number_of_persons=10000):
+    """all subscription responses of one simulation step"""
+    ped_ids = [str(i) for i in range(1, number_of_persons + 1)]
+    responses = [id_list_response(ped_ids)]
+    for index, ped_id in enumerate(ped_ids):
+        responses.append(person_response(ped_id, index * 0.5, index % 100 * 0.25))
+    return struct.pack("!i", len(responses)) + b"".join(responses)
@@ -0,0 +1,148 @@
+from collections import namedtuple
+
+import numpy as np
+
+from flowcontrol.crownetcontrol.state.spatial_index import PedestrianGrid
+
+Snapshot = namedtuple("Snapshot", ["time", "ids", "positions", "speeds"])
+
+
+class StateHistory:
+    """
+    Fixed capacity ring of the last steps of a VadereDefaultStateListener.
+
+    Each slot holds a columnar snapshot (ids, positions, speeds) and the
+    running totals (speed sum, speed samples, arrivals, entries per tracked
+    area) before the step. A windowed aggregate is the difference between the
+    current totals and the totals of the first step in the window, thus no
+    snapshot is scanned again.
+
+        history = listener.enable_history(capacity=300, areas={"exit": Rectangle(0, 0, 2, 5)})
+        history.mean_speed(window=30.0)
+        history.flow("exit", window=10.0)
+    """
+
+    _TOTALS = ("speed", "samples", "arrivals")
+
+    def __init__(self, capacity=600):
+        if capacity <= 0:
+            raise ValueError(f"Capacity = {capacity} not allowed. Capacity must be > 0.")
+        self.capacity = capacity
+        self._times = np.full(capacity, np.nan)
+        self._snapshots = [None] * capacity
+        self._before = {name: np.zeros(capacity) for name in self._TOTALS}
+        self._totals = dict.fromkeys(self._TOTALS, 0.0)
+        self._areas = {}
+        self._inside_before = {}  # pedestrians inside the tracked areas before the last step
+        self._count = 0
+
+    def __len__(self):
+        return min(self._count, self.capacity)
+
+    @property
+    def time(self):
+        """time of the last step (None if empty)"""
+        if self._count == 0:
+            return None
+        return self._times[(self._count - 1) % self.capacity]
+
+    def track_area(self, name, area):
+        """count the pedestrians entering area (Rectangle, Circle, Polygon or Location) from the next step on"""
+        self._areas[name] = (area, set())
+        self._before[name] = np.zeros(self.capacity)
+        self._totals[name] = 0.0
+
+    def push(self, time, ids, positions, speeds=None, arrivals=0):
+        """add the state of one step, the oldest step is dropped if the ring is full"""
+        if self._count > 0 and time <= self.time:
+            raise ValueError(f"Time {time} is not after the last step {self.time}.")
+        ids = list(ids)
+        positions = np.array(positions, dtype=float).reshape(-1, 2)
+        if speeds is None:
+            speeds = np.full(len(ids), np.nan)
+        speeds = np.array(speeds, dtype=float)
+
+        slot = self._count % self.capacity
+        self._times[slot] = time
+        self._snapshots[slot] = Snapshot(time, ids, positions, speeds)
+        for name, before in self._before.items():
+            before[slot] = self._totals[name]
+
+        valid = np.isfinite(speeds)
+        self._totals["speed"] += float(speeds[valid].sum())
+        self._totals["samples"] += float(np.count_nonzero(valid))
+        self._totals["arrivals"] += arrivals
+        if self._areas:
+            self._inside_before = {name: inside for name, (_, inside) in self._areas.items()}
+            located = np.isfinite(positions).all(axis=1)
+            grid = PedestrianGrid(positions[located], [i for i, ok in zip(ids, located) if ok])
+            for name, (area, inside) in self._areas.items():
+                now = set(grid.ids_in(area))
+                self._totals[name] += len(now - inside)
+                self._areas[name] = (area, now)
+        self._count += 1
+
+    def replace_last(self, time, ids, positions, speeds=None, arrivals=0):
+        """replace the last step by a later state of the same time, see push"""
+        if self._count == 0 or time != self.time:
+            raise ValueError(f"Time {time} is not the time of the last step {self.time}.")
+        slot = (self._count - 1) % self.capacity
+        for name, before in self._before.items():
+            self._totals[name] = before[slot]
+        for name, inside in self._inside_before.items():
+            self._areas[name] = (self._areas[name][0], inside)
+        self._count -= 1
+        self.push(time, ids, positions, speeds, arrivals)
+
+    def snapshot(self, age=0):
+        """snapshot of the step age steps before the last one"""
+        if age < 0 or age >= len(self):
+            raise IndexError(f"No snapshot {age} steps back, history holds {len(self)} steps.")
+        return self._snapshots[(self._count - 1 - age) % self.capacity]
+
+    def snapshots(self):
+        """all stored snapshots, oldest first"""
+        return [self.snapshot(age) for age in range(len(self) - 1, -1, -1)]
+
+    def _first_slot(self, window):
+        """slot of the oldest stored step with time > last time - window"""
+        n = len(self)
+        oldest = self._count - n
+        start = self.time - window
+        lo, hi = 0, n
+        while lo < hi:
+            mid = (lo + hi) // 2
+            if self._times[(oldest + mid) % self.capacity] > start:
+                hi = mid
+            else:
+                lo = mid + 1
+        return (oldest + lo) % self.capacity if lo < n else None
+
+    def _sum(self, name, window):
+        """total of name over the steps in the window (None: all stored steps)"""
+        if self._count == 0:
+            return 0.0
+        if window is None:
+            slot = (self._count - len(self)) % self.capacity
+        else:
+            slot = self._first_slot(window)
+            if slot is None:
+                return 0.0
+        return self._totals[name] - self._before[name][slot]
+
+    def mean_speed(self, window=None):
+        """mean speed of all pedestrians over the steps within window seconds (NaN if no samples)"""
+        samples = self._sum("samples", window)
+        if samples == 0:
+            return np.nan
+        return self._sum("speed", window) / samples
+
+    def arrivals(self, window=None):
+        """number of pedestrians that arrived (left the simulation) within window seconds"""
+        return int(self._sum("arrivals", window))
+
+    def flow(self, name, window=None):
+        """number of pedestrians that entered the tracked area name within window seconds"""
+        if name not in self._areas:
+            raise KeyError(f"Area {name} is not tracked.")
+        return int(self._sum(name, window))
@@ -0,0 +1,145 @@
+from itertools import repeat
+
+import numpy as np
+
+
+def _field(name, value):
+    if isinstance(value, tuple) and value and all(isinstance(v, float) for v in value):
+        return name, np.float64, (len(value),)
+    if isinstance(value, np.ndarray) and value.dtype.kind == "f" and value.ndim == 1:
+        return name, np.float64, value.shape
+    if isinstance(value, (int, np.integer)) and not isinstance(value, bool):
+        return name, np.int64
+    if isinstance(value, (float, np.floating)):
+        return name, np.float64
+    return name, object
+
+
+class PedestrianState:
+    """
+    Values of the current pedestrians in a preallocated numpy structured array,
+    one row per pedestrian and one field per subscribed variable.
+
+    The array is updated in place: rows of pedestrians that left are reused
+    (the last row is moved into the gap) and the capacity only grows. The
+    field types are taken from the first values: positions become float
+    sub-arrays, numbers float64/int64 and everything else (e.g. target lists)
+    objects.
+
+        state.index["5"]          # row of pedestrian "5"
+        state["pos"][:, 0]        # x coordinates of all pedestrians
+    """
+
+    def __init__(self, var_names, capacity=1024):
+        self.var_names = list(var_names)
+        self.capacity = capacity
+        self.index = {}
+        self._ids = []
+        self._array = None
+        self._tuple_fields = set()
+        self._rows = np.empty(0, dtype=np.intp)
+
+    def __len__(self):
+        return len(self._ids)
+
+    def __contains__(self, ped_id):
+        return ped_id in self.index
+
+    def __getitem__(self, name):
+        return self.array[name]
+
+    @property
+    def ids(self):
+        """pedestrian id of each row"""
+        return self._ids
+
+    @property
+    def array(self):
+        """structured array of the current pedestrians (view, row i is ids[i])"""
+        if self._array is None:
+            return np.empty(0, dtype=[(n, object) for n in self.var_names])
+        return self._array[: len(self._ids)]
+
+    def row(self, ped_id):
+        return self.array[self.index[ped_id]]
+
+    def _allocate(self, values):
+        fields = [_field(name, values[name][0]) for name in self.var_names]
+        # sub-array fields (positions) are returned as tuples by to_dicts
+        self._tuple_fields = {field[0] for field in fields if len(field) == 3}
+        self._array = np.zeros(self.capacity, dtype=fields)
+
+    def _grow(self, size):
+        capacity = max(size, 2 * len(self._array))
+        array = np.zeros(capacity, dtype=self._array.dtype)
+        array[: len(self._array)] = self._array
+        self._array = array
+        self.capacity = capacity
+
+    def _remove(self, ped_id):
+        row = self.index.pop(ped_id)
+        last = len(self._ids) - 1
+        if row != last:
+            moved = self._ids[last]
+            self._array[row] = self._array[last]
+            self._ids[row] = moved
+            self.index[moved] = row
+        self._ids.pop()
+
+    def update(self, ids, values):
+        """
+        Set the state to the pedestrians ids of the current step.
+
+        :param ids: ids of all current pedestrians, pedestrians not in ids are removed
+        :param values: dict(var_name: sequence of values in the order of ids)
+        """
+        if len(ids) == 0:
+            # all pedestrians left, the array is kept
+            self.index.clear()
+            self._ids.clear()
+            self._rows = np.empty(0, dtype=np.intp)
+            return
+        if self._array is None:
+            self._allocate(values)
+
+        index = self.index
+        rows = np.fromiter(map(index.get, ids, repeat(-1)), dtype=np.intp, count=len(ids))
+        new = rows < 0
+        known = len(ids) - np.count_nonzero(new)
+        if known < len(self._ids):
+            for ped_id in index.keys() - ids:
+                self._remove(ped_id)
+            rows = None
+        if new.any():
+            for ped_id in (ped_id for ped_id, n in zip(ids, new) if n):
+                index[ped_id] = len(self._ids)
+                self._ids.append(ped_id)
+            if len(self._ids) > len(self._array):
+                self._grow(len(self._ids))
+            rows = None
+        if rows is None:
+            rows = np.fromiter(map(index.__getitem__, ids), dtype=np.intp, count=len(ids))
+
+        for name in self.var_names:
+            column = self._array[name]
+            if column.dtype == object:
+                # element wise, numpy would unpack sequences (e.g. target lists)
+                for row, value in zip(rows.tolist(), values[name]):
+                    column[row] = value
+            else:
+                column[rows] = values[name]
+        self._rows = rows
+
+    def to_dicts(self):
+        """pedestrians of the last update as list of dict("id": ..., var_name: value)"""
+        if self._array is None or len(self._rows) == 0:
+            return []
+        selected = self._array[self._rows]
+        columns = [[self._ids[row] for row in self._rows]]
+        for name in self.var_names:
+            column = selected[name].tolist()
+            if name in self._tuple_fields:
+                column = [tuple(v) for v in column]
+            columns.append(column)
+        keys = ["id"] + self.var_names
+        return [dict(zip(keys, values)) for values in zip(*columns)]
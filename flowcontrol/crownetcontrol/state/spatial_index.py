@@ -0,0 +1,142 @@
+import math
+
+import numpy as np
+
+
+def _points_in_polygon(x, y, polygon):
+    """even-odd rule for the points (x, y) and the polygon given as (n, 2) array"""
+    inside = np.zeros(len(x), dtype=bool)
+    x0, y0 = polygon[-1]
+    for x1, y1 in polygon:
+        crosses = (y1 > y) != (y0 > y)
+        with np.errstate(divide="ignore", invalid="ignore"):
+            x_cross = (x0 - x1) * (y - y1) / (y0 - y1) + x1
+        inside ^= crosses & (x < x_cross)
+        x0, y0 = x1, y1
+    return inside
+
+
+class PedestrianGrid:
+    """
+    Uniform grid over the pedestrian positions of one step.
+
+    The pedestrians are sorted by the linear index of their cell, a query only
+    looks at the pedestrians in the cells overlapping the queried region
+    (one contiguous slice per row of cells) and tests those exactly.
+
+    Queries return rows, i.e. indices into positions and ids:
+
+        grid = PedestrianGrid(positions, ids)
+        grid.ids_in(Circle(x=5, y=5, radius=2))
+        grid.nearest(5.0, 5.0, k=3)
+    """
+
+    def __init__(self, positions, ids=None, cell_size=None):
+        positions = np.asarray(positions, dtype=float).reshape(-1, 2)
+        self.positions = positions
+        self.ids = list(ids) if ids is not None else list(range(len(positions)))
+        if len(self.ids) != len(positions):
+            raise ValueError(f"Got {len(positions)} positions but {len(self.ids)} ids.")
+
+        if len(positions) > 0:
+            self.origin = positions.min(axis=0)
+            extent = positions.max(axis=0) - self.origin
+        else:
+            self.origin = np.zeros(2)
+            extent = np.zeros(2)
+        if cell_size is None:
+            # about two pedestrians per cell
+            cell_size = math.sqrt(max(extent[0] * extent[1], 1.0) * 2.0 / max(len(positions), 1))
+        if cell_size <= 0.0:
+            raise ValueError(f"Cell size = {cell_size} not allowed. Cell size must be > 0.")
+        self.cell_size = cell_size
+        self.shape = (np.floor(extent / cell_size).astype(int) + 1)
+
+        cells = self._cells(positions)
+        keys = cells[:, 1] * self.shape[0] + cells[:, 0]
+        self._order = np.argsort(keys, kind="stable")
+        self._keys = keys[self._order]
+
+    def __len__(self):
+        return len(self.ids)
+
+    def _cells(self, points):
+        cells = np.floor((points - self.origin) / self.cell_size).astype(int)
+        return np.clip(cells, 0, self.shape - 1)
+
+    def _candidates(self, xmin, ymin, xmax, ymax):
+        """rows of the pedestrians in the cells overlapping the box"""
+        if len(self.ids) == 0:
+            return np.empty(0, dtype=np.intp)
+        upper = self.origin + self.shape * self.cell_size
+        if xmax < self.origin[0] or ymax < self.origin[1] or xmin > upper[0] or ymin > upper[1]:
+            return np.empty(0, dtype=np.intp)
+        (i0, j0), (i1, j1) = self._cells(np.array([[xmin, ymin], [xmax, ymax]]))
+        first = np.arange(j0, j1 + 1) * self.shape[0]
+        starts = np.searchsorted(self._keys, first + i0, side="left")
+        ends = np.searchsorted(self._keys, first + i1, side="right")
+        if len(starts) == 1:
+            return self._order[starts[0] : ends[0]]
+        return np.concatenate([self._order[s:e] for s, e in zip(starts, ends)])
+
+    def in_box(self, xmin, ymin, xmax, ymax):
+        rows = self._candidates(xmin, ymin, xmax, ymax)
+        p = self.positions[rows]
+        inside = (p[:, 0] >= xmin) & (p[:, 0] <= xmax) & (p[:, 1] >= ymin) & (p[:, 1] <= ymax)
+        return np.sort(rows[inside])
+
+    def in_radius(self, x, y, radius):
+        rows = self._candidates(x - radius, y - radius, x + radius, y + radius)
+        d = self.positions[rows] - (x, y)
+        inside = np.einsum("ij,ij->i", d, d) <= radius * radius
+        return np.sort(rows[inside])
+
+    def in_polygon(self, points):
+        polygon = np.asarray(points, dtype=float)
+        xmin, ymin = polygon.min(axis=0)
+        xmax, ymax = polygon.max(axis=0)
+        rows = self._candidates(xmin, ymin, xmax, ymax)
+        p = self.positions[rows]
+        return np.sort(rows[_points_in_polygon(p[:, 0], p[:, 1], polygon)])
+
+    def nearest(self, x, y, k=1):
+        """rows of the k pedestrians closest to (x, y), closest first"""
+        k = min(k, len(self.ids))
+        if k <= 0:
+            return np.empty(0, dtype=np.intp)
+        # distance from (x, y) to the grid, the search starts there
+        upper = self.origin + self.shape * self.cell_size
+        offset = np.maximum(np.maximum(self.origin - (x, y), (x, y) - upper), 0.0)
+        radius = float(np.hypot(*offset)) + self.cell_size
+        while True:
+            rows = self._candidates(x - radius, y - radius, x + radius, y + radius)
+            d = self.positions[rows] - (x, y)
+            dist = np.einsum("ij,ij->i", d, d)
+            # only points within radius are certain to be among the closest
+            certain = dist <= radius * radius
+            if np.count_nonzero(certain) >= k or len(rows) == len(self.ids):
+                break
+            radius *= 2.0
+        closest = np.argsort(dist, kind="stable")[:k]
+        return rows[closest]
+
+    def query(self, area):
+        """
+        rows of the pedestrians inside area: a Rectangle, Circle or Polygon
+        (strategy.controlaction.area) or a Location with several areas
+        """
+        areas = getattr(area, "areas", None)
+        if areas is not None:
+            if len(areas) == 0:
+                return np.empty(0, dtype=np.intp)
+            return np.unique(np.concatenate([self.query(a) for a in areas]))
+        if hasattr(area, "radius"):
+            return self.in_radius(area.center.x, area.center.y, area.radius)
+        if hasattr(area, "points"):
+            return self.in_polygon([p.to_list() for p in area.points])
+        if hasattr(area, "width"):
+            return self.in_box(area.x, area.y, area.x + area.width, area.y + area.height)
+        raise ValueError(f"Unsupported area {area}.")
+
+    def ids_in(self, area):
+        return [self.ids[row] for row in self.query(area)]
@@ -1,5 +1,11 @@
 import abc
+from operator import itemgetter
 
+import numpy as np
+
+from flowcontrol.crownetcontrol.state.history import StateHistory
+from flowcontrol.crownetcontrol.state.pedestrian_state import PedestrianState
+from flowcontrol.crownetcontrol.state.spatial_index import PedestrianGrid
 from flowcontrol.crownetcontrol.traci import constants_vadere as tc
 from flowcontrol.crownetcontrol.traci.domains.VaderePersonAPI import VaderePersonAPI
 from flowcontrol.crownetcontrol.traci.domains.domain import SubscriptionResults
@@ -18,6 +24,12 @@ class StateListener(object):
     __metaclass__ = abc.ABCMeta
     """
     ref_id: objectID
+
+    Each generation of the subscription results is processed once: repeated
+    notifications with unchanged results return immediately and only the
+    handlers of changed command ids are called. Handlers therefore overwrite
+    the data they own; rest_data is only called if the set of handled results
+    changes.
     """
     GLOBAL_OBJECT_ID = ""
     ALL_OBJECTS = "*"  # all objects ids exept "-1"
@@ -26,16 +38,18 @@ class StateListener(object):
         self.name = name
         self.handle_dict = handle_dict
         self._data = {}
+        self._generations = {}
         self._init_sub = init_sub
 
         # prepare cmd map
         self.f_map: dict = {}
-        for key in [i for i in dir(self) if not i.startswith("__")]:
-            __o = self.__getattribute__(key)
+        for key in [i for i in dir(type(self)) if not i.startswith("__")]:
+            # look up on the class, properties are not evaluated
+            __o = getattr(type(self), key)
             if callable(__o):
                 try:
                     __cmd = __o.__getattribute__("cmd")
-                    self.f_map[__cmd] = __o
+                    self.f_map[__cmd] = getattr(self, key)
                 except AttributeError:
                     continue
 
@@ -46,11 +60,23 @@ class StateListener(object):
         return cmd in self.handle_dict.keys()
 
     def handle_subscription_result(self, results: dict):
-        self.rest_data()
-        for cmd, result in results.items():
-            if cmd in self.handle_dict.keys():
-                # call decorated method
-                self.f_map[cmd](result)
+        generations = {
+            cmd: result.generation
+            for cmd, result in results.items()
+            if cmd in self.handle_dict.keys()
+        }
+        if generations.keys() != self._generations.keys():
+            self.rest_data()
+            changed = list(generations.keys())
+        else:
+            changed = [
+                cmd for cmd, generation in generations.items()
+                if self._generations[cmd] != generation
+            ]
+        self._generations = generations
+        for cmd in changed:
+            # call decorated method
+            self.f_map[cmd](results[cmd])
 
     def subscribe(self, dom_handler):
         if not self._init_sub:
@@ -92,9 +118,17 @@ class VadereDefaultStateListener(StateListener):
 
     def __init__(self, name, handle_dict, **kwargs):
         super().__init__(name, handle_dict, **kwargs)
+        person_vars = handle_dict.get(tc.RESPONSE_SUBSCRIBE_V_PERSON_VARIABLE, {})
+        self._person_vars = person_vars.get(self.ALL_OBJECTS, {})
+        self._state = PedestrianState(self._person_vars.keys())
+        self._index = None
+        self._history = None
         self.rest_data()
 
     def rest_data(self):
+        # the array of the pedestrian state is kept, _handle_person updates it in place
+        self._state.update([], {n: [] for n in self._person_vars})
+        self._index = None
         self._data = {
             "all_ped_ids": [],
             "removed_ped_ids": [],
@@ -103,6 +137,53 @@ class VadereDefaultStateListener(StateListener):
             "pedestrians": [],
         }
 
+    @property
+    def data(self):
+        self.pedestrians  # build the compatibility view
+        return self._data
+
+    def handle_subscription_result(self, results: dict):
+        generations = self._generations
+        super().handle_subscription_result(results)
+        history = self._history
+        if history is None or self.time < 0:
+            return
+        if self.time != history.time:
+            self._push_history()
+        elif self._generations != generations:
+            # same step notified again, e.g. with the pedestrians subscribed after departing
+            self._push_history(replace=True)
+
+    def enable_history(self, capacity=600, areas=None) -> StateHistory:
+        """
+        Keep the last capacity steps in a StateHistory. The pedestrians entering
+        the given areas (dict(name: area)) are counted for StateHistory.flow.
+        """
+        self._history = StateHistory(capacity)
+        for name, area in (areas or {}).items():
+            self._history.track_area(name, area)
+        return self._history
+
+    @property
+    def history(self) -> StateHistory:
+        """history of the last steps (None if not enabled)"""
+        return self._history
+
+    def _push_history(self, replace=False):
+        state = self._state
+        columns = {v: n for n, v in self._person_vars.items()}
+        n = len(state)
+        positions = state[columns[tc.VAR_POSITION]] if tc.VAR_POSITION in columns and n else None
+        speeds = state[columns[tc.VAR_SPEED]] if tc.VAR_SPEED in columns and n else None
+        push = self._history.replace_last if replace else self._history.push
+        push(
+            self.time,
+            state.ids,
+            positions if positions is not None else np.full((n, 2), np.nan),
+            speeds,
+            arrivals=len(self.removed_pedestrian_ids),
+        )
+
     @property
     def new_pedestrian_ids(self):
         return self._data.get("new_ped_ids", [])
@@ -117,7 +198,41 @@ class VadereDefaultStateListener(StateListener):
 
     @property
     def pedestrians(self):
-        return self._data.get("pedestrians", [])
+        """
+        list of dict("id": ..., var_name: value) of the current step, built from
+        pedestrian_state on first access
+        """
+        if self._data.get("pedestrians") is None:
+            self._data["pedestrians"] = self._state.to_dicts()
+        return self._data["pedestrians"]
+
+    @property
+    def pedestrian_state(self) -> PedestrianState:
+        """values of the current pedestrians as structured array with an id->row index"""
+        return self._state
+
+    @property
+    def pedestrian_index(self) -> PedestrianGrid:
+        """
+        spatial index over the positions of the current pedestrians, built on
+        first access in each step (requires a subscription of VAR_POSITION)
+        """
+        if self._index is None:
+            self._index = PedestrianGrid(self.pedestrian_positions, self._state.ids)
+        return self._index
+
+    @property
+    def pedestrian_positions(self):
+        """positions of the current pedestrians as array (n, 2) in the order of pedestrian_state.ids"""
+        names = [n for n, v in self._person_vars.items() if v == tc.VAR_POSITION]
+        if len(names) == 0:
+            raise ValueError("The pedestrian positions (VAR_POSITION) are not subscribed.")
+        state = self._state
+        return state[names[0]] if len(state) > 0 else np.empty((0, 2))
+
+    def pedestrians_in(self, area):
+        """ids of the pedestrians in area (Rectangle, Circle, Polygon or Location)"""
+        return self.pedestrian_index.ids_in(area)
 
     @property
     def time(self):
@@ -135,11 +250,10 @@ class VadereDefaultStateListener(StateListener):
                 self.ALL_OBJECTS
             ].items()
         ]
-        for obj_id in self.new_pedestrian_ids:
-            api.subscribe(objectID=obj_id, varIDs=vars, begin=begin, end=end)
-
-        for obj_id in self.removed_pedestrian_ids:
-            api.unsubscribe(obj_id)
+        # one message for all new and removed pedestrians
+        with api.batch():
+            api.subscribeBulk(self.new_pedestrian_ids, varIDs=vars, begin=begin, end=end)
+            api.unsubscribeBulk(self.removed_pedestrian_ids)
 
     @process_cmd({"cmd": tc.RESPONSE_SUBSCRIBE_V_SIM_VARIABLE})
     def _handle_sim(self, result: SubscriptionResults):
@@ -151,23 +265,44 @@ class VadereDefaultStateListener(StateListener):
 
     @process_cmd({"cmd": tc.RESPONSE_SUBSCRIBE_V_PERSON_VARIABLE})
     def _handle_person(self, result: SubscriptionResults):
-        _data = {}
+        if result.columnar:
+            self._handle_person_columns(result.columns())
+            return
+
+        data = result.data
         # person sub global
-        if self.GLOBAL_OBJECT_ID in result.data:
-            _res = result.data[self.GLOBAL_OBJECT_ID]
+        if self.GLOBAL_OBJECT_ID in data:
+            _res = data[self.GLOBAL_OBJECT_ID]
             self._data["all_ped_ids"] = list(_res[tc.VAR_ID_LIST])
         else:
             self._data["all_ped_ids"] = []
 
         # person sub for ALL_OBJECTS
-        person_vars = self.handle_dict[tc.RESPONSE_SUBSCRIBE_V_PERSON_VARIABLE].get(
-            self.ALL_OBJECTS, {}
-        )
-        if person_vars != {}:
-            for obj_id, vars in result.data.items():
-                if obj_id == self.GLOBAL_OBJECT_ID:
-                    continue
-                _ped = {"id": obj_id}
-                for var_name, var_id in person_vars.items():
-                    _ped.setdefault(var_name, vars[var_id])
-                self._data["pedestrians"].append(_ped)
+        if self._person_vars != {}:
+            ids = [i for i in data.keys() if i != self.GLOBAL_OBJECT_ID]
+            persons = [data[i] for i in ids]
+            values = {
+                var_name: list(map(itemgetter(var_id), persons))
+                for var_name, var_id in self._person_vars.items()
+            }
+            self._state.update(ids, values)
+            self._data["pedestrians"] = None
+            self._index = None
+
+    def _handle_person_columns(self, columns):
+        # the global id list subscription is no row of the columns
+        self._data["all_ped_ids"] = list(columns.global_values.get(tc.VAR_ID_LIST, []))
+
+        if self._person_vars != {}:
+            ids = columns.ids
+            values = {}
+            for var_name, var_id in self._person_vars.items():
+                if var_id in columns:
+                    values[var_name] = columns[var_id]
+                elif len(ids) == 0:
+                    values[var_name] = []
+                else:
+                    raise KeyError(f"Variable {var_id} ({var_name}) is not in the person subscription results.")
+            self._state.update(ids, values)
+            self._data["pedestrians"] = None
+            self._index = None
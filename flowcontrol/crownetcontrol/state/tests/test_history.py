@@ -0,0 +1,116 @@
+from unittest import TestCase
+
+import numpy as np
+
+from flowcontrol.crownetcontrol.state.history import StateHistory
+from flowcontrol.crownetcontrol.state.state_listener import VadereDefaultStateListener
+from flowcontrol.crownetcontrol.traci import constants_vadere as tc
+from flowcontrol.crownetcontrol.traci.domains.domain import SubscriptionResults
+from flowcontrol.strategy.controlaction.area import Rectangle
+
+
+class TestStateHistory(TestCase):
+
+    def test__ring_keeps_capacity_steps(self):
+        history = StateHistory(capacity=3)
+        for t in range(5):
+            history.push(float(t), ["1"], [(0.0, 0.0)], [float(t)])
+        assert len(history) == 3
+        assert [s.time for s in history.snapshots()] == [2.0, 3.0, 4.0]
+        assert history.snapshot().speeds[0] == 4.0
+        with self.assertRaises(IndexError):
+            history.snapshot(3)
+
+    def test__mean_speed_window(self):
+        history = StateHistory(capacity=10)
+        for t in range(10):
+            history.push(t * 0.5, ["1", "2"], [(0.0, 0.0), (1.0, 1.0)], [t, t + 1.0])
+        # steps at 3.5, 4.0 and 4.5
+        assert history.mean_speed(window=1.5) == np.mean([7, 8, 8, 9, 9, 10])
+        assert history.mean_speed() == np.mean(np.arange(10) + 0.5)
+
+    def test__mean_speed_after_wrap_around(self):
+        history = StateHistory(capacity=4)
+        for t in range(10):
+            history.push(float(t), ["1"], [(0.0, 0.0)], [float(t)])
+        assert history.mean_speed() == np.mean([6, 7, 8, 9])
+        assert history.mean_speed(window=100.0) == np.mean([6, 7, 8, 9])
+        assert history.mean_speed(window=1.0) == 9.0
+
+    def test__flow_and_arrivals(self):
+        history = StateHistory(capacity=10)
+        history.track_area("door", Rectangle(0, 0, 1, 1))
+        history.push(1.0, ["1", "2"], [(0.5, 0.5), (5.0, 5.0)])
+        history.push(2.0, ["1", "2"], [(2.0, 0.5), (0.5, 0.5)], arrivals=1)
+        history.push(3.0, ["1", "3"], [(0.5, 0.5), (0.2, 0.2)], arrivals=2)
+        assert history.flow("door") == 4
+        assert history.flow("door", window=1.5) == 3
+        assert history.arrivals(window=1.5) == 3
+        assert np.isnan(history.mean_speed())
+        with self.assertRaises(KeyError):
+            history.flow("exit")
+
+    def test__replace_last(self):
+        history = StateHistory(capacity=2)
+        history.track_area("door", Rectangle(0, 0, 1, 1))
+        history.push(1.0, ["1"], [(0.5, 0.5)], [1.0])
+        history.push(2.0, ["1"], [(0.5, 0.5)], [1.0], arrivals=1)
+        history.replace_last(2.0, ["1", "2"], [(0.5, 0.5), (0.2, 0.2)], [1.0, 3.0], arrivals=1)
+        assert len(history) == 2
+        assert history.snapshot().ids == ["1", "2"]
+        assert history.mean_speed() == 5.0 / 3
+        assert history.flow("door") == 2
+        assert history.arrivals() == 1
+        with self.assertRaises(ValueError):
+            history.replace_last(3.0, [], np.empty((0, 2)))
+
+    def test__time_must_increase(self):
+        history = StateHistory()
+        history.push(1.0, [], np.empty((0, 2)))
+        with self.assertRaises(ValueError):
+            history.push(1.0, [], np.empty((0, 2)))
+
+
+class TestListenerHistory(TestCase):
+
+    def step(self, listener, time, persons, arrived=(), departed=()):
+        sim = SubscriptionResults({}, 0, 0, 0)
+        sim.data[""] = {
+            tc.VAR_TIME: time,
+            tc.VAR_DEPARTED_PEDESTRIAN_IDS: departed,
+            tc.VAR_ARRIVED_PEDESTRIAN_PEDESTRIAN_IDS: arrived,
+        }
+        person = SubscriptionResults({}, 0, 0, 0)
+        for ped_id, (pos, speed) in persons.items():
+            person.data[ped_id] = {tc.VAR_POSITION: pos, tc.VAR_SPEED: speed}
+        listener.handle_subscription_result(
+            {tc.RESPONSE_SUBSCRIBE_V_SIM_VARIABLE: sim, tc.RESPONSE_SUBSCRIBE_V_PERSON_VARIABLE: person}
+        )
+
+    def test__one_snapshot_per_step(self):
+        listener = VadereDefaultStateListener.with_vars("default", {"pos": tc.VAR_POSITION, "speed": tc.VAR_SPEED})
+        assert listener.history is None
+        history = listener.enable_history(capacity=5, areas={"door": Rectangle(0, 0, 1, 1)})
+        self.step(listener, 0.4, {"1": ((0.5, 0.5), 1.0), "2": ((3.0, 3.0), 2.0)})
+        self.step(listener, 0.8, {"2": ((0.5, 0.5), 1.0)}, arrived=("1",))
+        listener.handle_subscription_result({})
+
+        assert len(history) == 2
+        assert history.snapshot().ids == ["2"]
+        assert history.mean_speed() == 4.0 / 3
+        assert history.flow("door") == 2
+        assert history.arrivals() == 1
+
+    def test__departure_completes_step(self):
+        listener = VadereDefaultStateListener.with_vars("default", {"pos": tc.VAR_POSITION, "speed": tc.VAR_SPEED})
+        history = listener.enable_history(capacity=5, areas={"door": Rectangle(0, 0, 1, 1)})
+        self.step(listener, 0.4, {"1": ((3.0, 3.0), 1.0)})
+        # "2" departs at 0.8, its values arrive after it is subscribed
+        self.step(listener, 0.8, {"1": ((3.0, 3.0), 1.0)}, departed=("2",))
+        assert history.snapshot().ids == ["1"]
+        self.step(listener, 0.8, {"1": ((3.0, 3.0), 1.0), "2": ((0.5, 0.5), 2.0)}, departed=("2",))
+
+        assert len(history) == 2
+        assert history.snapshot().ids == ["1", "2"]
+        assert history.mean_speed() == 4.0 / 3
+        assert history.flow("door") == 1
@@ -0,0 +1,54 @@
+from unittest import TestCase
+
+import numpy as np
+
+from flowcontrol.crownetcontrol.state.spatial_index import PedestrianGrid
+from flowcontrol.strategy.controlaction.area import Circle, Point, Polygon, Rectangle
+from flowcontrol.strategy.controlaction.stimulusinfo import Location
+
+
+class TestPedestrianGrid(TestCase):
+
+    def setUp(self):
+        rng = np.random.default_rng(42)
+        self.positions = rng.uniform(0.0, 50.0, size=(2000, 2))
+        self.grid = PedestrianGrid(self.positions, [str(i) for i in range(2000)])
+
+    def test__box(self):
+        x, y = self.positions[:, 0], self.positions[:, 1]
+        expected = np.flatnonzero((x >= 10) & (x <= 20.5) & (y >= 3) & (y <= 7))
+        np.testing.assert_array_equal(self.grid.in_box(10, 3, 20.5, 7), expected)
+        np.testing.assert_array_equal(self.grid.query(Rectangle(10, 3, 10.5, 4)), expected)
+
+    def test__radius(self):
+        d = np.hypot(*(self.positions - (25.0, 30.0)).T)
+        expected = np.flatnonzero(d <= 4.0)
+        np.testing.assert_array_equal(self.grid.query(Circle(25.0, 30.0, 4.0)), expected)
+
+    def test__polygon(self):
+        triangle = Polygon([Point(0, 0), Point(20, 0), Point(0, 20)])
+        x, y = self.positions[:, 0], self.positions[:, 1]
+        expected = np.flatnonzero(x + y < 20)
+        np.testing.assert_array_equal(self.grid.query(triangle), expected)
+
+    def test__location(self):
+        location = Location([Circle(5, 5, 2), Circle(6, 5, 2), Rectangle(40, 40, 1, 1)])
+        expected = np.union1d(
+            np.union1d(self.grid.in_radius(5, 5, 2), self.grid.in_radius(6, 5, 2)),
+            self.grid.in_box(40, 40, 41, 41),
+        )
+        np.testing.assert_array_equal(self.grid.query(location), expected)
+        assert self.grid.ids_in(Location()) == []
+
+    def test__nearest(self):
+        for x, y in [(25.0, 25.0), (0.0, 0.0), (-30.0, 80.0)]:
+            d = np.hypot(*(self.positions - (x, y)).T)
+            np.testing.assert_array_equal(self.grid.nearest(x, y, k=5), np.argsort(d)[:5])
+
+    def test__empty(self):
+        grid = PedestrianGrid(np.empty((0, 2)))
+        assert len(grid.in_radius(0, 0, 10)) == 0
+        assert len(grid.nearest(0, 0, 3)) == 0
+
+    def test__outside(self):
+        assert len(self.grid.in_box(100, 100, 110, 110)) == 0
@@ -0,0 +1,195 @@
+import struct
+from unittest import TestCase
+
+import numpy as np
+
+from flowcontrol.crownetcontrol.state.pedestrian_state import PedestrianState
+from flowcontrol.crownetcontrol.state.state_listener import VadereDefaultStateListener
+from flowcontrol.crownetcontrol.traci import constants_vadere as tc
+from flowcontrol.crownetcontrol.traci.domains.domain import SubscriptionResults
+from flowcontrol.crownetcontrol.traci.storage import Storage
+from flowcontrol.strategy.controlaction.area import Circle, Rectangle
+from flowcontrol.strategy.controlaction.stimulusinfo import Location, SubpopulationFilter
+
+PERSON_VARS = {"pos": tc.VAR_POSITION, "speed": tc.VAR_SPEED, "targets": tc.VAR_TARGET_LIST}
+
+
+def person_results(persons, columnar=False):
+    """SubscriptionResults with VAR_ID_LIST and the PERSON_VARS of persons (id -> (pos, speed, targets))"""
+    result = SubscriptionResults({}, 0, 0, 0)
+    result.set_columnar(columnar)
+    add = result._add_column_value if columnar else _add_value(result)
+    add("", tc.VAR_ID_LIST, tuple(persons.keys()))
+    for ped_id, (pos, speed, targets) in persons.items():
+        add(ped_id, tc.VAR_POSITION, pos)
+        add(ped_id, tc.VAR_SPEED, speed)
+        add(ped_id, tc.VAR_TARGET_LIST, targets)
+    return result
+
+
+def _add_value(result):
+    def add(ref_id, var_id, value):
+        result.data.setdefault(ref_id, {})[var_id] = value
+
+    return add
+
+
+class TestPedestrianState(TestCase):
+
+    def test__update_in_place(self):
+        state = PedestrianState(["pos", "speed"], capacity=2)
+        state.update(["1", "2"], {"pos": [(0.0, 1.0), (2.0, 3.0)], "speed": [1.0, 1.5]})
+        array = state._array
+        state.update(["2"], {"pos": [(4.0, 5.0)], "speed": [0.5]})
+        assert state._array is array
+        assert state.ids == ["2"] and state.index == {"2": 0}
+        np.testing.assert_array_equal(state["pos"], [[4.0, 5.0]])
+
+    def test__grow(self):
+        state = PedestrianState(["speed"], capacity=2)
+        state.update(["0", "1"], {"speed": [0.0, 1.0]})
+        ids = [str(i) for i in range(5)]
+        state.update(ids, {"speed": [float(i) for i in range(5)]})
+        assert state.capacity >= 5
+        np.testing.assert_array_equal(state["speed"], [0.0, 1.0, 2.0, 3.0, 4.0])
+
+    def test__leave_and_arrive(self):
+        state = PedestrianState(["speed"])
+        state.update(["1", "2", "3"], {"speed": [1.0, 2.0, 3.0]})
+        state.update(["3", "4"], {"speed": [3.5, 4.0]})
+        assert sorted(state.ids) == ["3", "4"]
+        assert state.row("3")["speed"] == 3.5
+        assert state.row("4")["speed"] == 4.0
+        assert state.to_dicts() == [{"id": "3", "speed": 3.5}, {"id": "4", "speed": 4.0}]
+
+    def test__object_and_position_columns(self):
+        state = PedestrianState(["pos", "targets"])
+        state.update(["1", "2"], {"pos": [(0.0, 1.0), (2.0, 3.0)], "targets": [("2",), ("2", "3")]})
+        assert state.row("2")["targets"] == ("2", "3")
+        state.update([], {"pos": [], "targets": []})
+        assert len(state) == 0 and state.to_dicts() == []
+        state.update(["3"], {"pos": [(1.0, 1.0)], "targets": [()]})
+        assert state.to_dicts() == [{"id": "3", "pos": (1.0, 1.0), "targets": ()}]
+
+
+class TestVadereDefaultStateListener(TestCase):
+
+    def setUp(self):
+        self.listener = VadereDefaultStateListener.with_vars("default", PERSON_VARS)
+        self.persons = {"1": ((0.0, 1.0), 1.2, ("2",)), "2": ((2.0, 3.0), 0.8, ("2", "3"))}
+
+    def test__pedestrians_view(self):
+        self.listener.handle_subscription_result(
+            {tc.RESPONSE_SUBSCRIBE_V_PERSON_VARIABLE: person_results(self.persons)}
+        )
+        assert self.listener.pedestrian_id_list == ["1", "2"]
+        assert self.listener.pedestrians == [
+            {"id": "1", "pos": (0.0, 1.0), "speed": 1.2, "targets": ("2",)},
+            {"id": "2", "pos": (2.0, 3.0), "speed": 0.8, "targets": ("2", "3")},
+        ]
+        assert self.listener.data["pedestrians"] is self.listener.pedestrians
+
+    def test__columnar_results(self):
+        for columnar in (False, True):
+            self.listener.handle_subscription_result(
+                {tc.RESPONSE_SUBSCRIBE_V_PERSON_VARIABLE: person_results(self.persons, columnar)}
+            )
+            state = self.listener.pedestrian_state
+            np.testing.assert_array_equal(state["speed"], [1.2, 0.8])
+            assert state.row("2")["targets"] == ("2", "3")
+            assert state.ids == ["1", "2"]
+            assert self.listener.data["all_ped_ids"] == ["1", "2"]
+
+    def test__no_person_results(self):
+        self.listener.handle_subscription_result(
+            {tc.RESPONSE_SUBSCRIBE_V_PERSON_VARIABLE: person_results(self.persons)}
+        )
+        self.listener.handle_subscription_result({})
+        assert self.listener.pedestrians == []
+        assert len(self.listener.pedestrian_state) == 0
+        assert self.listener.pedestrian_state.ids == []
+        assert self.listener.pedestrians_in(Circle(0.0, 1.0, 5.0)) == []
+
+    def test__variable_not_in_columns(self):
+        result = SubscriptionResults({}, 0, 0, 0)
+        result.set_columnar(True)
+        result._add_column_value("", tc.VAR_ID_LIST, ("1",))
+        result._add_column_value("1", tc.VAR_POSITION, (0.0, 1.0))
+        result._add_column_value("1", tc.VAR_SPEED, 1.2)
+        with self.assertRaises(KeyError):
+            self.listener.handle_subscription_result({tc.RESPONSE_SUBSCRIBE_V_PERSON_VARIABLE: result})
+
+
+class TestGenerations(TestCase):
+
+    def setUp(self):
+        self.listener = VadereDefaultStateListener.with_vars("default", PERSON_VARS)
+        self.calls = []
+        for cmd, handler in list(self.listener.f_map.items()):
+            self.listener.f_map[cmd] = self._record(cmd, handler)
+
+    def _record(self, cmd, handler):
+        def record(result):
+            self.calls.append(cmd)
+            return handler(result)
+
+        return record
+
+    def test__repeated_notification_is_free(self):
+        persons = person_results({"1": ((0.0, 1.0), 1.2, ("2",))})
+        results = {tc.RESPONSE_SUBSCRIBE_V_PERSON_VARIABLE: persons}
+        self.listener.handle_subscription_result(results)
+        pedestrians = self.listener.pedestrians
+        self.listener.handle_subscription_result(results)
+        assert self.calls == [tc.RESPONSE_SUBSCRIBE_V_PERSON_VARIABLE]
+        assert self.listener.pedestrians is pedestrians
+
+    def test__only_changed_results(self):
+        sim = SubscriptionResults({}, 0, 0, 0)
+        sim.data[""] = {
+            tc.VAR_TIME: 0.4,
+            tc.VAR_DEPARTED_PEDESTRIAN_IDS: ("1",),
+            tc.VAR_ARRIVED_PEDESTRIAN_PEDESTRIAN_IDS: (),
+        }
+        persons = person_results({})
+        results = {
+            tc.RESPONSE_SUBSCRIBE_V_SIM_VARIABLE: sim,
+            tc.RESPONSE_SUBSCRIBE_V_PERSON_VARIABLE: persons,
+        }
+        self.listener.handle_subscription_result(results)
+        assert len(self.calls) == 2
+
+        # subscribe the new pedestrian, its first values are added to the results
+        persons.add("1", tc.VAR_POSITION, Storage(struct.pack("!Bdd", tc.POSITION_2D, 0.0, 1.0)))
+        persons.add("1", tc.VAR_SPEED, Storage(struct.pack("!Bd", tc.TYPE_DOUBLE, 1.0)))
+        persons.add("1", tc.VAR_TARGET_LIST, Storage(struct.pack("!Bi", tc.TYPE_STRINGLIST, 0)))
+        self.listener.handle_subscription_result(results)
+
+        assert self.calls[2:] == [tc.RESPONSE_SUBSCRIBE_V_PERSON_VARIABLE]
+        assert self.listener.time == 0.4
+        assert self.listener.new_pedestrian_ids == ["1"]
+        assert [p["id"] for p in self.listener.pedestrians] == ["1"]
+
+
+class TestPedestrianIndex(TestCase):
+
+    def test__pedestrians_in_area(self):
+        listener = VadereDefaultStateListener.with_vars("default", PERSON_VARS)
+        persons = {
+            "1": ((0.0, 1.0), 1.2, ()),
+            "2": ((5.0, 5.0), 1.2, ()),
+            "3": ((5.5, 4.0), 1.2, ()),
+        }
+        listener.handle_subscription_result({tc.RESPONSE_SUBSCRIBE_V_PERSON_VARIABLE: person_results(persons)})
+        assert listener.pedestrians_in(Circle(5.0, 5.0, 1.5)) == ["2", "3"]
+        np.testing.assert_array_equal(listener.pedestrian_positions[1], [5.0, 5.0])
+
+        filter = SubpopulationFilter.from_location(Location(Rectangle(-1, 0, 2, 2)), listener.pedestrian_index)
+        assert filter.get_affectedPedestrianIds() == [1]
+
+    def test__position_not_subscribed(self):
+        listener = VadereDefaultStateListener.with_vars("default", {"speed": tc.VAR_SPEED})
+        with self.assertRaises(ValueError):
+            listener.pedestrian_index
+        with self.assertRaises(ValueError):
+            listener.pedestrian_positions
@@ -0,0 +1,275 @@
+import asyncio
+import contextlib
+import struct
+
+from flowcontrol.crownetcontrol.traci import constants_vadere as tc
+from flowcontrol.crownetcontrol.traci.connection import BaseTraCIConnection, CommandBatch
+from flowcontrol.crownetcontrol.traci.domains.domain import _parse
+from flowcontrol.crownetcontrol.traci.domains.VaderePersonDomain import VaderePersonDomain
+from flowcontrol.crownetcontrol.traci.domains.VadereMiscAPI import VadereMiscAPI
+from flowcontrol.crownetcontrol.traci.domains.VadereSimulationDomain import (
+    VadereSimulationDomain,
+)
+from flowcontrol.crownetcontrol.traci.domains.VaderePolygonAPI import (
+    VaderePolygonAPI,
+)
+from flowcontrol.crownetcontrol.traci.exceptions import FatalTraCIError
+from flowcontrol.crownetcontrol.traci.storage import Storage
+
+
+def vadere_domains():
+    return [VaderePersonDomain(), VadereSimulationDomain(), VadereMiscAPI(), VaderePolygonAPI()]
+
+
+class AsyncDomain:
+    """
+    Awaitable access to the commands of a domain on an AsyncTraCIConnection.
+
+    The generated domain methods (e.g. set_target_list) block on the response,
+    thus the async variant exposes the generic get/set/subscribe commands:
+
+        await connection.v_person.set(tc.VAR_TARGET_LIST, "1", "l", ["2"])
+        await connection.v_sim.get(tc.VAR_TIME)
+    """
+
+    def __init__(self, domain, connection):
+        self.domain = domain
+        self.name = domain.name
+        self._connection = connection
+
+    async def get(self, varID, objectID="", format="", *values):
+        if self._connection._owns_batch():
+            raise FatalTraCIError("Get commands cannot be sent inside a batch.")
+        d = self.domain
+        r = await self._connection.send_cmd(d._cmdGetID, varID, objectID, format, *values)
+        d._checkResponse(r, d._cmdGetID, varID, objectID)
+        return _parse(d._retValFunc, varID, r)
+
+    async def set(self, varID, objectID="", format="", *values):
+        d = self.domain
+        r = await self._connection.send_cmd(d._cmdSetID, varID, objectID, format, *values)
+        if r is None or r.empty:
+            return None
+        d._checkResponse(r, d._cmdSetID, varID, objectID)
+        return _parse(d._retValFunc, varID, r)
+
+    async def set_bulk(self, varID, format, objIDs, values=None):
+        """see Domain._setCmdBulk"""
+        if values is None:
+            objIDs, values = list(objIDs.keys()), list(objIDs.values())
+        objIDs = [str(objID) for objID in objIDs]
+        if len(objIDs) != len(values):
+            raise ValueError(f"Got {len(objIDs)} object ids but {len(values)} values.")
+        nested = self._connection._owns_batch()
+        async with self._connection.batch(raise_on_error=False) as batch:
+            for objID, value in zip(objIDs, values):
+                await self.set(varID, objID, format, value)
+        if nested:
+            return None
+        return dict(zip(objIDs, batch.statuses))
+
+    async def subscribe(
+        self,
+        objectID,
+        varIDs=None,
+        begin=tc.INVALID_DOUBLE_VALUE,
+        end=tc.INVALID_DOUBLE_VALUE,
+        parameters=None,
+    ):
+        if varIDs is None:
+            varIDs = self.domain._subscriptionDefault
+        await self._connection._subscribe(
+            self.domain._subscribeID, begin, end, objectID, varIDs, parameters
+        )
+
+    async def unsubscribe(self, objectID):
+        await self.subscribe(objectID, [])
+
+    async def subscribe_bulk(
+        self,
+        objectIDs,
+        varIDs=None,
+        begin=tc.INVALID_DOUBLE_VALUE,
+        end=tc.INVALID_DOUBLE_VALUE,
+        parameters=None,
+    ):
+        """see Domain.subscribeBulk"""
+        async with self._connection.batch():
+            for objectID in objectIDs:
+                await self.subscribe(objectID, varIDs, begin, end, parameters)
+
+    async def unsubscribe_bulk(self, objectIDs):
+        await self.subscribe_bulk(objectIDs, [])
+
+    def getSubscriptionResults(self, objectID):
+        return self._connection._get_subscription_results(
+            self.domain._subscribeResponseID
+        ).get(objectID)
+
+    def getAllSubscriptionResults(self):
+        return self._connection._get_subscription_results(
+            self.domain._subscribeResponseID
+        ).get(None)
+
+    def setColumnarSubscriptionResults(self, columnar=True):
+        self._connection._get_subscription_results(
+            self.domain._subscribeResponseID
+        ).set_columnar(columnar)
+
+    def getAllSubscriptionColumns(self):
+        return self._connection._get_subscription_results(
+            self.domain._subscribeResponseID
+        ).columns()
+
+
+class AsyncTraCIConnection(BaseTraCIConnection):
+    """
+    asyncio variant of BaseTraCIConnection.
+
+    send_cmd is a coroutine. While a command waits for its response the event
+    loop is free, so a controller can prepare the next control action while the
+    simulator computes a step and one process can drive several simulations.
+    Commands of concurrent tasks on the same connection are serialized.
+    """
+
+    def __init__(self, reader, writer, default_domains=None):
+        if default_domains is None:
+            default_domains = vadere_domains()
+        super().__init__(None, default_domains)
+        self._stream_reader = reader
+        self._stream_writer = writer
+        self._lock = asyncio.Lock()
+        self._batch_task = None
+        self._cmd_domain_map = {}
+        for domain in default_domains:
+            dom = AsyncDomain(getattr(self, domain.name), self)
+            setattr(self, domain.name, dom)
+            for cmd_id in (
+                domain._cmdGetID,
+                domain._cmdSetID,
+                domain._subscribeID,
+                domain._subscribeResponseID,
+                domain._contextID,
+                domain._contextResponseID,
+            ):
+                self._cmd_domain_map[cmd_id] = dom
+
+    def domain_for_cmd(self, cmd_id):
+        """AsyncDomain handling the given command id (None if unknown)"""
+        return self._cmd_domain_map.get(cmd_id)
+
+    @classmethod
+    async def open(cls, host, port, default_domains=None):
+        reader, writer = await asyncio.open_connection(host, port)
+        return cls(reader, writer, default_domains)
+
+    def connect(self, host, port):
+        raise RuntimeError("Use AsyncTraCIConnection.open(host, port) to connect.")
+
+    async def recv_exact(self):
+        try:
+            header = await self._stream_reader.readexactly(4)
+            length = struct.unpack("!i", header)[0] - 4
+            content = await self._stream_reader.readexactly(length)
+            return Storage(content, array_mode=self.array_mode)
+        except (asyncio.IncompleteReadError, ConnectionError):
+            return None
+
+    def _check_received(self, result):
+        if not result:
+            self._stream_writer.close()
+            self._stream_writer = None
+            raise FatalTraCIError("connection closed by SUMO")
+
+    async def _send_message(self):
+        if self._stream_writer is None:
+            raise FatalTraCIError("Connection already closed.")
+        length = struct.pack("!i", len(self._string) + 4)
+        self._stream_writer.write(length + self._string)
+        await self._stream_writer.drain()
+        return await self.recv_exact()
+
+    async def _send_exact(self):
+        result = await self._send_message()
+        return self._parse_received(result)
+
+    def _owns_batch(self):
+        return self._batch is not None and self._batch_task is asyncio.current_task()
+
+    async def send_cmd(self, cmd_id, var_id, obj_id, _format="", *values, data_response=None):
+        if self._owns_batch():
+            # sent when the batch is closed
+            self._queue.append(cmd_id)
+            self.write_cmd(self._string, cmd_id, var_id, obj_id, _format, *values)
+            self._batch.add(cmd_id, data_response)
+            return None
+        async with self._lock:
+            self._queue.append(cmd_id)
+            self.write_cmd(self._string, cmd_id, var_id, obj_id, _format, *values)
+            return await self._send_exact()
+
+    @contextlib.asynccontextmanager
+    async def batch(self, raise_on_error=True):
+        """see Connection.batch. Other tasks wait until the batch is sent."""
+        if self._owns_batch():
+            yield self._batch
+            return
+        async with self._lock:
+            batch = self._batch = CommandBatch(raise_on_error)
+            self._batch_task = asyncio.current_task()
+            try:
+                yield batch
+            except BaseException:
+                self.clear_state()
+                raise
+            finally:
+                self._batch = None
+                self._batch_task = None
+            if len(self._queue) > 0:
+                result = await self._send_message()
+                self._parse_batch_received(result, batch)
+
+    async def _subscribe(self, cmd_id, begin, end, obj_id, var_ids, parameters):
+        _format, args = self._subscribe_args(var_ids, parameters)
+        result = await self.send_cmd(
+            cmd_id, (begin, end), obj_id, _format, *args, data_response=bool(var_ids)
+        )
+        if result is not None:
+            self._check_subscription(result, cmd_id, obj_id, var_ids)
+
+    async def simulation_step(self, step=0.0):
+        """simulate up to step, parse the subscriptions and notify the listeners"""
+        result = await self.send_cmd(tc.CMD_SIMSTEP, None, None, "D", step)
+        self.parse_subscription_result(result)
+        self.notify_subscription_listener()
+        return self.subscriptionMapping
+
+    async def subscription_stream(self, sim_times):
+        """
+        Async iterator over the subscription results: simulates up to each time
+        of sim_times and yields (time, subscription results).
+        """
+        for sim_time in sim_times:
+            yield sim_time, await self.simulation_step(sim_time)
+
+    async def send_file(self, file_name, file_content):
+        _cmd = bytes()
+        _cmd += struct.pack("!B", tc.CMD_FILE_SEND)
+        _cmd += struct.pack("!i", len(file_name)) + file_name.encode("latin1")
+        _cmd += struct.pack("!i", len(file_content)) + file_content.encode("latin1")
+
+        # assume big packet
+        _cmd = struct.pack("!Bi", 0, len(_cmd) + 5) + _cmd
+
+        async with self._lock:
+            self._queue.append(tc.CMD_FILE_SEND)
+            self._string += _cmd
+            return await self._send_exact()
+
+    async def close(self, wait=True):
+        if self._stream_writer is not None:
+            await self.send_cmd(tc.CMD_CLOSE, None, None)
+            self._stream_writer.close()
+            if wait:
+                await self._stream_writer.wait_closed()
+            self._stream_writer = None
@@ -28,13 +28,14 @@ import struct
 import sys
 import warnings
 import abc
+import contextlib
 from typing import List
 
 from flowcontrol.crownetcontrol.traci import constants_vadere as tc
-from flowcontrol.crownetcontrol.traci.domains.VaderePersonAPI import VaderePersonAPI
+from flowcontrol.crownetcontrol.traci.domains.VaderePersonDomain import VaderePersonDomain
 from flowcontrol.crownetcontrol.traci.domains.VadereMiscAPI import VadereMiscAPI
-from flowcontrol.crownetcontrol.traci.domains.VadereSimulationAPI import (
-    VadereSimulationAPI,
+from flowcontrol.crownetcontrol.traci.domains.VadereSimulationDomain import (
+    VadereSimulationDomain,
 )
 from flowcontrol.crownetcontrol.traci.domains.VaderePolygonAPI import (
     VaderePolygonAPI,
@@ -42,12 +43,34 @@ from flowcontrol.crownetcontrol.traci.domains.VaderePolygonAPI import (
 
 
 from .domains.VadereControlDomain import VadereControlCommandApi
+from . import encoder
 from .exceptions import TraCIException, FatalTraCIError, TraCISimulationEnd
+from .reader import MessageReader
 from .storage import Storage
 from flowcontrol.crownetcontrol.state.state_listener import StateListener
 
 _RESULTS = {0x00: "OK", 0x01: "Not implemented", 0xFF: "Error"}
 
+# response ids of variable subscriptions, all other responses are context subscriptions
+_VARIABLE_SUBSCRIPTION_RESPONSES = frozenset(
+    range(
+        tc.RESPONSE_SUBSCRIBE_INDUCTIONLOOP_VARIABLE,
+        tc.RESPONSE_SUBSCRIBE_BUSSTOP_VARIABLE + 1,
+    )
+) | frozenset(
+    range(
+        tc.RESPONSE_SUBSCRIBE_PARKINGAREA_VARIABLE,
+        tc.RESPONSE_SUBSCRIBE_OVERHEADWIRE_VARIABLE + 1,
+    )
+)
+
+# get commands answer with a data response, set commands only with their status
+_GET_COMMANDS = frozenset(
+    range(tc.CMD_GET_INDUCTIONLOOP_VARIABLE, tc.CMD_GET_BUSSTOP_VARIABLE + 1)
+) | frozenset(
+    range(tc.CMD_GET_PARKINGAREA_VARIABLE, tc.CMD_GET_OVERHEADWIRE_VARIABLE + 1)
+)
+
 
 def create_client_socket():
     if sys.platform.startswith("java"):
@@ -69,51 +92,72 @@ def create_accept_server_socket(host, port):
     return s, _socket, addr[0], addr[1]
 
 
+class CommandBatch:
+    """Commands collected by Connection.batch() and their status after sending."""
+
+    def __init__(self, raise_on_error=True):
+        self.raise_on_error = raise_on_error
+        self.statuses = []
+        # for each queued command: does a data response follow its status
+        self.data_responses = []
+
+    def add(self, cmd_id, data_response=None):
+        if data_response is None:
+            data_response = cmd_id in _GET_COMMANDS
+        self.data_responses.append(data_response)
+
+    @property
+    def ok(self):
+        return all(not s["result"] and not s["err"] for s in self.statuses)
+
+
 class Connection(object):
     __metaclass__ = abc.ABCMeta
 
     def __init__(self, _socket=None):
         self._socket = _socket
-        self._string = bytes()
+        self._string = bytearray()
         self._queue = []
+        # decode list types of received messages as numpy arrays (see Storage)
+        self.array_mode = False
+        self._reader = None
+        self._batch = None
 
     def recv_exact(self):
+        if self._reader is None or self._reader.socket is not self._socket:
+            self._reader = MessageReader(self._socket)
         try:
-            result = bytes()
-            while len(result) < 4:
-                t = self._socket.recv(4 - len(result))
-                if not t:
-                    return None
-                result += t
-            length = struct.unpack("!i", result)[0] - 4
-            result = bytes()
-            while len(result) < length:
-                t = self._socket.recv(length - len(result))
-                if not t:
-                    return None
-                result += t
-            return Storage(result)
+            result = self._reader.read_message()
+            if result is None:
+                return None
+            return Storage(result, array_mode=self.array_mode)
         except socket.error:
             return None
 
-    def _parse_received(self, result):
+    def _check_received(self, result):
         if not result:
             self._socket.close()
             del self._socket
             raise FatalTraCIError("connection closed by SUMO")
+
+    def _raise_status(self, status):
+        self._string = bytearray()
+        self._queue = []
+        if status["err"] == "Simulation end reached.":
+            raise TraCISimulationEnd(
+                status["err"], status["cmd"], _RESULTS[status["result"]]
+            )
+        else:
+            raise TraCIException(
+                status["err"], status["cmd"], _RESULTS[status["result"]]
+            )
+
+    def _parse_received(self, result):
+        self._check_received(result)
         for command in self._queue:
             status = result.read_status()
             if status["result"] or status["err"]:
-                self._string = bytes()
-                self._queue = []
-                if status["err"] == "Simulation end reached.":
-                    raise TraCISimulationEnd(
-                        status["err"], status["cmd"], _RESULTS[status["result"]]
-                    )
-                else:
-                    raise TraCIException(
-                        status["err"], status["cmd"], _RESULTS[status["result"]]
-                    )
+                self._raise_status(status)
             elif status["cmd"] != command:
                 raise FatalTraCIError(
                     "Received answer %s for command %s." % (status["cmd"], command)
@@ -121,20 +165,90 @@ class Connection(object):
             elif status["cmd"] == tc.CMD_STOP:
                 length = result.read("!B")[0] - 1
                 result.read("!%sx" % length)
-        self._string = bytes()
+        self._string = bytearray()
         self._queue = []
         return result
 
-    def _send_exact(self):
+    def _parse_batch_received(self, result, batch):
+        """
+        Read the status of every queued command in order. The data responses
+        following successful get and subscribe commands (see CommandBatch.add)
+        are skipped. The first failed status is raised after the whole message
+        has been read.
+        """
+        self._check_received(result)
+        failed = None
+        for command, data_response in zip(self._queue, batch.data_responses):
+            status = result.read_status()
+            if status["result"] or status["err"]:
+                failed = failed or status
+            elif status["cmd"] != command:
+                self.clear_state()
+                raise FatalTraCIError(
+                    "Received answer %s for command %s." % (status["cmd"], command)
+                )
+            elif status["cmd"] == tc.CMD_STOP:
+                length = result.read("!B")[0] - 1
+                result.read("!%sx" % length)
+            elif data_response:
+                self._read_batch_response(result, command)
+            batch.statuses.append(status)
+        self._string = bytearray()
+        self._queue = []
+        if failed is not None and batch.raise_on_error:
+            self._raise_status(failed)
+        return result
+
+    def _read_batch_response(self, result, command):
+        """data response of a batched command, skipped by default"""
+        result.skip_cmd()
+
+    def _send_message(self):
         if self._socket is None:
             raise FatalTraCIError("Connection already closed.")
         # print("python_sendExact: '%s'" % ' '.join(map(lambda x : "%X" % ord(x), self._string)))
         length = struct.pack("!i", len(self._string) + 4)
         self._socket.send(length + self._string)
-        result = self.recv_exact()
+        return self.recv_exact()
 
+    def _send_exact(self):
+        result = self._send_message()
         return self._parse_received(result)
 
+    @property
+    def in_batch(self):
+        return self._batch is not None
+
+    @contextlib.contextmanager
+    def batch(self, raise_on_error=True):
+        """
+        Collect all commands sent inside the with-block and send them as one
+        TraCI message (one round trip) when the block is left:
+
+            with connection.batch() as b:
+                for ped_id in ped_ids:
+                    connection.v_person.set_target_list(ped_id, ["2"])
+            b.statuses  # status of each command in order
+
+        Commands return None inside the block, so only commands whose response
+        is not needed (e.g. set commands) can be batched. Nested blocks join the
+        outer batch.
+        """
+        if self._batch is not None:
+            yield self._batch
+            return
+        batch = self._batch = CommandBatch(raise_on_error)
+        try:
+            yield batch
+        except BaseException:
+            self.clear_state()
+            raise
+        finally:
+            self._batch = None
+        if len(self._queue) > 0:
+            result = self._send_message()
+            self._parse_batch_received(result, batch)
+
     def send_raw(self, data, append_message_len=True):
         if self._socket is None:
             raise FatalTraCIError("Connection already closed.")
@@ -147,80 +261,9 @@ class Connection(object):
     @staticmethod
     def pack(_format, *values):
         if _format == "packet":
-            assert type(values[0]) == bytes
+            assert isinstance(values[0], (bytes, bytearray))
             return values[0]
-        packed = bytes()
-        if _format.startswith("t"):
-            _format_new = _format[1:] # check this
-            f_len = len(_format_new)
-
-            if f_len != len(values):
-                raise ValueError("..")
-
-            v = Connection.pack(_format_new,*values)
-            packed += struct.pack("!Bi", tc.TYPE_COMPOUND, f_len) + v
-            return packed
-
-        for f, v in zip(_format, values):
-            if f == "i":
-                packed += struct.pack("!Bi", tc.TYPE_INTEGER, int(v))
-            elif f == "I":  # raw int for setOrder
-                packed += struct.pack("!i", int(v))
-            elif f == "d":
-                packed += struct.pack("!Bd", tc.TYPE_DOUBLE, float(v))
-            elif f == "D":  # raw double for some base commands like simstep
-                packed += struct.pack("!d", float(v))
-            elif f == "b":
-                packed += struct.pack("!Bb", tc.TYPE_BYTE, int(v))
-            elif f == "B":
-                packed += struct.pack("!BB", tc.TYPE_UBYTE, int(v))
-            elif (
-                f == "u"
-            ):  # raw unsigned byte needed for distance command and subscribe
-                packed += struct.pack("!B", int(v))
-            elif f == "s":
-                v = str(v)
-                packed += struct.pack("!Bi", tc.TYPE_STRING, len(v)) + v.encode(
-                    "latin1"
-                )
-            elif f == "p":  # polygon
-                if len(v) <= 255:
-                    packed += struct.pack("!BB", tc.TYPE_POLYGON, len(v))
-                else:
-                    packed += struct.pack("!BBi", tc.TYPE_POLYGON, 0, len(v))
-                for p in v:
-                    packed += struct.pack("!dd", *p)
-            elif f == "c":  # color
-                packed += struct.pack(
-                    "!BBBBB",
-                    tc.TYPE_COLOR,
-                    int(v[0]),
-                    int(v[1]),
-                    int(v[2]),
-                    int(v[3]) if len(v) > 3 else 255,
-                )
-            elif f == "l":  # string list
-                packed += struct.pack("!Bi", tc.TYPE_STRINGLIST, len(v))
-                for s in v:
-                    packed += struct.pack("!i", len(s)) + s.encode("latin1")
-            elif f == "f":  # float list
-                packed += struct.pack("!Bi", tc.TYPE_DOUBLELIST, len(v))
-                for x in v:
-                    packed += struct.pack("!d", x)
-            elif f == "o":
-                packed += struct.pack("!Bdd", tc.POSITION_2D, *v)
-            elif f == "O":
-                packed += struct.pack("!Bddd", tc.POSITION_3D, *v)
-            elif f == "g":
-                packed += struct.pack("!Bdd", tc.POSITION_LON_LAT, *v)
-            elif f == "G":
-                packed += struct.pack("!Bddd", tc.POSITION_LON_LAT_ALT, *v)
-            elif f == "r":
-                packed += struct.pack("!Bi", tc.POSITION_ROADMAP, len(v[0])) + v[
-                    0
-                ].encode("latin1")
-                packed += struct.pack("!dB", v[1], v[2])
-        return packed
+        return bytes(encoder.pack_into(bytearray(), _format, *values))
 
     @staticmethod
     def response(cmd_id, r_type, msg=""):
@@ -245,37 +288,24 @@ class Connection(object):
     def res_err(cmd_id, msg=""):
         return Connection.response(cmd_id, tc.RTYPE_ERR, msg)
 
-    def build_cmd(self, cmd_id, var_id, obj_id, _format="", *values):
-        _cmd_string = bytes()
-        packed = self.pack(_format, *values)
-        length = len(packed) + 1 + 1  # length and command
-        if var_id is not None:
-            if isinstance(var_id, tuple):  # begin and end of a subscription
-                length += 8 + 8 + 4 + len(obj_id)
-            else:
-                length += 1 + 4 + len(obj_id)
-        if length <= 255:
-            _cmd_string += struct.pack("!BB", length, cmd_id)
-        else:
-            _cmd_string += struct.pack("!BiB", 0, length + 4, cmd_id)
-            # BiB : i -> integer
-        if var_id is not None:
-            if isinstance(var_id, tuple):
-                _cmd_string += struct.pack("!dd", *var_id)
-                # d -> double
-            else:
-                _cmd_string += struct.pack("!B", var_id)
-                # B -> unsigned char
-            _cmd_string += struct.pack("!i", len(obj_id)) + obj_id.encode("latin1")
-        _cmd_string += packed
-        return _cmd_string
+    def write_cmd(self, buf, cmd_id, var_id, obj_id, _format="", *values):
+        """append the command to the bytearray buf"""
+        return encoder.write_cmd(buf, cmd_id, var_id, obj_id, _format, *values)
 
-    def send_cmd(self, cmd_id, var_id, obj_id, _format="", *values):
+    def build_cmd(self, cmd_id, var_id, obj_id, _format="", *values):
+        return self.write_cmd(bytearray(), cmd_id, var_id, obj_id, _format, *values)
 
+    def send_cmd(self, cmd_id, var_id, obj_id, _format="", *values, data_response=None):
+        """
+        data_response: whether the command is answered with data after its
+        status, by default only get commands are.
+        """
         self._queue.append(cmd_id)
-        packed = self.build_cmd(cmd_id, var_id, obj_id, _format, *values)
-
-        self._string += packed
+        self.write_cmd(self._string, cmd_id, var_id, obj_id, _format, *values)
+        if self._batch is not None:
+            # sent when the batch is closed
+            self._batch.add(cmd_id, data_response)
+            return None
         return self._send_exact()
 
     def load(self, args):
@@ -309,7 +339,7 @@ class Connection(object):
 
     def clear_state(self):
         self._queue = []
-        self._string = bytes()
+        self._string = bytearray()
 
     def connect(self, host, port):
         self._socket.connect((host, port))
@@ -321,7 +351,7 @@ class BaseTraCIConnection(Connection):
 
         self._socket = _socket
 
-        self._string = bytes()
+        self._string = bytearray()
         self._queue = []  # backlog of commands waiting response
         self.subscriptionMapping = {}
         self.subscriptionListener: List[StateListener] = []
@@ -338,7 +368,7 @@ class BaseTraCIConnection(Connection):
             listener.handle_subscription_result(self.subscriptionMapping)
 
     def clear(self):
-        self._string = bytes()
+        self._string = bytearray()
         self._queue = []
 
     def parse_subscription_result(self, result):
@@ -355,28 +385,20 @@ class BaseTraCIConnection(Connection):
         # to enable this you also need to set _DEBUG to True in storage.py
         # result.printDebug()
         result.readLength()
-        response = result.read("!B")[0]
-        # todo better comparison!
-        is_variable_subscription = (
-            tc.RESPONSE_SUBSCRIBE_INDUCTIONLOOP_VARIABLE
-            <= response
-            <= tc.RESPONSE_SUBSCRIBE_BUSSTOP_VARIABLE
-        ) or (
-            tc.RESPONSE_SUBSCRIBE_PARKINGAREA_VARIABLE
-            <= response
-            <= tc.RESPONSE_SUBSCRIBE_OVERHEADWIRE_VARIABLE
-        )
+        response = result.readUnsignedByte()
+        is_variable_subscription = response in _VARIABLE_SUBSCRIPTION_RESPONSES
         object_id = result.readString()
         if not is_variable_subscription:
-            domain = result.read("!B")[0]
-        num_vars = result.read("!B")[0]
+            domain = result.readUnsignedByte()
+        num_vars = result.readUnsignedByte()
         if is_variable_subscription:
+            results = self.subscriptionMapping.get(response)
             while num_vars > 0:
                 var_id, status = result.read("!BB")
                 if status:
                     print("Error!", result.readTypedString())
-                elif response in self.subscriptionMapping:
-                    self.subscriptionMapping[response].add(object_id, var_id, result)
+                elif results is not None:
+                    results.add(object_id, var_id, result)
                 else:
                     raise FatalTraCIError(
                         "Cannot handle subscription response %02x for %s."
@@ -410,7 +432,8 @@ class BaseTraCIConnection(Connection):
                         )
         return object_id, response
 
-    def _subscribe(self, cmd_id, begin, end, obj_id, var_ids, parameters):
+    @staticmethod
+    def _subscribe_args(var_ids, parameters):
         _format = "u"
         args = [len(var_ids)]
         for v in var_ids:
@@ -427,7 +450,9 @@ class BaseTraCIConnection(Connection):
                     f, a = "s", parameters[v]
                 _format += f
                 args.append(a)
-        result = self.send_cmd(cmd_id, (begin, end), obj_id, _format, *args)
+        return _format, args
+
+    def _check_subscription(self, result, cmd_id, obj_id, var_ids):
         if var_ids:
             object_id, response = self.read_subscription(result)
             if response - cmd_id != 16 or object_id != obj_id:
@@ -436,6 +461,21 @@ class BaseTraCIConnection(Connection):
                     % (response, object_id, cmd_id, obj_id)
                 )
 
+    def _subscribe(self, cmd_id, begin, end, obj_id, var_ids, parameters):
+        _format, args = self._subscribe_args(var_ids, parameters)
+        result = self.send_cmd(
+            cmd_id, (begin, end), obj_id, _format, *args, data_response=bool(var_ids)
+        )
+        if result is not None:  # batched subscriptions are read with the batch
+            self._check_subscription(result, cmd_id, obj_id, var_ids)
+
+    def _read_batch_response(self, result, command):
+        # keep the first values of batched variable subscriptions
+        if command + 16 in _VARIABLE_SUBSCRIPTION_RESPONSES:
+            self.read_subscription(result)
+        else:
+            result.skip_cmd()
+
     def _get_subscription_results(self, cmd_id):
         return self.subscriptionMapping[cmd_id]
 
@@ -558,19 +598,18 @@ class WrappedTraCIConnection(BaseTraCIConnection):
                 break
         return tc.CMD_CONTROLLER, tc.VAR_REDIRECT, sim_prefix
 
-    def build_cmd(self, cmd_id, var_id, obj_id, _format="", *values):
+    def write_cmd(self, buf, cmd_id, var_id, obj_id, _format="", *values):
         """
         wrap command based on cmd_id as payload in a VAR_REDIRECT command
         """
-        payload = super().build_cmd(cmd_id, var_id, obj_id, _format, *values)
-
         w_cmd_od, w_var_id, w_obj_id = self._wrap(cmd_id, var_id)
-        wrapped_cmd = super().build_cmd(w_cmd_od, w_var_id, w_obj_id, "packet", payload)
-        return wrapped_cmd
+        # the payload is written in place behind the header of the wrapping command
+        start = encoder.begin_cmd(buf, w_cmd_od, w_var_id, w_obj_id)
+        encoder.write_cmd(buf, cmd_id, var_id, obj_id, _format, *values)
+        return encoder.finish_cmd(buf, start)
 
     def build_cmd_raw(self, cmd_id, var_id, obj_id, _format="", *values):
-        payload = super().build_cmd(cmd_id, var_id, obj_id, _format, *values)
-        return payload
+        return encoder.write_cmd(bytearray(), cmd_id, var_id, obj_id, _format, *values)
 
     def send_traci_msg(self, data):
         length = struct.pack("!i", len(self._string) + 4)
@@ -583,7 +622,7 @@ class WrappedTraCIConnection(BaseTraCIConnection):
             raise FatalTraCIError("connection closed by partner")
         # we are waiting as server thus there should be no queued command
         assert len(self._queue) == 0
-        self._string = bytes()
+        self._string = bytearray()
         self._queue = []
         # read status and use 'cmd' to decide what to do
         result.readLength()  # cmd_len
@@ -610,9 +649,9 @@ class WrappedTraCIConnection(BaseTraCIConnection):
 
 class DomainHandler:
     def __init__(self):
-        self.v_person = VaderePersonAPI()
+        self.v_person = VaderePersonDomain()
         self.v_misc = VadereMiscAPI()
-        self.v_sim = VadereSimulationAPI()
+        self.v_sim = VadereSimulationDomain()
         self.v_ctrl = VadereControlCommandApi()
         self.v_polygon = VaderePolygonAPI()
         self._registered = False
@@ -1,3 +1,5 @@
+import asyncio
+import inspect
 import logging
 import os.path
 import time
@@ -9,6 +11,7 @@ from flowcontrol.crownetcontrol.setup.vadere import get_scenario_content
 
 from flowcontrol.crownetcontrol.state.state_listener import StateListener
 from flowcontrol.crownetcontrol.traci import constants_vadere as tc
+from flowcontrol.crownetcontrol.traci.async_connection import AsyncTraCIConnection
 from flowcontrol.crownetcontrol.traci.connection import (
     DomainHandler,
     BaseTraCIConnection,
@@ -351,3 +354,128 @@ class ServerModeConnection(TraCiManager):
 
     def set_vadere_time(self, omnetpp_sim_time):
         self.vadere_sim_time = omnetpp_sim_time + self.sim_step_size
+
+
+class AsyncClientModeConnection(TraCiManager):
+    """
+    asyncio variant of ClientModeConnection.
+
+    The controller callbacks (handle_init, handle_sim_step) may be coroutines.
+    They access the simulation through self.domains, which is the
+    AsyncTraCIConnection (e.g. await self.con_manager.domains.v_person.set(...)).
+    Several managers can be run in one event loop:
+
+        await asyncio.gather(manager_1.start(), manager_2.start())
+    """
+
+    def __init__(self, control_handler, host="127.0.0.1", port=9999, server_thread=None, sim_cfg: SimulationConfig = None):
+        self.sim_cfg = sim_cfg
+        self.server_thread: Thread = server_thread
+        super().__init__(host, port, control_handler)
+        self._traci = None
+
+    async def connect(self, max_waiting_time=20.0):
+        start_time = time.time()
+        while True:
+            try:
+                connection = await AsyncTraCIConnection.open(self.host, self.port)
+                break
+            except ConnectionRefusedError:
+                if (time.time() - start_time) >= max_waiting_time:
+                    raise ConnectionRefusedError(f'Attempts to connect to the server: timeout ({max_waiting_time}s) reached.')
+                print('Server not started yet. Wait ...')
+                await asyncio.sleep(0.2)
+        self._traci = connection
+        self.domains = connection
+
+    @staticmethod
+    async def _call(callback, *args):
+        result = callback(*args)
+        if inspect.isawaitable(result):
+            result = await result
+        return result
+
+    async def _subscribe_listener(self, listener: StateListener):
+        # see StateListener.subscribe
+        if not listener._init_sub:
+            return
+        for cmd_id, subscription_map in listener.handle_dict.items():
+            dom = self.traci.domain_for_cmd(cmd_id)
+            if dom is None:
+                continue
+            for object_id, var_list in subscription_map.items():
+                if object_id != listener.ALL_OBJECTS:
+                    await dom.subscribe(objectID=object_id, varIDs=var_list)
+
+    async def _update_pedestrian_subscription(self, begin=tc.INVALID_DOUBLE_VALUE, end=tc.INVALID_DOUBLE_VALUE):
+        # see VadereDefaultStateListener.update_pedestrian_subscription
+        listener = self._default_sub
+        vars = list(listener.handle_dict[tc.RESPONSE_SUBSCRIBE_V_PERSON_VARIABLE][listener.ALL_OBJECTS].values())
+        async with self.traci.batch():
+            await self.traci.v_person.subscribe_bulk(listener.new_pedestrian_ids, vars, begin, end)
+            await self.traci.v_person.unsubscribe_bulk(listener.removed_pedestrian_ids)
+
+    async def _simulation_step(self, step=0.0):
+        if self.is_control_active:
+            print(f"Simulate until time={step}")
+        await self.traci.simulation_step(step + self.sim_step_size)
+
+    async def _initialize(self, *arg, **kwargs):
+        print("register default subscriptions")
+        for listener in self.traci.subscriptionListener:
+            await self._subscribe_listener(listener)
+        self.traci.notify_subscription_listener()
+        if len(self._default_sub.new_pedestrian_ids) > 0:
+            await self._update_pedestrian_subscription()
+        self.traci.notify_subscription_listener()
+
+        output_dir = await self.traci.v_simulation.get(tc.VAR_OUTPUT_DIR, "")
+        # set_simulation_config_dynamically without set_stepping_behavior: it only
+        # reads the simulation time through the blocking v_sim domain
+        self._control_hdl.set_output_dir(os.path.dirname(output_dir))
+        self.sim_step_size = await self.traci.v_simulation.get(tc.VAR_DELTA_T, "")
+
+        await self._call(self._control_hdl.handle_init, self._default_sub.time, self.sub_listener)
+
+    async def _handle_sim_step(self, *arg, **kwargs):
+        await self._update_pedestrian_subscription()
+        self.traci.notify_subscription_listener()
+
+        self.current_time = self._default_sub.time
+        self.print_handle_message(self._default_sub.time)
+        await self._call(self._control_hdl.handle_sim_step, self._default_sub.time, self.sub_listener)
+
+    async def _run(self):
+        while self._running:
+            self._sim_until = self.get_next_simulation_time()
+            await self._simulation_step(self._sim_until)
+            await self._handle_sim_step()
+            self.traci.clear()
+
+    async def start(self, *kw, **kwargs):
+        try:
+            if self._traci is None:
+                await self.connect()
+            await self.traci.v_simulation.set(
+                tc.VAR_SIM_CONFIG, "-1", "tssssssssiB",
+                self.sim_cfg.getOmnetppConfid(), self.sim_cfg.getExperimetnLabel(), str(time.time()),
+                self.sim_cfg.get_root_dir(), "1", "1", "", "", 0, 1,
+            )
+            await self.traci.send_file(self.sim_cfg.get_scenario_file(), self.sim_cfg.getScenarioFileContent())
+            self._init_sub_listener()
+            await self._initialize()
+            self._running = True
+            await self._run()
+        except NotImplementedError as e:
+            print(e)
+        except TraCISimulationEnd:
+            print("Simulation end reached.")
+        finally:
+            self._cleanup()
+
+    def _cleanup(self):
+        self._control_hdl.postprocess_sim_results()
+
+        if self.server_thread is not None:
+            print("Shut down server.")
+            self.server_thread.stop()
@@ -2,6 +2,7 @@ import struct
 
 from flowcontrol.crownetcontrol.traci.domains.domain import Domain, BaseDomain
 from flowcontrol.crownetcontrol.traci import constants_vadere as tc
+from flowcontrol.crownetcontrol.traci.exceptions import FatalTraCIError
 
 
 
@@ -9,6 +10,11 @@ class VadereControlCommandApi(BaseDomain):
     def __init__(self):
         super().__init__("vCtrl")
 
+    def _check_not_in_batch(self, command):
+        # the response carries the subscription data and must be read directly
+        if self._connection is not None and self._connection.in_batch:
+            raise FatalTraCIError(f"{command} cannot be sent inside a batch.")
+
     def send_file(self, file_name, file_content):
         _cmd = bytes()
         _cmd += struct.pack("!B", tc.CMD_FILE_SEND)
@@ -23,10 +29,12 @@ class VadereControlCommandApi(BaseDomain):
 
     def sim_step(self, simstep=0.0):
         """simulate to simstep and return subscription data """
+        self._check_not_in_batch("sim_step")
         return self._connection.send_cmd(tc.CMD_SIMSTEP, None, None, "D", simstep)
 
     def sim_state(self, simstep=0.0):
         """access subscription data (i.e. current state) """
+        self._check_not_in_batch("sim_state")
         return self._connection.send_cmd(tc.CMD_SIMSTATE, None, None, "D", simstep)
 
 
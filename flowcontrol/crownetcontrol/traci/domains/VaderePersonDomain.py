@@ -0,0 +1,25 @@
+from flowcontrol.crownetcontrol.traci.domains.VaderePersonAPI import VaderePersonAPI
+from flowcontrol.crownetcontrol.traci import constants_vadere as tc
+
+
+class VaderePersonDomain(VaderePersonAPI):
+    """
+    Hand written commands of the person domain. VaderePersonAPI is
+    generated, changes to it are lost when it is generated again.
+
+    The bulk setters accept a mapping {element_id: value} or the element ids
+    and a sequence of values and send one set command per element in a single
+    message (see Domain._setCmdBulk).
+    """
+
+    def set_next_target_list_indices(self, element_ids, data=None):
+        return self._setCmdBulk(tc.VAR_NEXT_TARGET_LIST_INDEX, "i", element_ids, data)
+
+    def set_free_flow_speeds(self, element_ids, data=None):
+        return self._setCmdBulk(tc.VAR_SPEED, "d", element_ids, data)
+
+    def set_positions2_d(self, element_ids, data=None):
+        return self._setCmdBulk(tc.VAR_POSITION, "o", element_ids, data)
+
+    def set_target_lists(self, element_ids, data=None):
+        return self._setCmdBulk(tc.VAR_TARGET_LIST, "l", element_ids, data)
@@ -0,0 +1,34 @@
+from flowcontrol.crownetcontrol.traci.domains.domain import _parse
+from flowcontrol.crownetcontrol.traci.domains.VadereSimulationAPI import VadereSimulationAPI
+from flowcontrol.crownetcontrol.traci import constants_vadere as tc
+from flowcontrol.crownetcontrol.traci.exceptions import FatalTraCIError
+
+
+class VadereSimulationDomain(VadereSimulationAPI):
+    """
+    Hand written commands of the simulation domain. VadereSimulationAPI is
+    generated, changes to it are lost when it is generated again.
+    """
+
+    def get_density_map(self, sending_node):
+        if self._connection is not None and self._connection.in_batch:
+            raise FatalTraCIError("get_density_map cannot be sent inside a batch.")
+        r = self._setCmd(tc.VAR_DENSITY_MAP, "-2", "ts", sending_node)
+        # decode the double list in one step as numpy array
+        r.array_mode = True
+        result = _parse(self._retValFunc, tc.VAR_DENSITY_MAP, r)
+        cell_dim = tuple(result[0:2].tolist())
+        cell_size = tuple(result[2:4].tolist())
+        if len(result) == 4:
+            print("No counts provided.")
+            return cell_dim, cell_size, None
+
+        result = result[4:]
+        if len(result) % 3 == 0:
+            result = result.reshape(int(len(result) / 3), 3)
+            result[:, 0] = result[:, 0] * cell_size[0] # x-coordinate of left lower corner
+            result[:, 1] = result[:, 1] * cell_size[1] # y-coordinate of left lower corner
+        else:
+            raise FatalTraCIError("Expected double list of shape (n/3 , 3)")
+
+        return cell_dim, cell_size, result
@@ -22,14 +22,21 @@
 from __future__ import print_function
 from __future__ import absolute_import
 import copy
+import itertools
 import warnings
 from functools import wraps
 
+import numpy as np
+
 from flowcontrol.crownetcontrol.traci import constants as tc
 from flowcontrol.crownetcontrol.traci.exceptions import FatalTraCIError
+from flowcontrol.crownetcontrol.traci.storage import Storage
 
 _defaultDomains = []
 
+# shared by all SubscriptionResults, a generation is never reused
+_generations = itertools.count()
+
 
 def _readParameterWithKey(result):
     assert result.read("!i")[0] == 2  # compound size
@@ -38,45 +45,160 @@ def _readParameterWithKey(result):
     return key, val
 
 
-def _parse(valueFunc, varID, data):
-    varType = data.read("!B")[0]
-    if varID in valueFunc:
-        return valueFunc[varID](data)
-    if varType in (tc.POSITION_2D, tc.POSITION_LON_LAT):
-        return data.read("!dd")
-    if varType in (tc.POSITION_3D, tc.POSITION_LON_LAT_ALT):
-        return data.read("!ddd")
-    if varType == tc.TYPE_POLYGON:
-        return data.readShape()
-    if varType == tc.TYPE_UBYTE:
-        return data.read("!B")[0]
-    if varType == tc.TYPE_BYTE:
-        return data.read("!b")[0]
-    if varType == tc.TYPE_INTEGER:
-        return data.readInt()
-    if varType == tc.TYPE_DOUBLE:
-        return data.readDouble()
-    if varType == tc.TYPE_STRING:
-        return data.readString()
-    if varType == tc.TYPE_STRINGLIST:
-        return data.readStringList()
-    if varType == tc.TYPE_DOUBLELIST:
-        return data.readDoubleList()
+def _readCompound(valueFunc, varID, data):
+    nr_components = data.read("!i")[0]
+    result = list()
+    for x in range(nr_components):
+        res = _parse(valueFunc, varID, data)
+        result.append(res)
+    return result
+
+
+# readers by type byte, called after the type byte is read
+_VALUE_READERS = {
+    tc.POSITION_2D: Storage.read2DPosition,
+    tc.POSITION_LON_LAT: Storage.read2DPosition,
+    tc.POSITION_3D: Storage.read3DPosition,
+    tc.POSITION_LON_LAT_ALT: Storage.read3DPosition,
+    tc.TYPE_POLYGON: Storage.readShape,
+    tc.TYPE_UBYTE: Storage.readUnsignedByte,
+    tc.TYPE_BYTE: Storage.readByte,
+    tc.TYPE_INTEGER: Storage.readInt,
+    tc.TYPE_DOUBLE: Storage.readDouble,
+    tc.TYPE_STRING: Storage.readString,
+    tc.TYPE_STRINGLIST: Storage.readStringList,
+    tc.TYPE_DOUBLELIST: Storage.readDoubleList,
+    tc.TYPE_COLOR: Storage.readColor,
+}
+
+
+def _parseValue(valueFunc, varID, varType, data):
+    reader = _VALUE_READERS.get(varType)
+    if reader is not None:
+        return reader(data)
     if varType == tc.TYPE_COMPOUND:
-        nr_components = data.read("!i")[0]
-        result = list()
-        for x in range(nr_components):
-            res = _parse(valueFunc, varID, data)
-            result.append(res)
-        return result
-
-    if varType == tc.TYPE_COLOR:
-        return data.read("!BBBB")
+        return _readCompound(valueFunc, varID, data)
     raise FatalTraCIError(
         "Unknown variable %02x or invalid type %02x." % (varID, varType)
     )
 
 
+def _parse(valueFunc, varID, data):
+    varType = data.readUnsignedByte()
+    if varID in valueFunc:
+        return valueFunc[varID](data)
+    return _parseValue(valueFunc, varID, varType, data)
+
+
+def _decoder(valueFunc, varID):
+    """
+    Decoder of the value of varID. The valueFunc override is resolved once
+    instead of for every value.
+    """
+    if varID in valueFunc:
+        func = valueFunc[varID]
+
+        def decode(data):
+            data.readUnsignedByte()  # type
+            return func(data)
+
+    else:
+
+        def decode(data):
+            varType = data.readUnsignedByte()
+            reader = _VALUE_READERS.get(varType)
+            if reader is not None:
+                return reader(data)
+            return _parseValue(valueFunc, varID, varType, data)
+
+    return decode
+
+
+def _object_column(values, rows, size):
+    column = np.empty(size, dtype=object)
+    for row, value in zip(rows, values):
+        column[row] = value
+    return column
+
+
+# object id of the domain wide variable subscriptions (e.g. the id list)
+_GLOBAL_OBJECT_ID = ""
+
+
+def _column(values, rows, size):
+    """
+    Column of size rows holding values at rows. Numbers become float64 (int64
+    if all are integers and no row is missing), tuples of numbers (positions)
+    a float array with one column per component and everything else an
+    object array. Missing rows are NaN or None.
+    """
+    first = values[0]
+    if isinstance(first, tuple) and all(isinstance(v, float) for v in first):
+        shape = (size, len(first))
+    elif isinstance(first, (int, float)) and not isinstance(first, bool):
+        shape = size
+    else:
+        return _object_column(values, rows, size)
+    try:
+        if shape == size and len(rows) == size and all(type(v) is int for v in values):
+            column = np.empty(size, dtype=np.int64)
+        else:
+            column = np.full(shape, np.nan)
+        column[rows] = values
+        return column
+    except (TypeError, ValueError):
+        return _object_column(values, rows, size)
+
+
+class SubscriptionColumns:
+    """
+    Variable subscription results of one step as one numpy column per variable.
+
+    ids holds the object ids in the order of the rows, index maps an object id
+    to its row. Positions are N x 2 (or N x 3) float arrays, scalar numbers
+    float64 and all other values (e.g. target lists) object arrays. The values
+    of the domain wide subscription (object id "", e.g. the id list) are no row,
+    they are kept in global_values.
+
+        columns = traci.v_person.getAllSubscriptionColumns()
+        positions = columns[tc.VAR_POSITION]
+        speed = columns[tc.VAR_SPEED][columns.index["5"]]
+        ids = columns.global_values[tc.VAR_ID_LIST]
+    """
+
+    def __init__(self, ids, columns, global_values=None):
+        self.ids = ids
+        self.index = {obj_id: row for row, obj_id in enumerate(ids)}
+        self._columns = columns
+        self.global_values = {} if global_values is None else global_values
+
+    def __getitem__(self, varID):
+        return self._columns[varID]
+
+    def __contains__(self, varID):
+        return varID in self._columns
+
+    def __len__(self):
+        return len(self.ids)
+
+    def get(self, varID, default=None):
+        return self._columns.get(varID, default)
+
+    def keys(self):
+        return self._columns.keys()
+
+    def row(self, objID):
+        """values of objID as dict(varID: value)"""
+        row = self.index[objID]
+        return {varID: column[row] for varID, column in self._columns.items()}
+
+    def __repr__(self):
+        return "<SubscriptionColumns %d objects, variables %s>" % (
+            len(self.ids),
+            list(self._columns.keys()),
+        )
+
+
 class SubscriptionResults:
     def __init__(self, valueFunc: dict, sub_id, ctx_id, get_id):
         """
@@ -85,35 +207,136 @@ class SubscriptionResults:
         self._results = {}
         self._contextResults = {}
         self._valueFunc = valueFunc
+        self._decoders = {}
         self.managed_domain_cmds = [sub_id, ctx_id, get_id]
+        # columnar mode: values of each variable in arrival order with their row
+        self.columnar = False
+        self._rows = {}
+        self._values = {}
+        self._value_rows = {}
+        self._global_values = {}
+        self._columns = None
+        self._stale = False
+        self._generation = next(_generations)
+        self._modified = False
+
+    @property
+    def generation(self):
+        """
+        Number identifying the current content. It changes whenever results
+        are added or cleared, thus equal generations mean equal results.
+        """
+        if self._modified:
+            self._generation = next(_generations)
+            self._modified = False
+        return self._generation
 
     @property
     def data(self):
+        if self._stale:
+            self._to_dict()
         return self._results
 
+    def set_columnar(self, columnar=True):
+        """
+        Collect variable subscription results column-wise. The results are
+        available as SubscriptionColumns by columns(), the dict view (data, get)
+        is only built when it is used.
+        """
+        self.columnar = columnar
+        self.reset()
+
     def reset(self):
+        if self._results or self._contextResults or self._rows or self._global_values:
+            self._modified = True
         self._results.clear()
         self._contextResults.clear()
+        self._rows.clear()
+        self._values.clear()
+        self._value_rows.clear()
+        self._global_values.clear()
+        self._columns = None
+        self._stale = False
+
+    def decoder(self, varID):
+        try:
+            return self._decoders[varID]
+        except KeyError:
+            decode = self._decoders[varID] = _decoder(self._valueFunc, varID)
+            return decode
 
     def add(self, refID, varID, data):
-        if refID not in self._results:
-            self._results[refID] = {}
-        self._results[refID][varID] = _parse(self._valueFunc, varID, data)
+        self._modified = True
+        if self.columnar:
+            self._add_column_value(refID, varID, self.decoder(varID)(data))
+            return
+        try:
+            values = self._results[refID]
+        except KeyError:
+            values = self._results[refID] = {}
+        values[varID] = self.decoder(varID)(data)
+
+    def _add_column_value(self, refID, varID, value):
+        if refID == _GLOBAL_OBJECT_ID:
+            # not a row, the other objects lack its variables
+            self._global_values[varID] = value
+            self._columns = None
+            self._stale = True
+            return
+        row = self._rows.get(refID)
+        if row is None:
+            row = self._rows[refID] = len(self._rows)
+        try:
+            self._values[varID].append(value)
+            self._value_rows[varID].append(row)
+        except KeyError:
+            self._values[varID] = [value]
+            self._value_rows[varID] = [row]
+        self._columns = None
+        self._stale = True
+
+    def columns(self):
+        """SubscriptionColumns of the last step (columnar mode only)"""
+        if not self.columnar:
+            raise FatalTraCIError("Subscription results are not collected column-wise.")
+        if self._columns is None:
+            size = len(self._rows)
+            columns = {
+                varID: _column(values, self._value_rows[varID], size)
+                for varID, values in self._values.items()
+            }
+            self._columns = SubscriptionColumns(
+                list(self._rows.keys()), columns, dict(self._global_values)
+            )
+        return self._columns
+
+    def _to_dict(self):
+        ids = list(self._rows.keys())
+        results = {}
+        if self._global_values:
+            results[_GLOBAL_OBJECT_ID] = dict(self._global_values)
+        results.update((refID, {}) for refID in ids)
+        for varID, values in self._values.items():
+            for row, value in zip(self._value_rows[varID], values):
+                results[ids[row]][varID] = value
+        self._results.clear()
+        self._results.update(results)
+        self._stale = False
 
     def get(self, refID=None):
+        results = self.data
         if refID is None:
-            return self._results
-        return self._results.get(refID, {})
+            return results
+        return results.get(refID, {})
 
     def addContext(self, refID, domain, objID, varID=None, data=None):
+        self._modified = True
         if refID not in self._contextResults:
             self._contextResults[refID] = {}
         if objID not in self._contextResults[refID]:
             self._contextResults[refID][objID] = {}
         if varID is not None and data is not None:
-            self._contextResults[refID][objID][varID] = _parse(
-                self._valueFunc, varID, data
-            )
+            self._contextResults[refID][objID][varID] = self.decoder(varID)(data)
 
     def getContext(self, refID=None):
         if refID is None:
@@ -230,44 +453,70 @@ class Domain(BaseDomain):
                 % (self.name, self._deprecatedFor)
             )
         result = self._setCmd(varID, objectID, format, *values)
-        if result.empty:
+        if result is None or result.empty:
             return None
         else:
             return _parse(
                 self._retValFunc, varID, result
             )
 
-    def _getCmd(self, varID, objID, format="", *values):
-        if self._connection is None:
-            raise FatalTraCIError("Not connected.")
-        r = self._connection.send_cmd(self._cmdGetID, varID, objID, format, *values)
+    def _checkResponse(self, r, cmdID, varID, objID):
         r.readLength()
         response, retVarID = r.read("!BB")
         objectID = r.readString()
-        if response - self._cmdGetID != 16 or retVarID != varID or objectID != objID:
+        if response - cmdID != 16 or retVarID != varID or objectID != objID:
             raise FatalTraCIError(
                 "Received answer %s,%s,%s for command %s,%s,%s."
-                % (response, retVarID, objectID, self._cmdGetID, varID, objID)
+                % (response, retVarID, objectID, cmdID, varID, objID)
             )
         return r
 
+    def _getCmd(self, varID, objID, format="", *values):
+        if self._connection is None:
+            raise FatalTraCIError("Not connected.")
+        if self._connection.in_batch:
+            raise FatalTraCIError("Get commands cannot be sent inside a batch.")
+        r = self._connection.send_cmd(self._cmdGetID, varID, objID, format, *values)
+        return self._checkResponse(r, self._cmdGetID, varID, objID)
+
     def _setCmd(self, varID, objID, format="", *values):
         if self._connection is None:
             raise FatalTraCIError("Not connected.")
         r = self._connection.send_cmd(self._cmdSetID, varID, objID, format, *values)
+        if r is None:
+            # batched command, status is checked when the batch is sent
+            return None
         if not r.empty:
-            r.readLength()
-            response, retVarID = r.read("!BB")
-            objectID = r.readString()
-            if response - self._cmdSetID != 16 or retVarID != varID or objectID != objID:
-                raise FatalTraCIError(
-                    "Received answer %s,%s,%s for command %s,%s,%s."
-                    % (response, retVarID, objectID, self._cmdGetID, varID, objID)
-                )
-            return r
+            return self._checkResponse(r, self._cmdSetID, varID, objID)
         else:
             return r
 
+    def _setCmdBulk(self, varID, format, objIDs, values=None):
+        """
+        Send one set command per object in a single message.
+
+        objIDs is either a mapping objID -> value or a sequence of object ids
+        with the corresponding values. Returns the status of each command by
+        object id (None if called inside an open batch, the statuses are then
+        collected by that batch).
+        """
+        if self._connection is None:
+            raise FatalTraCIError("Not connected.")
+        if values is None:
+            objIDs, values = list(objIDs.keys()), list(objIDs.values())
+        objIDs = [str(objID) for objID in objIDs]
+        if len(objIDs) != len(values):
+            raise ValueError(
+                f"Got {len(objIDs)} object ids but {len(values)} values."
+            )
+        nested = self._connection.in_batch
+        with self._connection.batch(raise_on_error=False) as batch:
+            for objID, value in zip(objIDs, values):
+                self._connection.send_cmd(self._cmdSetID, varID, objID, format, value)
+        if nested:
+            return None
+        return dict(zip(objIDs, batch.statuses))
+
     def getIDList(self):
         """getIDList() -> list(string)
 
@@ -307,6 +556,39 @@ class Domain(BaseDomain):
         """
         self.subscribe(objectID, [])
 
+    def subscribeBulk(
+        self,
+        objectIDs,
+        varIDs=None,
+        begin=tc.INVALID_DOUBLE_VALUE,
+        end=tc.INVALID_DOUBLE_VALUE,
+        parameters=None,
+    ):
+        """subscribeBulk(list(string), list(integer), double, double, map(string->tuple)) -> None
+
+        Subscribe to the same values of all given objects. The subscriptions
+        are sent in one message, i.e. one round trip for all objects.
+        """
+        if varIDs is None:
+            varIDs = self._subscriptionDefault
+        with self._connection.batch():
+            for objectID in objectIDs:
+                self.subscribe(objectID, varIDs, begin, end, parameters)
+
+    def unsubscribeBulk(self, objectIDs):
+        """unsubscribeBulk(list(string)) -> None
+
+        Unsubscribe all given objects with one message.
+        """
+        self.subscribeBulk(objectIDs, [])
+
+    def batch(self, raise_on_error=True):
+        """batch(bool) -> context manager
+
+        Send the commands issued within the block in one message, see Connection.batch.
+        """
+        return self._connection.batch(raise_on_error)
+
     def getSubscriptionResults(self, objectID):
         """getSubscriptionResults(string) -> dict(integer: <value_type>)
 
@@ -331,6 +613,26 @@ class Domain(BaseDomain):
             self._subscribeResponseID
         ).get(None)
 
+    def setColumnarSubscriptionResults(self, columnar=True):
+        """setColumnarSubscriptionResults(bool) -> None
+
+        Collect the variable subscription results of this domain as one numpy
+        column per variable instead of one dict per object.
+        """
+        self._connection._get_subscription_results(
+            self._subscribeResponseID
+        ).set_columnar(columnar)
+
+    def getAllSubscriptionColumns(self):
+        """getAllSubscriptionColumns() -> SubscriptionColumns
+
+        Returns the subscription results for the last time step as columns
+        (see setColumnarSubscriptionResults) with the row index of each object.
+        """
+        return self._connection._get_subscription_results(
+            self._subscribeResponseID
+        ).columns()
+
     def subscribeContext(
         self,
         objectID,
@@ -346,6 +648,8 @@ class Domain(BaseDomain):
         Subscribe to objects of the given domain (specified as domain=traci.constants.CMD_GET_<DOMAIN>_VARIABLE),
         which are closer than dist to the object specified by objectID.
         """
+        if self._connection.in_batch:
+            raise FatalTraCIError("Context subscriptions cannot be sent inside a batch.")
         if varIDs is None:
             varIDs = self._subscriptionDefault
         self._connection._subscribe_context(
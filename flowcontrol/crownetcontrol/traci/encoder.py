@@ -0,0 +1,222 @@
+import struct
+
+from flowcontrol.crownetcontrol.traci import constants_vadere as tc
+
+_UBYTE = struct.Struct("!B")
+_INT = struct.Struct("!i")
+_DOUBLE = struct.Struct("!d")
+_TYPED_INT = struct.Struct("!Bi")
+_TYPED_DOUBLE = struct.Struct("!Bd")
+_TYPED_BYTE = struct.Struct("!Bb")
+_TYPED_UBYTE = struct.Struct("!BB")
+_TYPED_2D = struct.Struct("!Bdd")
+_TYPED_3D = struct.Struct("!Bddd")
+_COLOR = struct.Struct("!BBBBB")
+_SHORT_HEADER = struct.Struct("!BB")
+_LONG_HEADER = struct.Struct("!BiB")
+_DOUBLE_PAIR = struct.Struct("!dd")
+
+# header of a command with more than 255 bytes: 0x00, int length, cmd_id
+_LONG_HEADER_SIZE = _LONG_HEADER.size
+_SHORT_HEADER_SIZE = _SHORT_HEADER.size
+
+
+def _write_int(buf, v):
+    buf += _TYPED_INT.pack(tc.TYPE_INTEGER, int(v))
+
+
+def _write_raw_int(buf, v):
+    # raw int for setOrder
+    buf += _INT.pack(int(v))
+
+
+def _write_double(buf, v):
+    buf += _TYPED_DOUBLE.pack(tc.TYPE_DOUBLE, float(v))
+
+
+def _write_raw_double(buf, v):
+    # raw double for some base commands like simstep
+    buf += _DOUBLE.pack(float(v))
+
+
+def _write_byte(buf, v):
+    buf += _TYPED_BYTE.pack(tc.TYPE_BYTE, int(v))
+
+
+def _write_ubyte(buf, v):
+    buf += _TYPED_UBYTE.pack(tc.TYPE_UBYTE, int(v))
+
+
+def _write_raw_ubyte(buf, v):
+    # raw unsigned byte needed for distance command and subscribe
+    buf += _UBYTE.pack(int(v))
+
+
+def _write_string(buf, v):
+    v = str(v)
+    buf += _TYPED_INT.pack(tc.TYPE_STRING, len(v))
+    buf += v.encode("latin1")
+
+
+def _write_polygon(buf, v):
+    if len(v) <= 255:
+        buf += _TYPED_UBYTE.pack(tc.TYPE_POLYGON, len(v))
+    else:
+        buf += struct.pack("!BBi", tc.TYPE_POLYGON, 0, len(v))
+    for p in v:
+        buf += _DOUBLE_PAIR.pack(*p)
+
+
+def _write_color(buf, v):
+    buf += _COLOR.pack(
+        tc.TYPE_COLOR,
+        int(v[0]),
+        int(v[1]),
+        int(v[2]),
+        int(v[3]) if len(v) > 3 else 255,
+    )
+
+
+def _write_string_list(buf, v):
+    buf += _TYPED_INT.pack(tc.TYPE_STRINGLIST, len(v))
+    for s in v:
+        buf += _INT.pack(len(s))
+        buf += s.encode("latin1")
+
+
+def _write_double_list(buf, v):
+    buf += _TYPED_INT.pack(tc.TYPE_DOUBLELIST, len(v))
+    buf += struct.pack("!%dd" % len(v), *v)
+
+
+def _write_2d(type_id):
+    def _write(buf, v):
+        buf += _TYPED_2D.pack(type_id, *v)
+
+    return _write
+
+
+def _write_3d(type_id):
+    def _write(buf, v):
+        buf += _TYPED_3D.pack(type_id, *v)
+
+    return _write
+
+
+def _write_roadmap(buf, v):
+    buf += _TYPED_INT.pack(tc.POSITION_ROADMAP, len(v[0]))
+    buf += v[0].encode("latin1")
+    buf += struct.pack("!dB", v[1], v[2])
+
+
+def _write_nothing(buf, v):
+    # unknown format characters are ignored
+    pass
+
+
+_WRITERS = {
+    "i": _write_int,
+    "I": _write_raw_int,
+    "d": _write_double,
+    "D": _write_raw_double,
+    "b": _write_byte,
+    "B": _write_ubyte,
+    "u": _write_raw_ubyte,
+    "s": _write_string,
+    "p": _write_polygon,
+    "c": _write_color,
+    "l": _write_string_list,
+    "f": _write_double_list,
+    "o": _write_2d(tc.POSITION_2D),
+    "O": _write_3d(tc.POSITION_3D),
+    "g": _write_2d(tc.POSITION_LON_LAT),
+    "G": _write_3d(tc.POSITION_LON_LAT_ALT),
+    "r": _write_roadmap,
+}
+
+
+class PackingPlan:
+    """
+    Compiled form of a format string such as "tsss" or "tssssssssiB".
+
+    A leading "t" packs the values as compound object. Each remaining format
+    character is mapped to one writer that appends the value to a bytearray.
+    """
+
+    def __init__(self, _format):
+        self.format = _format
+        self.compound = _format.startswith("t")
+        fields = _format[1:] if self.compound else _format
+        self.prefix = _TYPED_INT.pack(tc.TYPE_COMPOUND, len(fields)) if self.compound else b""
+        self.size = len(fields)
+        self.writers = tuple(_WRITERS.get(f, _write_nothing) for f in fields)
+
+    def write(self, buf, values):
+        if self.compound:
+            if self.size != len(values):
+                raise ValueError(
+                    f"Format {self.format} expects {self.size} values, got {len(values)}."
+                )
+            buf += self.prefix
+        for writer, v in zip(self.writers, values):
+            writer(buf, v)
+        return buf
+
+
+_PLANS = {}
+
+
+def compile_format(_format):
+    """Return the cached PackingPlan of _format (compiled on first use)."""
+    try:
+        return _PLANS[_format]
+    except KeyError:
+        plan = _PLANS[_format] = PackingPlan(_format)
+        return plan
+
+
+def pack_into(buf, _format, *values):
+    """Append values packed according to _format to the bytearray buf."""
+    if _format == "packet":
+        buf += values[0]
+        return buf
+    return compile_format(_format).write(buf, values)
+
+
+def begin_cmd(buf, cmd_id, var_id, obj_id):
+    """
+    Start a command at the end of buf and return its start offset.
+
+    Room for the long header is reserved. finish_cmd fills in the header once
+    the size of the command is known.
+    """
+    start = len(buf)
+    buf += _LONG_HEADER.pack(0, 0, cmd_id)
+    if var_id is not None:
+        if isinstance(var_id, tuple):  # begin and end of a subscription
+            buf += _DOUBLE_PAIR.pack(*var_id)
+        else:
+            buf += _UBYTE.pack(var_id)
+        buf += _INT.pack(len(obj_id))
+        buf += obj_id.encode("latin1")
+    return start
+
+
+def finish_cmd(buf, start):
+    """Write the length header of the command that starts at offset start."""
+    length = len(buf) - start - _LONG_HEADER_SIZE + _SHORT_HEADER_SIZE
+    if length <= 255:
+        # short header: drop the unused bytes of the reserved long header
+        cmd_id = buf[start + _LONG_HEADER_SIZE - 1]
+        del buf[start : start + _LONG_HEADER_SIZE - _SHORT_HEADER_SIZE]
+        _SHORT_HEADER.pack_into(buf, start, length, cmd_id)
+    else:
+        _INT.pack_into(buf, start + 1, length + 4)
+    return buf
+
+
+def write_cmd(buf, cmd_id, var_id, obj_id, _format="", *values):
+    """Append a complete command to the bytearray buf."""
+    start = begin_cmd(buf, cmd_id, var_id, obj_id)
+    pack_into(buf, _format, *values)
+    return finish_cmd(buf, start)
@@ -0,0 +1,56 @@
+import struct
+
+_LENGTH = struct.Struct("!i")
+
+
+class MessageReader:
+    """
+    Buffered reader for length-prefixed TraCI messages.
+
+    Each message is received with socket.recv_into directly into one reusable
+    bytearray. The buffer only grows if a message does not fit. A new buffer is
+    allocated in that case (instead of resizing) because views on the old buffer
+    may still be exported.
+
+    The memoryview returned by read_message points into the shared buffer and is
+    only valid until the next message is read.
+    """
+
+    def __init__(self, _socket, initial_size=64 * 1024):
+        self.socket = _socket
+        self._header = bytearray(_LENGTH.size)
+        self._buffer = bytearray(initial_size)
+
+    @property
+    def capacity(self):
+        return len(self._buffer)
+
+    def _recv_into(self, view):
+        received = 0
+        length = len(view)
+        while received < length:
+            n = self.socket.recv_into(view[received:])
+            if n == 0:
+                return False
+            received += n
+        return True
+
+    def _reserve(self, length):
+        if length > len(self._buffer):
+            self._buffer = bytearray(max(length, 2 * len(self._buffer)))
+
+    def read_message(self):
+        """
+        Read one message and return its content (without the length header) as
+        memoryview. Returns None if the connection was closed.
+        """
+        if not self._recv_into(memoryview(self._header)):
+            return None
+        length = _LENGTH.unpack(self._header)[0] - _LENGTH.size
+        if length < 0:
+            raise ValueError(f"Invalid message length {length + _LENGTH.size}.")
+        self._reserve(length)
+        view = memoryview(self._buffer)[:length]
+        if not self._recv_into(view):
+            return None
+        return view
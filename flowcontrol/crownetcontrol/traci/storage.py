@@ -22,15 +22,51 @@
 from __future__ import print_function
 from __future__ import absolute_import
 import struct
+
+import numpy as np
+
 from flowcontrol.crownetcontrol.traci import constants_vadere as tc
 
 _DEBUG = False
 
+# precompiled formats, shared by all Storage instances
+_STRUCTS = {}
+_UBYTE = struct.Struct("!B")
+_INT = struct.Struct("!i")
+_DOUBLE = struct.Struct("!d")
+_TYPED_INT = struct.Struct("!Bi")
+_TYPED_DOUBLE = struct.Struct("!Bd")
+_POSITION_2D = struct.Struct("!dd")
+_POSITION_3D = struct.Struct("!ddd")
+_BYTE = struct.Struct("!b")
+_COLOR = struct.Struct("!BBBB")
+
+
+def _compiled(format):
+    """Return the cached struct.Struct for format (compiled on first use)."""
+    try:
+        return _STRUCTS[format]
+    except KeyError:
+        compiled = _STRUCTS[format] = struct.Struct(format)
+        return compiled
+
 
 class Storage:
-    def __init__(self, content):
-        self._content = content
+    """
+    Reader for TraCI messages.
+
+    The content is wrapped in a memoryview and all values are decoded in place
+    with struct.unpack_from. No intermediate bytes objects are created while
+    reading, except for strings which are decoded directly from the view.
+
+    In array mode (opt-in) the list readers return numpy arrays decoded in one
+    step from the underlying buffer instead of tuples of Python objects.
+    """
+
+    def __init__(self, content, array_mode=False):
+        self._content = memoryview(content).cast("B")
         self._pos = 0
+        self.array_mode = array_mode
 
     @property
     def empty(self):
@@ -62,39 +98,79 @@ class Storage:
         }
         return status_dict
 
+    def peek_cmd_id(self):
+        """command id of the next command without moving the read position"""
+        oldPos = self._pos
+        self.readLength()
+        cmd_id = self._unpack(_UBYTE)[0]
+        self._pos = oldPos
+        return cmd_id
+
+    def skip_cmd(self):
+        oldPos = self._pos
+        self._pos = oldPos + self.readLength()
+
     def read(self, format):
+        compiled = _compiled(format)
+        oldPos = self._pos
+        self._pos += compiled.size
+        return compiled.unpack_from(self._content, oldPos)
+
+    def _unpack(self, compiled):
         oldPos = self._pos
-        self._pos += struct.calcsize(format)
-        return struct.unpack(format, self._content[oldPos : self._pos])
+        self._pos += compiled.size
+        return compiled.unpack_from(self._content, oldPos)
+
+    def readUnsignedByte(self):
+        try:
+            value = self._content[self._pos]
+        except IndexError:
+            raise struct.error(
+                "unpack_from requires a buffer of at least %d bytes" % (self._pos + 1)
+            ) from None
+        self._pos += 1
+        return value
+
+    def readByte(self):
+        return self._unpack(_BYTE)[0]
+
+    def readColor(self):
+        return self._unpack(_COLOR)
 
     def readInt(self):
-        return self.read("!i")[0]
+        return self._unpack(_INT)[0]
 
     def readTypedInt(self):
-        t, i = self.read("!Bi")
+        t, i = self._unpack(_TYPED_INT)
         assert t == tc.TYPE_INTEGER
         return i
 
     def readDouble(self):
-        return self.read("!d")[0]
+        return self._unpack(_DOUBLE)[0]
 
     def readTypedDouble(self):
-        t, d = self.read("!Bd")
+        t, d = self._unpack(_TYPED_DOUBLE)
         assert t == tc.TYPE_DOUBLE
         return d
 
     def readLength(self):
-        length = self.read("!B")[0]
+        length = self._unpack(_UBYTE)[0]
         if length > 0:
             return length
-        return self.read("!i")[0]
+        return self._unpack(_INT)[0]
 
     def readString(self):
-        length = self.read("!i")[0]
-        return str(self.read("!%ss" % length)[0].decode("latin1"))
+        length = self._unpack(_INT)[0]
+        oldPos = self._pos
+        self._pos += length
+        if length < 0 or self._pos > len(self._content):
+            raise struct.error(
+                "unpack_from requires a buffer of at least %d bytes" % self._pos
+            )
+        return str(self._content[oldPos : self._pos], "latin1")
 
     def readTypedString(self):
-        t = self.read("!B")[0]
+        t = self._unpack(_UBYTE)[0]
         assert t == tc.TYPE_STRING, "expected TYPE_STRING (%02x), found %02x." % (
             tc.TYPE_STRING,
             t,
@@ -102,39 +178,99 @@ class Storage:
         return self.readString()
 
     def readStringList(self):
-        n = self.read("!i")[0]
-        return tuple([self.readString() for i in range(n)])
+        n = self._unpack(_INT)[0]
+        content = self._content
+        pos = self._pos
+        values = []
+        for _ in range(n):
+            length = _INT.unpack_from(content, pos)[0]
+            pos += 4
+            if length < 0 or pos + length > len(content):
+                raise struct.error(
+                    "unpack_from requires a buffer of at least %d bytes" % (pos + length)
+                )
+            values.append(str(content[pos : pos + length], "latin1"))
+            pos += length
+        self._pos = pos
+        return tuple(values)
 
     def readTypedStringList(self):
-        t = self.read("!B")[0]
+        t = self._unpack(_UBYTE)[0]
         assert t == tc.TYPE_STRINGLIST
         return self.readStringList()
 
+    def _readDoubles(self, n):
+        # one unpack for the whole list instead of one per element
+        oldPos = self._pos
+        self._pos += 8 * n
+        return struct.unpack_from("!%dd" % n, self._content, oldPos)
+
+    def _readArray(self, dtype, n):
+        # same errors as the tuple path (struct.unpack_from), count=-1 would read the rest
+        if n < 0:
+            raise struct.error("negative list length %d" % n)
+        end = self._pos + np.dtype(dtype).itemsize * n
+        if end > len(self._content):
+            raise struct.error("unpack_from requires a buffer of at least %d bytes" % end)
+        # big-endian view on the buffer, converted to a native array (copy)
+        array = np.frombuffer(self._content, dtype=dtype, count=n, offset=self._pos)
+        self._pos += array.nbytes
+        return array.astype(array.dtype.newbyteorder("="))
+
     def readDoubleList(self):
-        n = self.read("!i")[0]
-        return tuple([self.readDouble() for i in range(n)])
+        if self.array_mode:
+            return self.readDoubleArray()
+        n = self._unpack(_INT)[0]
+        return self._readDoubles(n)
+
+    def readDoubleArray(self):
+        n = self._unpack(_INT)[0]
+        return self._readArray(">f8", n)
 
     def read2DPosition(self):
-        return self.read("!dd")
+        return self._unpack(_POSITION_2D)
 
     def read3DPosition(self):
-        return self.read("!ddd")
+        return self._unpack(_POSITION_3D)
 
     def read2DPositionList(self):
-        n = self.read("!i")[0]
-        return tuple([self.read2DPosition() for i in range(n)])
+        if self.array_mode:
+            return self.read2DPositionArray()
+        n = self._unpack(_INT)[0]
+        values = self._readDoubles(2 * n)
+        return tuple(zip(values[0::2], values[1::2]))
+
+    def read2DPositionArray(self):
+        n = self._unpack(_INT)[0]
+        return self._readArray(">f8", 2 * n).reshape(n, 2)
 
     def read3DPositionList(self):
-        n = self.read("!i")[0]
-        return tuple([self.read3DPosition() for i in range(n)])
+        if self.array_mode:
+            return self.read3DPositionArray()
+        n = self._unpack(_INT)[0]
+        values = self._readDoubles(3 * n)
+        return tuple(zip(values[0::3], values[1::3], values[2::3]))
+
+    def read3DPositionArray(self):
+        n = self._unpack(_INT)[0]
+        return self._readArray(">f8", 3 * n).reshape(n, 3)
 
     def readIntegerList(self):
-        n = self.read("!i")[0]
-        return tuple([self.readInt() for i in range(n)])
+        if self.array_mode:
+            return self.readIntegerArray()
+        n = self._unpack(_INT)[0]
+        oldPos = self._pos
+        self._pos += 4 * n
+        return struct.unpack_from("!%di" % n, self._content, oldPos)
+
+    def readIntegerArray(self):
+        n = self._unpack(_INT)[0]
+        return self._readArray(">i4", n)
 
     def readShape(self):
         length = self.readLength()
-        return tuple([self.read("!dd") for i in range(length)])
+        values = self._readDoubles(2 * length)
+        return tuple(zip(values[0::2], values[1::2]))
 
     def ready(self):
         return self._pos < len(self._content)
@@ -142,16 +278,16 @@ class Storage:
     def printDebug(self):
         if _DEBUG:
             for char in self._content[self._pos :]:
-                print("%03i %02x %s" % (ord(char), ord(char), char))
+                print("%03i %02x %s" % (char, char, chr(char)))
 
     def readCompound(self, expectedSize=None):
         #TODO: ask Stefan why this was necessary
-        t, s = self.read("!Bi")
+        t, s = self._unpack(_TYPED_INT)
         assert t == tc.TYPE_COMPOUND
         assert expectedSize is None or s == expectedSize
         return s
 
 
 class SingleCommand(Storage):
-    def __init__(self, content):
-        super().__init__(content)
+    def __init__(self, content, array_mode=False):
+        super().__init__(content, array_mode)
@@ -0,0 +1,300 @@
+import asyncio
+import os
+import struct
+import tempfile
+from unittest import IsolatedAsyncioTestCase
+
+from flowcontrol.crownetcontrol.controller import Controller
+from flowcontrol.crownetcontrol.state.state_listener import VadereDefaultStateListener
+from flowcontrol.crownetcontrol.traci import constants_vadere as tc
+from flowcontrol.crownetcontrol.traci.async_connection import AsyncTraCIConnection
+from flowcontrol.crownetcontrol.traci.connection import Connection
+from flowcontrol.crownetcontrol.traci.connection_manager import (
+    AsyncClientModeConnection,
+    SimulationConfig,
+)
+from flowcontrol.crownetcontrol.traci.exceptions import FatalTraCIError
+from flowcontrol.crownetcontrol.traci.storage import Storage
+
+
+def _typed(value):
+    if isinstance(value, float):
+        return struct.pack("!Bd", tc.TYPE_DOUBLE, value)
+    return struct.pack("!Bi", tc.TYPE_STRINGLIST, 0)  # no pedestrians
+
+
+def _subscription_response(cmd_id, obj_id, values):
+    """variable subscription response of the subscribe command cmd_id with values {var_id: value}"""
+    cmd = struct.pack("!Bi", cmd_id + 16, len(obj_id)) + obj_id.encode("latin1")
+    cmd += struct.pack("!B", len(values))
+    for var_id, value in values.items():
+        cmd += struct.pack("!BB", var_id, 0) + _typed(value)
+    return struct.pack("!B", len(cmd) + 1) + cmd
+
+
+def _read_subscribe(storage):
+    """object id and variable ids of a subscribe command"""
+    storage.read("!dd")
+    obj_id = storage.readString()
+    return obj_id, list(storage.read(f"!{storage.read('!B')[0]}B"))
+
+
+def _answer(message):
+    """
+    status OK for every command, value 1.5 for get commands and subscribed
+    variables, no subscriptions for sim steps
+    """
+    storage = Storage(message)
+    response = bytearray()
+    while storage.ready():
+        start = storage._pos
+        length = storage.readLength()
+        cmd_id = storage.read("!B")[0]
+        response += Connection.res_ok(cmd_id)
+        if cmd_id == tc.CMD_GET_V_SIM_VARIABLE:
+            var_id = storage.read("!B")[0]
+            obj_id = storage.readString()
+            response += Connection().build_cmd(cmd_id + 16, var_id, obj_id, "d", 1.5)
+        elif cmd_id == tc.CMD_SUBSCRIBE_V_PERSON_VARIABLE:
+            obj_id, var_ids = _read_subscribe(storage)
+            if var_ids:
+                response += _subscription_response(cmd_id, obj_id, dict.fromkeys(var_ids, 1.5))
+        elif cmd_id == tc.CMD_SIMSTEP:
+            response += struct.pack("!i", 0)
+        storage._pos = start + length
+    return bytes(response)
+
+
+class FakeServer:
+
+    def __init__(self, delay=0.0, answer=_answer):
+        self.delay = delay
+        self.answer = answer
+        self.messages = []
+
+    async def handle(self, reader, writer):
+        try:
+            while True:
+                header = await reader.readexactly(4)
+                message = await reader.readexactly(struct.unpack("!i", header)[0] - 4)
+                self.messages.append(message)
+                await asyncio.sleep(self.delay)
+                response = self.answer(message)
+                writer.write(struct.pack("!i", len(response) + 4) + response)
+                await writer.drain()
+        except asyncio.IncompleteReadError:
+            writer.close()
+            await writer.wait_closed()
+
+    async def start(self):
+        self.server = await asyncio.start_server(self.handle, "127.0.0.1", 0)
+        return self.server.sockets[0].getsockname()[1]
+
+
+class TestAsyncTraCIConnection(IsolatedAsyncioTestCase):
+
+    async def asyncSetUp(self):
+        self.server = FakeServer()
+        port = await self.server.start()
+        self.connection = await AsyncTraCIConnection.open("127.0.0.1", port)
+
+    async def asyncTearDown(self):
+        self.connection._stream_writer.close()
+        await self.connection._stream_writer.wait_closed()
+        self.server.server.close()
+        await self.server.server.wait_closed()
+
+    async def test__get_and_set(self):
+        assert await self.connection.v_simulation.get(tc.VAR_TIME) == 1.5
+        assert await self.connection.v_person.set(tc.VAR_TARGET_LIST, "1", "l", ["2"]) is None
+        assert len(self.server.messages) == 2
+
+    async def test__batch(self):
+        async with self.connection.batch() as batch:
+            for ped_id in ["1", "2", "3"]:
+                await self.connection.v_person.set(tc.VAR_TARGET_LIST, ped_id, "l", ["2"])
+        assert len(self.server.messages) == 1
+        assert len(batch.statuses) == 3 and batch.ok
+
+    async def test__get_not_allowed_in_batch(self):
+        with self.assertRaises(FatalTraCIError):
+            async with self.connection.batch():
+                await self.connection.v_simulation.get(tc.VAR_TIME)
+        assert len(self.connection._queue) == 0
+        assert self.server.messages == []
+
+    async def test__bulk_set(self):
+        status = await self.connection.v_person.set_bulk(tc.VAR_SPEED, "d", {"1": 1.0, "2": 0.5})
+        assert list(status.keys()) == ["1", "2"]
+        assert len(self.server.messages) == 1
+
+    async def test__bulk_subscribe(self):
+        await self.connection.v_person.subscribe_bulk(["1", "2"], [tc.VAR_SPEED])
+        await self.connection.v_person.unsubscribe_bulk(["3"])
+        assert len(self.server.messages) == 2
+
+    async def test__concurrent_tasks_are_serialized(self):
+        async def set_targets(ped_id):
+            async with self.connection.batch() as batch:
+                await self.connection.v_person.set(tc.VAR_TARGET_LIST, ped_id, "l", ["2"])
+                await asyncio.sleep(0)
+                await self.connection.v_person.set(tc.VAR_TARGET_LIST, ped_id, "l", ["3"])
+            return batch
+
+        batches = await asyncio.gather(
+            set_targets("1"), set_targets("2"), self.connection.v_simulation.get(tc.VAR_TIME)
+        )
+        assert [len(b.statuses) for b in batches[:2]] == [2, 2]
+        assert batches[2] == 1.5
+        assert len(self.server.messages) == 3
+
+    async def test__subscription_stream(self):
+        times = []
+        async for sim_time, results in self.connection.subscription_stream([0.4, 0.8]):
+            times.append(sim_time)
+            assert results is self.connection.subscriptionMapping
+        assert times == [0.4, 0.8]
+
+
+class TestSeveralSimulations(IsolatedAsyncioTestCase):
+
+    async def test__steps_overlap(self):
+        delay = 0.2
+        servers = [FakeServer(delay), FakeServer(delay)]
+        ports = [await s.start() for s in servers]
+        connections = [await AsyncTraCIConnection.open("127.0.0.1", p) for p in ports]
+
+        loop = asyncio.get_running_loop()
+        start = loop.time()
+        await asyncio.gather(*[c.simulation_step(0.4) for c in connections])
+        elapsed = loop.time() - start
+
+        assert elapsed < 2 * delay
+        for c, s in zip(connections, servers):
+            c._stream_writer.close()
+            await c._stream_writer.wait_closed()
+            s.server.close()
+            await s.server.wait_closed()
+
+
+class FakeVadere:
+    """answers of a simulation without pedestrians, the second simulation step ends it"""
+
+    def __init__(self, output_dir, step_size=0.4):
+        self.output_dir = output_dir
+        self.step_size = step_size
+        self.time = 0.0
+        self.steps = 0
+        self.subscriptions = {}
+        self.commands = []
+
+    def _subscription(self, cmd_id, obj_id, var_ids):
+        values = {
+            tc.VAR_TIME: self.time,
+            tc.VAR_ID_LIST: [],
+            tc.VAR_DEPARTED_PEDESTRIAN_IDS: [],
+            tc.VAR_ARRIVED_PEDESTRIAN_PEDESTRIAN_IDS: [],
+        }
+        return _subscription_response(cmd_id, obj_id, {v: values[v] for v in var_ids})
+
+    def answer(self, message):
+        storage = Storage(message)
+        response = bytearray()
+        while storage.ready():
+            start = storage._pos
+            length = storage.readLength()
+            cmd_id = storage.read("!B")[0]
+            self.commands.append(cmd_id)
+            if cmd_id == tc.CMD_GET_V_SIM_VARIABLE:
+                var_id = storage.read("!B")[0]
+                obj_id = storage.readString()
+                if var_id == tc.VAR_OUTPUT_DIR:
+                    value = ("s", os.path.join(self.output_dir, "vadere.d"))
+                elif var_id == tc.VAR_DELTA_T:
+                    value = ("d", self.step_size)
+                else:
+                    value = ("d", self.time)
+                response += Connection.res_ok(cmd_id)
+                response += Connection().build_cmd(cmd_id + 16, var_id, obj_id, *value)
+            elif cmd_id in (tc.CMD_SUBSCRIBE_V_SIM_VARIABLE, tc.CMD_SUBSCRIBE_V_PERSON_VARIABLE):
+                obj_id, var_ids = _read_subscribe(storage)
+                self.subscriptions[(cmd_id, obj_id)] = var_ids
+                response += Connection.res_ok(cmd_id) + self._subscription(cmd_id, obj_id, var_ids)
+            elif cmd_id == tc.CMD_SIMSTEP:
+                self.steps += 1
+                if self.steps > 1:
+                    response += Connection.res_err(cmd_id, "Simulation end reached.")
+                else:
+                    self.time = storage.read("!d")[0]
+                    response += Connection.res_ok(cmd_id)
+                    response += struct.pack("!i", len(self.subscriptions))
+                    for (sub_id, obj_id), var_ids in self.subscriptions.items():
+                        response += self._subscription(sub_id, obj_id, var_ids)
+            else:
+                response += Connection.res_ok(cmd_id)
+            storage._pos = start + length
+        return bytes(response)
+
+
+class StepStub:
+    """time stepper: call the controller every step seconds"""
+
+    def __init__(self, step):
+        self.step = step
+        self.time = step
+
+    def get_time(self):
+        return self.time
+
+
+class RecordingController(Controller):
+
+    def __init__(self):
+        super().__init__(time_stepper=StepStub(0.4))
+        self.calls = []
+
+    async def handle_init(self, sim_time, sim_state):
+        self.calls.append(("init", sim_time))
+
+    async def handle_sim_step(self, sim_time, sim_state):
+        self.calls.append(("step", sim_time))
+        self.time_stepper.time = sim_time + self.time_stepper.step
+
+
+class TestAsyncClientModeConnection(IsolatedAsyncioTestCase):
+
+    async def asyncSetUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        scenario = os.path.join(self.tmp_dir.name, "test.scenario")
+        with open(scenario, "w") as f:
+            f.write("{}")
+        self.vadere = FakeVadere(self.tmp_dir.name)
+        self.server = FakeServer(answer=self.vadere.answer)
+        port = await self.server.start()
+
+        self.controller = RecordingController()
+        self.manager = AsyncClientModeConnection(
+            self.controller, port=port, sim_cfg=SimulationConfig(scenario, self.tmp_dir.name, "test", None)
+        )
+        self.controller.initialize_connection(self.manager)
+        self.listener = VadereDefaultStateListener.with_vars("default", {}, init_sub=True)
+        self.manager.register_state_listener("default", self.listener, set_default=True)
+
+    async def asyncTearDown(self):
+        await self.manager.traci.close()
+        self.server.server.close()
+        await self.server.server.wait_closed()
+        self.tmp_dir.cleanup()
+
+    async def test__start(self):
+        await self.manager.start()
+
+        assert self.controller.calls == [("init", 0.0), ("step", 0.8)]
+        assert self.controller.output_dir == os.path.join(self.tmp_dir.name, "flowcontrol.d")
+        assert self.vadere.commands[:2] == [tc.CMD_SET_V_SIM_VARIABLE, tc.CMD_FILE_SEND]
+        assert set(self.vadere.subscriptions) == {
+            (tc.CMD_SUBSCRIBE_V_SIM_VARIABLE, ""),
+            (tc.CMD_SUBSCRIBE_V_PERSON_VARIABLE, ""),
+        }
+        assert self.vadere.steps == 2
+        assert self.listener.time == 0.8
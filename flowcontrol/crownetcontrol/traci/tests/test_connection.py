@@ -0,0 +1,302 @@
+import socket
+import struct
+import threading
+from unittest import TestCase
+
+import numpy as np
+
+from flowcontrol.crownetcontrol.state.state_listener import VadereDefaultStateListener
+from flowcontrol.crownetcontrol.traci import constants_vadere as tc
+from flowcontrol.crownetcontrol.traci.connection import BaseTraCIConnection, Connection
+from flowcontrol.crownetcontrol.traci.domains.VadereControlDomain import VadereControlCommandApi
+from flowcontrol.crownetcontrol.traci.domains.VaderePersonDomain import VaderePersonDomain
+from flowcontrol.crownetcontrol.traci.domains.VadereSimulationDomain import VadereSimulationDomain
+from flowcontrol.crownetcontrol.traci.exceptions import TraCIException, FatalTraCIError
+from flowcontrol.crownetcontrol.traci.reader import MessageReader
+from flowcontrol.crownetcontrol.traci.storage import Storage
+
+
+class FakeServer:
+    """answer each received message with the next prepared response"""
+
+    def __init__(self, _socket, responses):
+        self._socket = _socket
+        self.responses = list(responses)
+        self.received = []
+        self._thread = threading.Thread(target=self._run)
+        self._thread.start()
+
+    def _run(self):
+        reader = MessageReader(self._socket)
+        for response in self.responses:
+            message = reader.read_message()
+            if message is None:
+                return
+            self.received.append(bytes(message))
+            self._socket.sendall(struct.pack("!i", len(response) + 4) + response)
+
+    def join(self):
+        self._thread.join(timeout=5)
+
+
+def commands(message):
+    storage = Storage(message)
+    cmd_ids = []
+    while storage.ready():
+        cmd_ids.append(storage.peek_cmd_id())
+        storage.skip_cmd()
+    return cmd_ids
+
+
+class ConnectionTestCase(TestCase):
+
+    def setUp(self):
+        self.client, self.server_socket = socket.socketpair()
+        self.connection = BaseTraCIConnection(
+            self.client, default_domains=[VaderePersonDomain(), VadereSimulationDomain()]
+        )
+
+    def tearDown(self):
+        self.client.close()
+        self.server_socket.close()
+
+    def serve(self, *responses):
+        return FakeServer(self.server_socket, responses)
+
+
+class TestBatch(ConnectionTestCase):
+
+    def test__commands_are_sent_in_one_message(self):
+        cmd = tc.CMD_SET_V_PERSON_VARIABLE
+        server = self.serve(Connection.res_ok(cmd) * 3)
+
+        with self.connection.batch() as batch:
+            for ped_id in ["1", "2", "3"]:
+                assert self.connection.v_person.set_target_list(ped_id, ["2"]) is None
+        server.join()
+
+        assert len(server.received) == 1
+        assert commands(server.received[0]) == [cmd, cmd, cmd]
+        assert len(batch.statuses) == 3
+        assert batch.ok
+        assert not self.connection.in_batch
+
+    def test__nested_batch_joins_outer_batch(self):
+        cmd = tc.CMD_SET_V_PERSON_VARIABLE
+        server = self.serve(Connection.res_ok(cmd) * 2)
+
+        with self.connection.batch() as outer:
+            self.connection.v_person.set_free_flow_speed("1", 1.0)
+            with self.connection.batch() as inner:
+                self.connection.v_person.set_free_flow_speed("2", 1.0)
+        server.join()
+
+        assert inner is outer
+        assert len(server.received) == 1
+        assert len(outer.statuses) == 2
+
+    def test__all_statuses_are_read_before_raising(self):
+        cmd = tc.CMD_SET_V_PERSON_VARIABLE
+        response = Connection.res_ok(cmd) + Connection.res_err(cmd, "unknown id") + Connection.res_ok(cmd)
+        server = self.serve(response)
+
+        with self.assertRaises(TraCIException):
+            with self.connection.batch():
+                for ped_id in ["1", "2", "3"]:
+                    self.connection.v_person.set_target_list(ped_id, ["2"])
+        server.join()
+
+    def test__errors_without_raising(self):
+        cmd = tc.CMD_SET_V_PERSON_VARIABLE
+        server = self.serve(Connection.res_err(cmd, "unknown id") + Connection.res_ok(cmd))
+
+        with self.connection.batch(raise_on_error=False) as batch:
+            self.connection.v_person.set_target_list("1", ["2"])
+            self.connection.v_person.set_target_list("2", ["2"])
+        server.join()
+
+        assert not batch.ok
+        assert [s["err"] for s in batch.statuses] == ["unknown id", ""]
+
+    def test__response_data_is_skipped(self):
+        cmd = tc.CMD_SET_V_PERSON_VARIABLE
+        data = Connection().build_cmd(cmd + 16, tc.VAR_SPEED, "1", "d", 1.0)
+        server = self.serve(Connection.res_ok(cmd) + bytes(data) + Connection.res_ok(cmd))
+
+        with self.connection.batch() as batch:
+            # set commands are answered without data unless stated otherwise
+            self.connection.send_cmd(cmd, tc.VAR_SPEED, "1", "d", 1.0, data_response=True)
+            self.connection.v_person.set_free_flow_speed("2", 1.0)
+        server.join()
+
+        assert len(batch.statuses) == 2
+
+    def test__get_command_not_allowed(self):
+        with self.assertRaises(FatalTraCIError):
+            with self.connection.batch():
+                self.connection.v_person.get_target_list("1")
+        assert len(self.connection._queue) == 0
+
+    def test__density_map_not_allowed(self):
+        with self.assertRaises(FatalTraCIError):
+            with self.connection.batch():
+                self.connection.v_simulation.get_density_map("1")
+        assert len(self.connection._queue) == 0
+
+    def test__sim_step_not_allowed(self):
+        VadereControlCommandApi().register(self.connection)
+        with self.assertRaises(FatalTraCIError):
+            with self.connection.batch():
+                self.connection.vCtrl.sim_step(1.0)
+        with self.assertRaises(FatalTraCIError):
+            with self.connection.batch():
+                self.connection.vCtrl.sim_state()
+        assert len(self.connection._queue) == 0
+
+    def test__context_subscription_not_allowed(self):
+        with self.assertRaises(FatalTraCIError):
+            with self.connection.batch():
+                self.connection.v_person.subscribeContext(
+                    "1", tc.CMD_GET_V_PERSON_VARIABLE, 5.0, [tc.VAR_POSITION]
+                )
+        assert len(self.connection._queue) == 0
+
+    def test__empty_batch_sends_nothing(self):
+        with self.connection.batch() as batch:
+            pass
+        assert batch.statuses == []
+
+
+class TestBulkSetters(ConnectionTestCase):
+
+    def test__set_target_lists_from_mapping(self):
+        cmd = tc.CMD_SET_V_PERSON_VARIABLE
+        server = self.serve(Connection.res_ok(cmd) + Connection.res_err(cmd, "unknown id"))
+
+        status = self.connection.v_person.set_target_lists({"1": ["2"], "5": ["3"]})
+        server.join()
+
+        assert len(server.received) == 1
+        assert commands(server.received[0]) == [cmd, cmd]
+        assert list(status.keys()) == ["1", "5"]
+        assert status["1"]["result"] == tc.RTYPE_OK
+        assert status["5"]["err"] == "unknown id"
+
+    def test__set_positions_from_arrays(self):
+        cmd = tc.CMD_SET_V_PERSON_VARIABLE
+        server = self.serve(Connection.res_ok(cmd) * 3)
+
+        positions = np.array([[0.0, 1.0], [2.0, 3.0], [4.0, 5.0]])
+        status = self.connection.v_person.set_positions2_d(np.array([1, 2, 3]), positions)
+        server.join()
+
+        expected = b"".join(
+            bytes(Connection().build_cmd(cmd, tc.VAR_POSITION, str(i + 1), "o", p))
+            for i, p in enumerate(positions.tolist())
+        )
+        assert server.received[0] == expected
+        assert list(status.keys()) == ["1", "2", "3"]
+
+    def test__ids_and_values_must_match(self):
+        with self.assertRaises(ValueError):
+            self.connection.v_person.set_free_flow_speeds(["1", "2"], [1.0])
+
+    def test__bulk_inside_batch(self):
+        cmd = tc.CMD_SET_V_PERSON_VARIABLE
+        server = self.serve(Connection.res_ok(cmd) * 3)
+
+        with self.connection.batch() as batch:
+            assert self.connection.v_person.set_free_flow_speeds({"1": 1.0, "2": 1.2}) is None
+            self.connection.v_person.set_next_target_list_index("3", 1)
+        server.join()
+
+        assert len(server.received) == 1
+        assert len(batch.statuses) == 3
+
+
+def speed_response(ped_id, speed):
+    """variable subscription response with the speed of ped_id"""
+    cmd = struct.pack("!Bi", tc.RESPONSE_SUBSCRIBE_V_PERSON_VARIABLE, len(ped_id)) + ped_id.encode("latin1")
+    cmd += struct.pack("!BBBBd", 1, tc.VAR_SPEED, 0, tc.TYPE_DOUBLE, speed)
+    return struct.pack("!B", len(cmd) + 1) + cmd
+
+
+class TestBulkSubscription(ConnectionTestCase):
+
+    def test__subscribe_in_one_message(self):
+        cmd = tc.CMD_SUBSCRIBE_V_PERSON_VARIABLE
+        response = Connection.res_ok(cmd) + speed_response("1", 1.0)
+        response += Connection.res_ok(cmd) + speed_response("2", 1.5)
+        server = self.serve(response)
+
+        self.connection.v_person.subscribeBulk(["1", "2"], [tc.VAR_SPEED])
+        server.join()
+
+        assert len(server.received) == 1
+        assert commands(server.received[0]) == [cmd, cmd]
+        assert self.connection.v_person.getAllSubscriptionResults() == {
+            "1": {tc.VAR_SPEED: 1.0},
+            "2": {tc.VAR_SPEED: 1.5},
+        }
+
+    def test__set_and_subscribe_in_one_batch(self):
+        # the set command id + 16 is the subscribe command id, its status is not set data
+        set_cmd, sub_cmd = tc.CMD_SET_V_PERSON_VARIABLE, tc.CMD_SUBSCRIBE_V_PERSON_VARIABLE
+        response = Connection.res_ok(set_cmd) + Connection.res_ok(sub_cmd) + speed_response("7", 1.2)
+        response += Connection.res_ok(set_cmd) + Connection.res_ok(sub_cmd)
+        server = self.serve(response)
+
+        with self.connection.batch() as batch:
+            self.connection.v_person.set_target_list("1", ["2"])
+            self.connection.v_person.subscribe("7", [tc.VAR_SPEED])
+            self.connection.v_person.set_target_list("7", ["2"])
+            self.connection.v_person.unsubscribe("8")
+        server.join()
+
+        assert commands(server.received[0]) == [set_cmd, sub_cmd, set_cmd, sub_cmd]
+        assert len(batch.statuses) == 4 and batch.ok
+        assert self.connection.v_person.getSubscriptionResults("7") == {tc.VAR_SPEED: 1.2}
+
+    def test__listener_upkeep(self):
+        cmd = tc.CMD_SUBSCRIBE_V_PERSON_VARIABLE
+        response = Connection.res_ok(cmd) + speed_response("3", 1.0) + Connection.res_ok(cmd) * 2
+        server = self.serve(response)
+
+        listener = VadereDefaultStateListener.with_vars("default", {"speed": tc.VAR_SPEED})
+        listener.data["new_ped_ids"] = ["3"]
+        listener.data["removed_ped_ids"] = ["1", "2"]
+        listener.update_pedestrian_subscription(self.connection.v_person)
+        server.join()
+
+        assert len(server.received) == 1
+        assert commands(server.received[0]) == [cmd, cmd, cmd]
+
+    def test__listener_upkeep_in_control_batch(self):
+        set_cmd, sub_cmd = tc.CMD_SET_V_PERSON_VARIABLE, tc.CMD_SUBSCRIBE_V_PERSON_VARIABLE
+        response = Connection.res_ok(set_cmd) * 2
+        response += Connection.res_ok(sub_cmd) + speed_response("3", 1.0)
+        response += Connection.res_ok(sub_cmd) + speed_response("4", 1.3)
+        response += Connection.res_ok(sub_cmd)
+        server = self.serve(response)
+
+        listener = VadereDefaultStateListener.with_vars("default", {"speed": tc.VAR_SPEED})
+        listener.data["new_ped_ids"] = ["3", "4"]
+        listener.data["removed_ped_ids"] = ["1"]
+        with self.connection.batch() as batch:
+            for ped_id in ["1", "2"]:
+                self.connection.v_person.set_target_list(ped_id, ["2"])
+            listener.update_pedestrian_subscription(self.connection.v_person)
+        server.join()
+
+        assert len(server.received) == 1
+        assert commands(server.received[0]) == [set_cmd, set_cmd, sub_cmd, sub_cmd, sub_cmd]
+        assert len(batch.statuses) == 5 and batch.ok
+        assert self.connection.v_person.getAllSubscriptionResults() == {
+            "3": {tc.VAR_SPEED: 1.0},
+            "4": {tc.VAR_SPEED: 1.3},
+        }
+
+    def test__nothing_to_update(self):
+        listener = VadereDefaultStateListener.with_vars("default", {"speed": tc.VAR_SPEED})
+        listener.update_pedestrian_subscription(self.connection.v_person)
+        assert len(self.connection._queue) == 0
@@ -0,0 +1,79 @@
+import struct
+from unittest import TestCase
+
+from flowcontrol.crownetcontrol.traci import constants_vadere as tc
+from flowcontrol.crownetcontrol.traci import encoder
+from flowcontrol.crownetcontrol.traci.connection import Connection, WrappedTraCIConnection
+
+
+def _typed_string(value):
+    return struct.pack("!Bi", tc.TYPE_STRING, len(value)) + value.encode("latin1")
+
+
+class TestEncoder(TestCase):
+
+    def test__plan_is_cached(self):
+        assert encoder.compile_format("tsss") is encoder.compile_format("tsss")
+
+    def test__pack_compound(self):
+        expected = struct.pack("!Bi", tc.TYPE_COMPOUND, 3)
+        expected += _typed_string("a") + _typed_string("") + _typed_string("json")
+        assert Connection.pack("tsss", "a", "", "json") == expected
+
+    def test__pack_compound_wrong_number_of_values(self):
+        with self.assertRaises(ValueError):
+            Connection.pack("tss", "a")
+
+    def test__pack_scalars(self):
+        packed = Connection.pack("idDuBo", 1, 2.5, 3.0, 4, 5, (6.0, 7.0))
+        expected = struct.pack("!Bi", tc.TYPE_INTEGER, 1)
+        expected += struct.pack("!Bd", tc.TYPE_DOUBLE, 2.5)
+        expected += struct.pack("!d", 3.0)
+        expected += struct.pack("!B", 4)
+        expected += struct.pack("!BB", tc.TYPE_UBYTE, 5)
+        expected += struct.pack("!Bdd", tc.POSITION_2D, 6.0, 7.0)
+        assert packed == expected
+
+    def test__pack_lists(self):
+        packed = Connection.pack("lf", ["1", "22"], [1.0, 2.0])
+        expected = struct.pack("!Bi", tc.TYPE_STRINGLIST, 2)
+        expected += struct.pack("!i", 1) + b"1" + struct.pack("!i", 2) + b"22"
+        expected += struct.pack("!Bi2d", tc.TYPE_DOUBLELIST, 2, 1.0, 2.0)
+        assert packed == expected
+
+    def test__build_short_cmd(self):
+        cmd = Connection().build_cmd(tc.CMD_SET_V_PERSON_VARIABLE, tc.VAR_SPEED, "7", "d", 1.0)
+        body = struct.pack("!Bi", tc.VAR_SPEED, 1) + b"7" + struct.pack("!Bd", tc.TYPE_DOUBLE, 1.0)
+        assert bytes(cmd) == struct.pack("!BB", len(body) + 2, tc.CMD_SET_V_PERSON_VARIABLE) + body
+
+    def test__build_long_cmd(self):
+        message = "x" * 300
+        cmd = Connection().build_cmd(tc.CMD_SET_V_SIM_VARIABLE, tc.VAR_EXTERNAL_INPUT, "-2", "s", message)
+        body = struct.pack("!Bi", tc.VAR_EXTERNAL_INPUT, 2) + b"-2" + _typed_string(message)
+        assert bytes(cmd) == struct.pack("!BiB", 0, len(body) + 6, tc.CMD_SET_V_SIM_VARIABLE) + body
+
+    def test__build_subscription_cmd(self):
+        cmd = Connection().build_cmd(tc.CMD_SUBSCRIBE_V_PERSON_VARIABLE, (0.0, 1.0), "1", "uu", 1, tc.VAR_POSITION)
+        body = struct.pack("!ddi", 0.0, 1.0, 1) + b"1" + struct.pack("!BB", 1, tc.VAR_POSITION)
+        assert bytes(cmd) == struct.pack("!BB", len(body) + 2, tc.CMD_SUBSCRIBE_V_PERSON_VARIABLE) + body
+
+    def test__build_cmd_without_variable(self):
+        cmd = Connection().build_cmd(tc.CMD_SIMSTEP, None, None, "D", 2.0)
+        assert bytes(cmd) == struct.pack("!BBd", 10, tc.CMD_SIMSTEP, 2.0)
+
+    def test__wrapped_cmd(self):
+        connection = WrappedTraCIConnection(None)
+        for payload_size in (10, 300):
+            message = "x" * payload_size
+            inner = Connection().build_cmd(tc.CMD_SET_V_SIM_VARIABLE, tc.VAR_EXTERNAL_INPUT, "-2", "s", message)
+            expected = Connection().build_cmd(
+                tc.CMD_CONTROLLER, tc.VAR_REDIRECT, WrappedTraCIConnection.OPP, "packet", bytes(inner)
+            )
+            wrapped = connection.build_cmd(tc.CMD_SET_V_SIM_VARIABLE, tc.VAR_EXTERNAL_INPUT, "-2", "s", message)
+            assert bytes(wrapped) == bytes(expected)
+
+    def test__several_commands_in_one_buffer(self):
+        buf = bytearray()
+        encoder.write_cmd(buf, tc.CMD_SIMSTEP, None, None, "D", 1.0)
+        encoder.write_cmd(buf, tc.CMD_SIMSTEP, None, None, "D", 2.0)
+        assert bytes(buf) == struct.pack("!BBdBBd", 10, tc.CMD_SIMSTEP, 1.0, 10, tc.CMD_SIMSTEP, 2.0)
@@ -0,0 +1,65 @@
+import socket
+import struct
+import threading
+from unittest import TestCase
+
+from flowcontrol.crownetcontrol.traci.reader import MessageReader
+
+
+def _message(payload):
+    return struct.pack("!i", len(payload) + 4) + payload
+
+
+class TestMessageReader(TestCase):
+
+    def setUp(self):
+        self.sender, self.receiver = socket.socketpair()
+
+    def tearDown(self):
+        self.sender.close()
+        self.receiver.close()
+
+    def test__read_messages(self):
+        self.sender.sendall(_message(b"abc") + _message(b"") + _message(b"xy"))
+        reader = MessageReader(self.receiver)
+        assert bytes(reader.read_message()) == b"abc"
+        assert bytes(reader.read_message()) == b""
+        assert bytes(reader.read_message()) == b"xy"
+
+    def test__read_message_in_fragments(self):
+        data = _message(b"0123456789" * 100)
+
+        def send():
+            for i in range(0, len(data), 7):
+                self.sender.send(data[i : i + 7])
+
+        thread = threading.Thread(target=send)
+        thread.start()
+        message = MessageReader(self.receiver).read_message()
+        thread.join()
+        assert bytes(message) == b"0123456789" * 100
+
+    def test__buffer_grows_for_large_messages(self):
+        payload = bytes(range(256)) * 64
+        reader = MessageReader(self.receiver, initial_size=16)
+
+        thread = threading.Thread(target=self.sender.sendall, args=(_message(payload),))
+        thread.start()
+        message = reader.read_message()
+        thread.join()
+
+        assert bytes(message) == payload
+        assert reader.capacity >= len(payload)
+
+    def test__growing_keeps_previous_view(self):
+        reader = MessageReader(self.receiver, initial_size=4)
+        self.sender.sendall(_message(b"1234") + _message(b"123456789"))
+        first = reader.read_message()
+        second = reader.read_message()
+        assert bytes(first) == b"1234"
+        assert bytes(second) == b"123456789"
+
+    def test__connection_closed(self):
+        self.sender.sendall(struct.pack("!i", 10) + b"ab")
+        self.sender.close()
+        assert MessageReader(self.receiver).read_message() is None
@@ -0,0 +1,113 @@
+import struct
+from unittest import TestCase
+
+import numpy as np
+
+from flowcontrol.crownetcontrol.traci import constants_vadere as tc
+from flowcontrol.crownetcontrol.traci.storage import Storage
+
+
+def _string(value):
+    return struct.pack("!i", len(value)) + value.encode("latin1")
+
+
+class TestStorage(TestCase):
+
+    def test__read_scalars(self):
+        content = struct.pack("!BidBi", 7, -3, 1.5, tc.TYPE_INTEGER, 42)
+        storage = Storage(content)
+        assert storage.read("!B") == (7,)
+        assert storage.readInt() == -3
+        assert storage.readDouble() == 1.5
+        assert storage.readTypedInt() == 42
+        assert storage.empty
+
+    def test__read_length(self):
+        storage = Storage(struct.pack("!B", 12) + struct.pack("!Bi", 0, 300))
+        assert storage.readLength() == 12
+        assert storage.readLength() == 300
+
+    def test__read_strings(self):
+        content = _string("person") + struct.pack("!B", tc.TYPE_STRING) + _string("äb")
+        content += struct.pack("!Bi", tc.TYPE_STRINGLIST, 3) + _string("1") + _string("") + _string("22")
+        storage = Storage(content)
+        assert storage.readString() == "person"
+        assert storage.readTypedString() == "äb"
+        assert storage.readTypedStringList() == ("1", "", "22")
+        assert storage.empty
+
+    def test__read_lists(self):
+        content = struct.pack("!i3d", 3, 0.5, -1.0, 2.25)
+        content += struct.pack("!i4d", 2, 1.0, 2.0, 3.0, 4.0)
+        content += struct.pack("!i6d", 2, 1.0, 2.0, 3.0, 4.0, 5.0, 6.0)
+        content += struct.pack("!i2i", 2, -7, 9)
+        content += struct.pack("!B4d", 2, 0.0, 0.0, 1.0, 1.0)
+        storage = Storage(content)
+        assert storage.readDoubleList() == (0.5, -1.0, 2.25)
+        assert storage.read2DPositionList() == ((1.0, 2.0), (3.0, 4.0))
+        assert storage.read3DPositionList() == ((1.0, 2.0, 3.0), (4.0, 5.0, 6.0))
+        assert storage.readIntegerList() == (-7, 9)
+        assert storage.readShape() == ((0.0, 0.0), (1.0, 1.0))
+        assert storage.empty
+
+    def test__read_empty_lists(self):
+        storage = Storage(struct.pack("!ii", 0, 0))
+        assert storage.readDoubleList() == ()
+        assert storage.read2DPositionList() == ()
+
+    def test__read_from_bytearray_view(self):
+        buffer = bytearray(b"\x00" * 3 + struct.pack("!d", 3.5))
+        storage = Storage(memoryview(buffer)[3:])
+        assert storage.readDouble() == 3.5
+
+    def test__read_beyond_content(self):
+        storage = Storage(struct.pack("!i", 10) + b"abc")
+        with self.assertRaises(struct.error):
+            storage.readString()
+        with self.assertRaises(struct.error):
+            Storage(b"\x00").readDouble()
+
+
+class TestStorageArrayMode(TestCase):
+
+    def test__read_lists_as_arrays(self):
+        content = struct.pack("!i3d", 3, 0.5, -1.0, 2.25)
+        content += struct.pack("!i4d", 2, 1.0, 2.0, 3.0, 4.0)
+        content += struct.pack("!i6d", 2, 1.0, 2.0, 3.0, 4.0, 5.0, 6.0)
+        content += struct.pack("!i2i", 2, -7, 9)
+        storage = Storage(content, array_mode=True)
+
+        doubles = storage.readDoubleList()
+        positions_2d = storage.read2DPositionList()
+        positions_3d = storage.read3DPositionList()
+        integers = storage.readIntegerList()
+
+        np.testing.assert_array_equal(doubles, [0.5, -1.0, 2.25])
+        np.testing.assert_array_equal(positions_2d, [[1.0, 2.0], [3.0, 4.0]])
+        np.testing.assert_array_equal(positions_3d, [[1.0, 2.0, 3.0], [4.0, 5.0, 6.0]])
+        np.testing.assert_array_equal(integers, [-7, 9])
+        assert positions_2d.shape == (2, 2)
+        assert doubles.dtype.isnative and integers.dtype.isnative
+        assert storage.empty
+
+    def test__array_does_not_alias_buffer(self):
+        buffer = bytearray(struct.pack("!i2d", 2, 1.0, 2.0))
+        doubles = Storage(buffer, array_mode=True).readDoubleList()
+        buffer[4:] = struct.pack("!2d", 0.0, 0.0)
+        np.testing.assert_array_equal(doubles, [1.0, 2.0])
+
+    def test__read_empty_array(self):
+        storage = Storage(struct.pack("!i", 0), array_mode=True)
+        assert storage.read2DPositionList().shape == (0, 2)
+
+    def test__invalid_length(self):
+        negative = struct.pack("!i2d", -1, 1.0, 2.0)
+        truncated = struct.pack("!i2d", 3, 1.0, 2.0)
+        for content in (negative, truncated):
+            for array_mode in (False, True):
+                with self.assertRaises(struct.error):
+                    Storage(content, array_mode=array_mode).readDoubleList()
+                with self.assertRaises(struct.error):
+                    Storage(content, array_mode=array_mode).read2DPositionList()
+        with self.assertRaises(struct.error):
+            Storage(struct.pack("!ii", -2, 5), array_mode=True).readIntegerList()
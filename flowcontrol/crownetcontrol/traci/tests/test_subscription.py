@@ -0,0 +1,167 @@
+import struct
+from unittest import TestCase
+
+import numpy as np
+
+from flowcontrol.crownetcontrol.traci import constants_vadere as tc
+from flowcontrol.crownetcontrol.traci.connection import BaseTraCIConnection
+from flowcontrol.crownetcontrol.traci.domains.domain import SubscriptionResults, _parse
+from flowcontrol.crownetcontrol.traci.domains.VaderePersonAPI import VaderePersonAPI
+from flowcontrol.crownetcontrol.traci.exceptions import FatalTraCIError
+from flowcontrol.crownetcontrol.traci.storage import Storage
+
+
+def _string(value):
+    return struct.pack("!i", len(value)) + value.encode("latin1")
+
+
+def person_response(ped_id, x, y, targets):
+    cmd = struct.pack("!B", tc.RESPONSE_SUBSCRIBE_V_PERSON_VARIABLE) + _string(ped_id)
+    cmd += struct.pack("!B", 3)
+    cmd += struct.pack("!BBBdd", tc.VAR_POSITION, 0, tc.POSITION_2D, x, y)
+    cmd += struct.pack("!BBBd", tc.VAR_SPEED, 0, tc.TYPE_DOUBLE, 1.34)
+    cmd += struct.pack("!BBBi", tc.VAR_TARGET_LIST, 0, tc.TYPE_STRINGLIST, len(targets))
+    cmd += b"".join(_string(t) for t in targets)
+    return struct.pack("!B", len(cmd) + 1) + cmd
+
+
+def id_list_response(ped_ids):
+    cmd = struct.pack("!B", tc.RESPONSE_SUBSCRIBE_V_PERSON_VARIABLE) + _string("")
+    cmd += struct.pack("!BBBBi", 1, tc.VAR_ID_LIST, 0, tc.TYPE_STRINGLIST, len(ped_ids))
+    cmd += b"".join(_string(p) for p in ped_ids)
+    return struct.pack("!B", len(cmd) + 1) + cmd
+
+
+class TestValueDecoder(TestCase):
+
+    def test__decode_by_type(self):
+        data = struct.pack("!Bdd", tc.POSITION_2D, 1.0, 2.0)
+        data += struct.pack("!Bb", tc.TYPE_BYTE, -3)
+        data += struct.pack("!BBBBB", tc.TYPE_COLOR, 1, 2, 3, 4)
+        data += struct.pack("!BiBi", tc.TYPE_COMPOUND, 2, tc.TYPE_STRING, 0)
+        storage = Storage(data + struct.pack("!Bd", tc.TYPE_DOUBLE, 1.5))
+        results = SubscriptionResults({}, 0, 0, 0)
+        assert results.decoder(tc.VAR_POSITION)(storage) == (1.0, 2.0)
+        assert results.decoder(tc.VAR_SPEED)(storage) == -3
+        assert results.decoder(tc.VAR_COLOR)(storage) == (1, 2, 3, 4)
+        assert results.decoder(tc.VAR_TARGET_LIST)(storage) == ["", 1.5]
+
+    def test__value_function_override(self):
+        calls = []
+
+        def read(data):
+            calls.append(1)
+            return data.readInt() * 2
+
+        results = SubscriptionResults({tc.VAR_SPEED: read}, 0, 0, 0)
+        storage = Storage(struct.pack("!BiBi", tc.TYPE_INTEGER, 2, tc.TYPE_INTEGER, 3))
+        results.add("1", tc.VAR_SPEED, storage)
+        results.add("2", tc.VAR_SPEED, storage)
+        assert results.get() == {"1": {tc.VAR_SPEED: 4}, "2": {tc.VAR_SPEED: 6}}
+        assert len(calls) == 2
+        assert results.decoder(tc.VAR_SPEED) is results.decoder(tc.VAR_SPEED)
+
+    def test__unknown_type(self):
+        with self.assertRaises(FatalTraCIError):
+            _parse({}, tc.VAR_SPEED, Storage(struct.pack("!B", 0xFE)))
+        with self.assertRaises(FatalTraCIError):
+            SubscriptionResults({}, 0, 0, 0).decoder(tc.VAR_SPEED)(Storage(b"\xfe"))
+
+
+class TestReadSubscription(TestCase):
+
+    def test__variable_subscription(self):
+        connection = BaseTraCIConnection(None, default_domains=[VaderePersonAPI()])
+        responses = [person_response("1", 0.5, 1.0, ["2", "3"]), person_response("2", 2.0, 3.0, [])]
+        connection.parse_subscription_result(Storage(struct.pack("!i", 2) + b"".join(responses)))
+        results = connection.v_person.getAllSubscriptionResults()
+        assert results["1"] == {tc.VAR_POSITION: (0.5, 1.0), tc.VAR_SPEED: 1.34, tc.VAR_TARGET_LIST: ("2", "3")}
+        assert results["2"][tc.VAR_TARGET_LIST] == ()
+
+    def test__truncated_string_list(self):
+        storage = Storage(struct.pack("!ii", 1, 5) + b"ab")
+        with self.assertRaises(struct.error):
+            storage.readStringList()
+
+
+class TestColumnarResults(TestCase):
+
+    def setUp(self):
+        self.connection = BaseTraCIConnection(None, default_domains=[VaderePersonAPI()])
+        self.connection.v_person.setColumnarSubscriptionResults()
+
+    def step(self, *responses):
+        message = struct.pack("!i", len(responses)) + b"".join(responses)
+        self.connection.parse_subscription_result(Storage(message))
+
+    def test__columns(self):
+        self.step(person_response("1", 0.5, 1.0, ["2", "3"]), person_response("7", 2.0, 3.0, []))
+        columns = self.connection.v_person.getAllSubscriptionColumns()
+        assert columns.ids == ["1", "7"]
+        assert columns.index == {"1": 0, "7": 1}
+        np.testing.assert_array_equal(columns[tc.VAR_POSITION], [[0.5, 1.0], [2.0, 3.0]])
+        assert columns[tc.VAR_SPEED].dtype == np.float64
+        assert columns[tc.VAR_TARGET_LIST].dtype == object
+        assert columns[tc.VAR_TARGET_LIST][1] == ()
+        assert columns.row("7")[tc.VAR_SPEED] == 1.34
+
+    def test__id_list_is_no_row(self):
+        self.step(
+            id_list_response(["1", "7"]),
+            person_response("1", 0.5, 1.0, ["2"]),
+            person_response("7", 2.0, 3.0, []),
+        )
+        columns = self.connection.v_person.getAllSubscriptionColumns()
+        assert columns.ids == ["1", "7"]
+        assert not np.isnan(columns[tc.VAR_POSITION]).any()
+        assert tc.VAR_ID_LIST not in columns
+        assert columns.global_values == {tc.VAR_ID_LIST: ("1", "7")}
+        results = self.connection.v_person.getAllSubscriptionResults()
+        assert results[""] == {tc.VAR_ID_LIST: ("1", "7")}
+        assert results["7"][tc.VAR_SPEED] == 1.34
+
+    def test__dict_view(self):
+        self.step(person_response("1", 0.5, 1.0, ["2"]))
+        assert self.connection.v_person.getSubscriptionResults("1") == {
+            tc.VAR_POSITION: (0.5, 1.0),
+            tc.VAR_SPEED: 1.34,
+            tc.VAR_TARGET_LIST: ("2",),
+        }
+
+    def test__reset_each_step(self):
+        self.step(person_response("1", 0.5, 1.0, ["2"]), person_response("2", 0.5, 1.0, ["2"]))
+        self.step(person_response("2", 4.0, 1.0, ["2"]))
+        columns = self.connection.v_person.getAllSubscriptionColumns()
+        assert columns.ids == ["2"]
+        assert columns[tc.VAR_POSITION].shape == (1, 2)
+
+    def test__missing_values(self):
+        results = SubscriptionResults({}, 0, 0, 0)
+        results.set_columnar()
+        results.add("1", tc.VAR_SPEED, Storage(struct.pack("!Bd", tc.TYPE_DOUBLE, 1.0)))
+        results.add("2", tc.VAR_ANGLE, Storage(struct.pack("!Bi", tc.TYPE_INTEGER, 3)))
+        columns = results.columns()
+        assert np.isnan(columns[tc.VAR_SPEED][1])
+        assert np.isnan(columns[tc.VAR_ANGLE][0]) and columns[tc.VAR_ANGLE][1] == 3
+
+    def test__not_columnar(self):
+        with self.assertRaises(FatalTraCIError):
+            SubscriptionResults({}, 0, 0, 0).columns()
+
+
+class TestGeneration(TestCase):
+
+    def test__changes_with_content(self):
+        results = SubscriptionResults({}, 0, 0, 0)
+        generation = results.generation
+        results.reset()
+        assert results.generation == generation
+        results.add("1", tc.VAR_SPEED, Storage(struct.pack("!Bd", tc.TYPE_DOUBLE, 1.0)))
+        assert results.generation != generation
+        generation = results.generation
+        assert results.generation == generation
+        results.reset()
+        assert results.generation != generation
+
+    def test__unique_per_results(self):
+        assert SubscriptionResults({}, 0, 0, 0).generation != SubscriptionResults({}, 0, 0, 0).generation
@@ -47,6 +47,17 @@ class SubpopulationFilter(JsonRepresentation):
     def get_affectedPedestrianIds(self):
         return self.affectedPedestrianIds
 
+    @classmethod
+    def from_location(cls, location, pedestrian_index):
+        """
+        Filter for the pedestrians inside the areas of location.
+
+        :param pedestrian_index: spatial index of the current pedestrians, see
+            VadereDefaultStateListener.pedestrian_index
+        """
+        ids = pedestrian_index.ids_in(location)
+        return cls([int(i) if isinstance(i, str) and i.isdigit() else i for i in ids])
+
 
 class StimulusInfo(JsonRepresentation):
 
@@ -1,14 +1,53 @@
+import hashlib
+import io
+import math
 import os
 import time
+from concurrent.futures import ProcessPoolExecutor
 
 import numpy as np
 import pandas as pd
-import shapely.ops
+import shapely
 from shapely.geometry import Polygon, Point
 
 
 working_dir = dict()
 PRECISION = 8
+CONTRIBUTION_DTYPE = [("i", np.int64), ("j", np.int64), ("area", np.float64), ("count", np.float64)]
+# part of the cache key, increase it if the contribution file format or computation changes
+CONTRIBUTION_CACHE_VERSION = 2
+
+
+def default_cache_dir():
+    """user cache directory for the cell contributions ($XDG_CACHE_HOME/flowcontrol/density)"""
+    cache_home = os.environ.get("XDG_CACHE_HOME") or os.path.join(os.path.expanduser("~"), ".cache")
+    return os.path.join(cache_home, "flowcontrol", "density")
+
+
+def contribution_array(cell_contribution):
+    """cell contributions (dict, see MeasurementArea.get_cell_contribution) as structured array (i, j, area, count)"""
+    return np.array(
+        [(i, j, weight["area"], weight["count"]) for (i, j), weight in cell_contribution.items()],
+        dtype=CONTRIBUTION_DTYPE,
+    )
+
+
+def save_contribution_array(file_path, array):
+    """store the structured array of the cell contributions in a .npy file"""
+    os.makedirs(os.path.dirname(file_path), exist_ok=True)
+    # write to a temporary file first, runs that share the cache never read a partial file
+    tmp_path = f"{file_path}.{os.getpid()}.tmp"
+    with open(tmp_path, "wb") as f:
+        np.save(f, array)
+    os.replace(tmp_path, file_path)
+
+
+def load_contribution_array(file_path):
+    """memory-mapped structured array (i, j, area, count) of the cell contributions"""
+    array = np.load(file_path, mmap_mode="r")
+    if array.dtype != np.dtype(CONTRIBUTION_DTYPE):
+        raise ValueError(f"Unexpected dtype {array.dtype}.")
+    return array
 
 
 class MeasurementArea:
@@ -18,35 +57,60 @@ class MeasurementArea:
         self.area = polygon
         self.cell_contribution = dict()
 
-    def get_cell_contribution(self, cells, obstacles):
+    def get_cell_contribution(self, grid, obstacles):
+        """
+        Contribution of the cells (i, j) of the grid that overlap the measurement area:
+        dict((i, j): {"area": fraction of the cell inside the area, "count": weight of the count})
+        """
         if len(self.cell_contribution) > 0:
             return self.cell_contribution
 
         print(f"Initialize cell contributions for measurement area with id = {self.id}.")
 
-        for key, cell in cells.items():
-            common_area = cell.polygon.intersection(self.area).area
-
-            if common_area > 0:
-                area_contribution = common_area/cell.polygon.area
-
+        # only cells within the bounds of the area are candidates, cells covered by the area
+        # are classified by a predicate, boundary cells are intersected exactly
+        cells = grid.cells_in_bounds(*self.area.bounds)
+        i, j = np.array(cells, dtype=int).reshape(-1, 2).T
+        polygons = grid.boxes(i, j)
+        shapely.prepare(self.area)
+        inside = shapely.covers(self.area, polygons)
+        boundary = ~inside & shapely.intersects(self.area, polygons)
+
+        area_contributions = inside.astype(float)
+        common_area = shapely.area(shapely.intersection(polygons[boundary], self.area))
+        area_contributions[boundary] = common_area / shapely.area(polygons[boundary])
+
+        # cells partially in measurement area: the count is weighted by the reachable part of the cell
+        if not isinstance(obstacles, ObstacleIndex):
+            obstacles = ObstacleIndex(obstacles, grid)
+        partial = (area_contributions > 0) & (area_contributions < 1)
+        non_reachable_areas = np.zeros(len(cells))
+        non_reachable_areas[partial] = obstacles.non_reachable_fractions(i[partial], j[partial])
+
+        for (i, j), area_contribution, non_reachable_area in zip(cells, area_contributions.tolist(), non_reachable_areas.tolist()):
+            if area_contribution > 0:
                 if area_contribution < 1:
                     # cell is partially in measurement area
-                    count_contribution = self.get_counts_considering_obstacles(area_contribution, cell, obstacles)
+                    cell = grid.get_cell(i, j)
+                    count_contribution = self.weight_count(area_contribution, non_reachable_area, cell)
                 else:
                     count_contribution = 1 # cell is within measurement area
 
-                self.cell_contribution[key] = {"area": area_contribution, "count": count_contribution}
+                self.cell_contribution[(i, j)] = {"area": area_contribution, "count": count_contribution}
 
         return self.cell_contribution
 
     def get_counts_considering_obstacles(self, area_contribution, cell, obstacles):
 
-        self.check_integrity(area_contribution, cell)
-
         non_reachable_area = self.compute_non_reachable_area(cell, obstacles)
         non_reachable_area = non_reachable_area / cell.polygon.area
-        count_contribution = np.round(area_contribution / (1 - non_reachable_area), 8)
+        return self.weight_count(area_contribution, non_reachable_area, cell)
+
+    def weight_count(self, area_contribution, non_reachable_area, cell):
+        if math.isclose(non_reachable_area, 1, rel_tol=1e-05, abs_tol=1e-08):
+            count_contribution = 0 # no agents in a cell that is covered by obstacles
+        else:
+            count_contribution = np.round(area_contribution / (1 - non_reachable_area), 8)
 
         self.print_information(area_contribution, count_contribution, non_reachable_area, cell)
 
@@ -68,21 +132,52 @@ class MeasurementArea:
                              "measurement area.")
 
     def compute_non_reachable_area(self, cell, obstacles):
-        obstacles_overlapping = [cell.polygon.intersection(obstacle) for obstacle in obstacles if
-                                 cell.polygon.intersection(obstacle).area > 0]
-        non_reachable_area = 0
-        # make sure that obstacles area that overlap with other obstacle areas are not counted twice
-        obstacles_overlapping = shapely.ops.unary_union(obstacles_overlapping)
-
-        if obstacles_overlapping.is_empty:
-            return non_reachable_area
+        if not isinstance(obstacles, ObstacleIndex):
+            obstacles = ObstacleIndex(obstacles)
+        return obstacles.non_reachable_areas([cell.polygon])[0]
+
+
+class ObstacleIndex:
+    """
+    STRtree over the (prepared) obstacles. For the cells of a grid, the fraction
+    covered by obstacles is computed once and then looked up in the array
+    non_reachable[i, j] (NaN: not computed yet).
+    """
+
+    def __init__(self, obstacles, grid=None):
+        self.obstacles = np.array(list(obstacles), dtype=object)
+        shapely.prepare(self.obstacles)
+        self.tree = shapely.STRtree(self.obstacles)
+        self.grid = grid
+        self.non_reachable = np.full(grid.shape, np.nan) if grid is not None else None
+
+    def non_reachable_areas(self, polygons):
+        """area of each polygon covered by obstacles, overlapping obstacles are counted once"""
+        polygons = np.array(list(polygons), dtype=object)
+        areas = np.zeros(len(polygons))
+        polygon_index, obstacle_index = self.tree.query(polygons, predicate="intersects")
+        if len(polygon_index) == 0:
+            return areas
+
+        pieces = shapely.intersection(polygons[polygon_index], self.obstacles[obstacle_index])
+        single = np.bincount(polygon_index, minlength=len(polygons))[polygon_index] == 1
+        areas[polygon_index[single]] = shapely.area(pieces[single])
 
-        if isinstance(obstacles_overlapping, Polygon):
-            return obstacles_overlapping.intersection(cell.polygon).area
-
-        for obstacle_ in obstacles_overlapping.geoms:
-            non_reachable_area += obstacle_.intersection(cell.polygon).area
-        return non_reachable_area
+        # make sure that obstacles area that overlap with other obstacle areas are not counted twice
+        order = np.argsort(polygon_index[~single], kind="stable")
+        polygon_index, pieces = polygon_index[~single][order], pieces[~single][order]
+        groups, starts = np.unique(polygon_index, return_index=True)
+        for polygon, overlapping in zip(groups, np.split(pieces, starts[1:])):
+            areas[polygon] = shapely.union_all(overlapping).area
+        return areas
+
+    def non_reachable_fractions(self, i, j):
+        """fractions of the cells (i, j) of the grid covered by obstacles"""
+        missing = np.isnan(self.non_reachable[i, j])
+        if missing.any():
+            polygons = self.grid.boxes(i[missing], j[missing])
+            self.non_reachable[i[missing], j[missing]] = self.non_reachable_areas(polygons) / shapely.area(polygons)
+        return self.non_reachable[i, j]
 
 
 class Cell:
@@ -103,71 +198,348 @@ class Cell:
 
         self.number_of_agents_in_cell = count
 
+
+class _GridCell(Cell):
+    """Cell of a CellGrid, the count is stored in the count array of the grid."""
+
+    def __init__(self, grid, i, j, polygon):
+        self._counts = grid.counts
+        self._index = (i, j)
+        super().__init__(id=grid.cell_id(i, j), polygon=polygon, count=grid.counts[i, j])
+
+    @property
+    def number_of_agents_in_cell(self):
+        return self._counts[self._index]
+
+    @number_of_agents_in_cell.setter
+    def number_of_agents_in_cell(self, count):
+        self._counts[self._index] = count
+
+
+class CellGrid:
+    """
+    Regular grid of cells starting at (0, 0). Cell (i, j) has its lower left
+    corner at (x[i], y[j]) and the size cell_size. Cells are identified by their
+    integer coordinates (i, j); Cell objects (with polygon) are only created for
+    the cells that are used. The number of agents of all cells is held in the
+    array counts[i, j].
+    """
+
+    def __init__(self, cell_dimensions, cell_size):
+        self.cell_size = (float(cell_size[0]), float(cell_size[1]))
+        self.x = np.arange(0, cell_dimensions[0], self.cell_size[0])
+        self.y = np.arange(0, cell_dimensions[1], self.cell_size[1])
+        self.shape = (len(self.x), len(self.y))
+        self.counts = np.zeros(self.shape)
+        self._cells = dict()
+
+    def __len__(self):
+        return self.shape[0] * self.shape[1]
+
+    def cell_id(self, i, j):
+        return i * self.shape[1] + j
+
+    def index(self, x_coor, y_coor):
+        """(i, j) of the cells with the lower left corners (x_coor, y_coor), scalars or arrays"""
+        i = np.rint(np.asarray(x_coor) / self.cell_size[0]).astype(int)
+        j = np.rint(np.asarray(y_coor) / self.cell_size[1]).astype(int)
+        valid = (i >= 0) & (i < self.shape[0]) & (j >= 0) & (j < self.shape[1])
+        valid &= np.isclose(self.x[np.clip(i, 0, self.shape[0] - 1)], x_coor)
+        valid &= np.isclose(self.y[np.clip(j, 0, self.shape[1] - 1)], y_coor)
+        if not np.all(valid):
+            x_bad = np.broadcast_to(x_coor, valid.shape)[~valid]
+            y_bad = np.broadcast_to(y_coor, valid.shape)[~valid]
+            raise ValueError(f"No cell with lower left corner x={x_bad}, y={y_bad}.")
+        return i, j
+
+    def cells_in_bounds(self, minx, miny, maxx, maxy):
+        """(i, j) of all cells that overlap the bounding box"""
+        i0, i1 = self._range(self.x, self.cell_size[0], minx, maxx)
+        j0, j1 = self._range(self.y, self.cell_size[1], miny, maxy)
+        return [(i, j) for i in range(i0, i1) for j in range(j0, j1)]
+
+    @staticmethod
+    def _range(origins, delta, lower, upper):
+        start = np.searchsorted(origins + delta, lower, side="right")
+        end = np.searchsorted(origins, upper, side="left")
+        return int(start), int(max(end, start))
+
+    def polygon(self, i, j):
+        return self.boxes(i, j)
+
+    def boxes(self, i, j):
+        """polygons of the cells (i, j), scalars or arrays"""
+        x, y = self.x[i], self.y[j]
+        return shapely.box(x, y, x + self.cell_size[0], y + self.cell_size[1])
+
+    def get_cell(self, i, j):
+        cell = self._cells.get((i, j))
+        if cell is None:
+            cell = self._cells[(i, j)] = _GridCell(self, i, j, self.polygon(i, j))
+        return cell
+
+    def get_all_cells(self):
+        """Cell objects of all cells, created in one vectorized step"""
+        if len(self._cells) < len(self):
+            i, j = np.meshgrid(np.arange(self.shape[0]), np.arange(self.shape[1]), indexing="ij")
+            i, j = i.ravel(), j.ravel()
+            polygons = self.boxes(i, j)
+            for i_, j_, polygon in zip(i.tolist(), j.tolist(), polygons):
+                if (i_, j_) not in self._cells:
+                    self._cells[(i_, j_)] = _GridCell(self, i_, j_, polygon)
+        return self._cells
+
+
+class AreaWeights:
+    """
+    Count weights of the cells for all measurement areas as sparse (areas x cells)
+    matrix in CSR form (indptr, indices, data). Column k is the cell with the linear
+    index k of the flattened count array of the grid. areas holds the area of each
+    measurement area, thus the densities of all areas are
+
+        weights.dot(grid.counts.ravel()) / weights.areas
+    """
+
+    def __init__(self, ids, indptr, indices, data, areas):
+        self.ids = list(ids)
+        self.indptr = indptr
+        self.indices = indices
+        self.data = data
+        self.areas = areas
+        # row of each stored weight, used to sum the rows in one step
+        self._rows = np.repeat(np.arange(len(self.ids)), np.diff(indptr))
+
+    @classmethod
+    def from_contributions(cls, grid, contributions: dict):
+        """
+        :param contributions: dict(area id: cell contributions) as returned by
+        MeasurementArea.get_cell_contribution
+        """
+        return cls.from_arrays(grid, {id: contribution_array(c) for id, c in contributions.items()})
+
+    @classmethod
+    def from_arrays(cls, grid, contributions: dict):
+        """
+        :param contributions: dict(area id: structured array (i, j, area, count)), see
+        contribution_array and load_contribution_array
+        """
+        arrays = list(contributions.values())
+        merged = np.concatenate(arrays) if len(arrays) > 0 else np.empty(0, dtype=CONTRIBUTION_DTYPE)
+        cell_area = grid.cell_size[0] * grid.cell_size[1]
+        return cls(
+            ids=contributions.keys(),
+            indptr=np.cumsum([0] + [len(array) for array in arrays]).astype(np.intp),
+            indices=grid.cell_id(merged["i"], merged["j"]).astype(np.intp),
+            data=merged["count"].astype(float),
+            areas=np.array([array["area"].sum() for array in arrays], dtype=float) * cell_area,
+        )
+
+    def dot(self, counts):
+        """weighted count of each measurement area for the flattened cell counts"""
+        return np.bincount(self._rows, weights=self.data * counts[self.indices], minlength=len(self.ids))
+
+
+_contribution_worker = dict()
+
+
+def _init_contribution_worker(cell_dimensions, cell_size, obstacles_wkb):
+    grid = CellGrid(cell_dimensions, cell_size)
+    _contribution_worker["grid"] = grid
+    _contribution_worker["obstacle_index"] = ObstacleIndex(shapely.from_wkb(obstacles_wkb), grid)
+
+
+def _compute_cell_contribution(area_id, area_wkb):
+    measurement_area = MeasurementArea(area_id, shapely.from_wkb(area_wkb))
+    return measurement_area.get_cell_contribution(_contribution_worker["grid"], _contribution_worker["obstacle_index"])
+
+
 class DensityMapper:
 
-    def __init__(self, cell_dimensions, cell_size, measurement_areas : dict, obstacles):
+    def __init__(self, cell_dimensions, cell_size, measurement_areas : dict, obstacles, cache_dir=None, max_workers=None):
+        """
+        :param cache_dir: directory of the on-disk cache of the cell contributions of the
+        measurement areas (e.g. default_cache_dir()), None: no cache
+        :param max_workers: if given, the cell contributions are computed at initialization
+        in a pool of max_workers processes (see compute_cell_contributions_parallel)
+        """
         self.cell_dimensions = cell_dimensions
         self.cell_size = cell_size
-        self.cells = dict()
+        self.grid = CellGrid(cell_dimensions, cell_size)
         self.measurement_areas = measurement_areas
         self.obstacles = obstacles
+        self.obstacle_index = ObstacleIndex(obstacles, self.grid)
+        self.weights = None
+        self.cache_dir = cache_dir
+        self._obstacles_hash = None
+        self._kernel_spectra = dict()
+        if max_workers is not None:
+            self.compute_cell_contributions_parallel(max_workers)
 
     def get_cells(self):
-        if len(self.cells) > 0:
-            return self.cells
-
-        print("DensityMapper: Initialize cell grid.")
-
-        delta_x = self.cell_size[0]
-        delta_y = self.cell_size[1]
-
-        index = 0
-
-        for x_coor in np.arange(0, self.cell_dimensions[0],delta_x):
-            for y_coor in np.arange(0, self.cell_dimensions[1],delta_y):
-                lower_left_corner = [x_coor,y_coor]
-                lower_right_corner = [x_coor+delta_x, y_coor]
-                upper_right_corner = [x_coor+delta_x, y_coor+delta_y]
-                upper_left_corner = [x_coor, y_coor+delta_y]
-                polygon = Polygon(np.array([lower_left_corner, lower_right_corner, upper_right_corner, upper_left_corner]))
-                key = self.get_cell_key(x_coor, y_coor)
-                self.cells[key] = Cell(id=index, polygon=polygon)
-                index += 1
-
-        return self.cells
+        """all cells by key (see get_cell_key), creates the polygons of all cells"""
+        cells = self.grid.get_all_cells()
+        return {self.get_cell_key(self.grid.x[i], self.grid.y[j]): cells[(i, j)]
+                for i in range(self.grid.shape[0]) for j in range(self.grid.shape[1])}
 
     def get_cell_key(self, x_coor, y_coor):
         return f"x={x_coor:.1f}_y={y_coor:.1f}"
 
-    def get_density_in_area(self, distribution = "uniform"):
-
+    def get_density_in_area(self, distribution = "uniform", bandwidth = 1.0):
+        """
+        :param distribution: "uniform": the agents are distributed uniformly in their cell,
+        "gaussian": the counts are smoothed with a Gaussian kernel (standard deviation bandwidth in m)
+        """
         if distribution=="uniform":
             densities = self.get_density_uniform_assumption()
+        elif distribution=="gaussian":
+            densities = self.get_density_gaussian(bandwidth)
         else:
-            raise NotImplementedError("Not implemented yet. Use distribution type uniform.")
+            raise NotImplementedError("Not implemented yet. Use distribution type uniform or gaussian.")
         return densities
 
     def get_density_uniform_assumption(self):
-
-        densities = dict()
-        for id, measurement_area in self.measurement_areas.items():
-            area, counts = self.compute_counts_area(measurement_area)
-            densities[id] = area/counts
-        return densities
+        return self.get_density_from_counts(self.grid.counts)
+
+    def get_density_gaussian(self, bandwidth):
+        return self.get_density_from_counts(self.smooth_counts(bandwidth))
+
+    def get_density_from_counts(self, counts):
+        weights = self.get_weights()
+        densities = weights.dot(counts.ravel()) / weights.areas
+        return dict(zip(weights.ids, densities))
+
+    def smooth_counts(self, bandwidth):
+        """
+        Counts of the grid convolved with a Gaussian kernel (standard deviation bandwidth in m,
+        truncated at 4 standard deviations) by FFT. Agents smoothed beyond the grid border are lost.
+        """
+        spectrum, padded_shape, radius = self.get_kernel_spectrum(bandwidth)
+        smoothed = np.fft.irfft2(np.fft.rfft2(self.grid.counts, padded_shape) * spectrum, padded_shape)
+        nx, ny = self.grid.shape
+        return smoothed[radius[0] : radius[0] + nx, radius[1] : radius[1] + ny]
+
+    def get_kernel_spectrum(self, bandwidth):
+        """spectrum of the Gaussian kernel, cached per grid shape and bandwidth"""
+        key = (self.grid.shape, bandwidth)
+        if key not in self._kernel_spectra:
+            if bandwidth <= 0:
+                raise ValueError(f"Bandwidth = {bandwidth} not allowed. Bandwidth must be > 0.")
+            kernels = []
+            for delta in self.grid.cell_size:
+                sigma = bandwidth / delta
+                offsets = np.arange(-np.ceil(4 * sigma), np.ceil(4 * sigma) + 1)
+                kernel = np.exp(-0.5 * (offsets / sigma) ** 2)
+                kernels.append(kernel / kernel.sum())
+            radius = tuple(len(kernel) // 2 for kernel in kernels)
+            # zero padding: no wrap-around of the cyclic convolution
+            padded_shape = tuple(n + 2 * r for n, r in zip(self.grid.shape, radius))
+            spectrum = np.fft.rfft2(np.outer(*kernels), padded_shape)
+            self._kernel_spectra[key] = (spectrum, padded_shape, radius)
+        return self._kernel_spectra[key]
+
+    def get_weights(self):
+        """AreaWeights of the measurement areas, compiled once (again if the measurement areas change)"""
+        if self.weights is None or self.weights.ids != list(self.measurement_areas):
+            contributions = dict()
+            for id, measurement_area in self.measurement_areas.items():
+                contributions[id] = self.get_contribution_array(measurement_area)
+            weights = AreaWeights.from_arrays(self.grid, contributions)
+            for measurement_area, area in zip(self.measurement_areas.values(), weights.areas):
+                self.check_area(measurement_area, area)
+            self.weights = weights
+        return self.weights
+
+    def get_contribution_array(self, measurement_area: MeasurementArea):
+        """
+        cell contributions of the measurement area as structured array (i, j, area, count),
+        memory-mapped from the cache if available (without building the dict of the measurement area)
+        """
+        if len(measurement_area.cell_contribution) > 0 or self.cache_dir is None:
+            return contribution_array(measurement_area.get_cell_contribution(self.grid, self.obstacle_index))
+
+        array = self.load_contribution_array(measurement_area)
+        if array is None:
+            array = contribution_array(measurement_area.get_cell_contribution(self.grid, self.obstacle_index))
+            save_contribution_array(self.get_cache_path(measurement_area), array)
+        return array
+
+    def load_contribution_array(self, measurement_area: MeasurementArea):
+        """cached cell contributions of the measurement area, None if not cached"""
+        file_path = self.get_cache_path(measurement_area)
+        if not os.path.isfile(file_path):
+            return None
+        try:
+            array = load_contribution_array(file_path)
+        except (OSError, ValueError) as e:
+            print(f"Could not load {file_path} ({e}). Compute cell contributions again.")
+            return None
+        print(f"Load cell contributions for measurement area with id = {measurement_area.id} from {file_path}.")
+        return array
+
+    def compute_cell_contributions_parallel(self, max_workers=None):
+        """
+        Compute the cell contributions of all measurement areas (not yet computed or cached)
+        in a process pool. Geometries are sent to the workers as WKB, the results are
+        assigned in the order of the measurement areas and equal the serial computation.
+        """
+        pending = [area for area in self.measurement_areas.values() if len(area.cell_contribution) == 0]
+        if self.cache_dir is not None:
+            pending = [area for area in pending if self.load_contribution_array(area) is None]
+        if len(pending) == 0:
+            return
+
+        obstacles = shapely.to_wkb(self.obstacle_index.obstacles).tolist()
+        with ProcessPoolExecutor(
+            max_workers=max_workers,
+            initializer=_init_contribution_worker,
+            initargs=(self.cell_dimensions, self.cell_size, obstacles),
+        ) as executor:
+            results = executor.map(
+                _compute_cell_contribution, [area.id for area in pending], [shapely.to_wkb(area.area) for area in pending]
+            )
+            for measurement_area, cell_contribution in zip(pending, results):
+                measurement_area.cell_contribution = cell_contribution
+                if self.cache_dir is not None:
+                    save_contribution_array(self.get_cache_path(measurement_area), contribution_array(cell_contribution))
+
+    def get_cache_path(self, measurement_area: MeasurementArea):
+        return os.path.join(self.cache_dir, f"{self.get_cache_key(measurement_area)}.npy")
+
+    def get_cache_key(self, measurement_area: MeasurementArea):
+        """
+        hash of everything the cell contributions depend on: cache version, grid, area and
+        obstacle geometry
+        """
+        if self._obstacles_hash is None:
+            obstacles = hashlib.sha256()
+            # the result does not depend on the order of the obstacles
+            for wkb in sorted(shapely.to_wkb(self.obstacle_index.obstacles).tolist()):
+                obstacles.update(wkb)
+            self._obstacles_hash = obstacles.digest()
+
+        key = hashlib.sha256()
+        key.update(str(CONTRIBUTION_CACHE_VERSION).encode())
+        key.update(np.array(self.grid.cell_size + self.grid.shape, dtype=float).tobytes())
+        key.update(shapely.to_wkb(measurement_area.area))
+        key.update(self._obstacles_hash)
+        return key.hexdigest()
+
+    def check_area(self, measurement_area: MeasurementArea, area):
+        if not np.isclose(area, measurement_area.area.area):
+            raise ValueError(f"Measurement area computed: {area}. Should be {measurement_area.area.area}.")
 
     def compute_counts_area(self, measurement_area : MeasurementArea):
-        cell_contributions = measurement_area.get_cell_contribution(self.get_cells(), self.obstacles)
+        cell_contributions = measurement_area.get_cell_contribution(self.grid, self.obstacle_index)
 
         count = 0
         unit_area = 0
 
-        for key, weight in cell_contributions.items():
-            count_raw = self.get_cells()[key].get_count()
+        for (i, j), weight in cell_contributions.items():
+            count_raw = self.grid.counts[i, j]
             count += count_raw*weight["count"] # weights the counts -> if 50% of the cell area overlaps with the measurement area, the weight would be 50%
             unit_area += weight["area"]
 
-        if not np.isclose(unit_area*self.get_cell_area(), measurement_area.area.area):
-            raise ValueError(f"Measurement area computed: {unit_area*self.get_cell_area()}. Should be {measurement_area.area.area}.")
+        self.check_area(measurement_area, unit_area*self.get_cell_area())
 
         return count, unit_area*self.get_cell_area()
 
@@ -176,51 +548,327 @@ class DensityMapper:
         return self.cell_size[0]*self.cell_size[1]
 
     def update_density(self, result):
-        for entry in result:
-            self.update_cell(x_coor=entry[0], y_coor = entry[1], count= entry[2])
+        """
+        Set the counts of the cells in result, an array (n, 3) with the lower left
+        corner (x, y) and the count of each cell (see VadereSimulationDomain.get_density_map).
+        """
+        result = np.asarray(result, dtype=float).reshape(-1, 3)
+        counts = result[:, 2]
+        rounded = np.round(counts, 6)
+        if not np.all(rounded == np.floor(rounded)):
+            raise ValueError(f"Number of pedestrians in cell must be int values. Got {counts[rounded != np.floor(rounded)]}.")
+        i, j = self.grid.index(result[:, 0], result[:, 1])
+        self.grid.counts[i, j] = counts
+
+    def update_density_from_positions(self, positions):
+        """set the counts of all cells to the number of the positions (array (n, 2)) inside, positions outside the grid are ignored"""
+        positions = np.asarray(positions, dtype=float).reshape(-1, 2)
+        nx, ny = self.grid.shape
+        with np.errstate(invalid="ignore"):
+            i = np.floor(positions[:, 0] / self.grid.cell_size[0])
+            j = np.floor(positions[:, 1] / self.grid.cell_size[1])
+        inside = (i >= 0) & (i < nx) & (j >= 0) & (j < ny)
+        cell_ids = i[inside].astype(np.intp) * ny + j[inside].astype(np.intp)
+        self.grid.counts[:] = np.bincount(cell_ids, minlength=nx * ny).reshape(nx, ny)
 
     def update_cell(self, x_coor, y_coor, count):
-        cell_key = self.get_cell_key(x_coor, y_coor)
+        i, j = self.grid.index(x_coor, y_coor)
+        self.grid.get_cell(int(i), int(j)).set_count(count)
+
+
+class LocalDensitySensor:
+    """
+    Densities of the measurement areas computed from the pedestrian positions of a
+    state listener (VadereDefaultStateListener with VAR_POSITION subscribed) instead
+    of the density map of get_density_map. The positions are binned into the grid of
+    the DensityMapper, thus no request is sent to the simulator.
+
+        sensor = LocalDensitySensor(density_mapper, state_listener)
+        densities = sensor.get_density_in_area()
+    """
+
+    def __init__(self, density_mapper: DensityMapper, state_listener):
+        self.density_mapper = density_mapper
+        self.state_listener = state_listener
+
+    def update(self):
+        self.density_mapper.update_density_from_positions(self.state_listener.pedestrian_positions)
+
+    def get_density_in_area(self, distribution="uniform", bandwidth=1.0):
+        self.update()
+        return self.density_mapper.get_density_in_area(distribution, bandwidth)
+
+
+class TailReader:
+    """
+    Reads a space separated output file (header line, index in the first column) while it
+    is still written. The position in the file is kept as byte offset, each read() only
+    parses the complete rows appended since the last call. A file replaced by a new one
+    (other inode, changed header or changed last row before the offset) is read from the start.
+
+        reader = DensityMapCheck.omnett_truth_reader(file_path)
+        reader.wait()
+        new_rows = reader.read()    # in each step
+        reader.frame                # all rows read so far
+    """
+
+    def __init__(self, file_path, transform=None):
+        """
+        :param transform: function applied to the new rows of each read (DataFrame -> DataFrame)
+        """
+        self.file_path = file_path
+        self.transform = transform
+        self.reset()
+
+    def reset(self):
+        """forget the rows read so far, the next read starts at the beginning of the file"""
+        self.offset = 0
+        self.columns = None
+        self._frames = []
+        self._identity = None  # (st_dev, st_ino) of the file
+        self._header = None
+        self._last_line = None  # last complete line before offset
+
+    def wait(self, timeout=None, max_interval=0.1):
+        """wait until the file exists and its header is written, returns False after timeout seconds"""
+        start = time.monotonic()
+        interval = 0.001
+        while not self._read_header():
+            if timeout is not None and time.monotonic() - start >= timeout:
+                return False
+            time.sleep(interval)
+            interval = min(2 * interval, max_interval)
+        return True
+
+    def _read_header(self):
+        if self.columns is not None:
+            return True
+        if not os.path.isfile(self.file_path):
+            return False
+        with open(self.file_path, "rb") as f:
+            stat = os.fstat(f.fileno())
+            line = f.readline()
+        if not line.endswith(b"\n"):
+            return False
+        self.columns = pd.read_csv(io.BytesIO(line), delimiter=" ").columns.tolist()
+        self.offset = len(line)
+        self._identity = (stat.st_dev, stat.st_ino)
+        self._header = self._last_line = line
+        return True
 
-        if cell_key not in self.get_cells().keys():
-            raise ValueError(f"Key {cell_key} not found.")
-        self.get_cells()[cell_key].set_count(count)
+    def _replaced(self):
+        try:
+            with open(self.file_path, "rb") as f:
+                stat = os.fstat(f.fileno())
+                if (stat.st_dev, stat.st_ino) != self._identity or stat.st_size < self.offset:
+                    return True
+                if f.read(len(self._header)) != self._header:
+                    return True
+                f.seek(self.offset - len(self._last_line))
+                return f.read(len(self._last_line)) != self._last_line
+        except FileNotFoundError:
+            return True
+
+    def read(self):
+        """rows appended since the last read (empty if there are none)"""
+        if not self._read_header():
+            return pd.DataFrame()
+        if self._replaced():
+            # e.g. the output of the next run, start again
+            self.reset()
+            return self.read()
+
+        with open(self.file_path, "rb") as f:
+            f.seek(self.offset)
+            data = f.read()
+        # an incomplete last line is read with the next call
+        end = data.rfind(b"\n") + 1
+        if end == 0:
+            return self._empty()
+        self.offset += end
+        self._last_line = data[data.rfind(b"\n", 0, end - 1) + 1:end]
+
+        rows = pd.read_csv(io.BytesIO(data[:end]), delimiter=" ", header=None, names=self.columns, index_col=[0])
+        if self.transform is not None:
+            rows = self.transform(rows)
+        self._frames.append(rows)
+        return rows
+
+    def _empty(self):
+        rows = pd.DataFrame(columns=self.columns).set_index(self.columns[0])
+        return self.transform(rows) if self.transform is not None else rows
+
+    @property
+    def frame(self):
+        """all rows read so far"""
+        if len(self._frames) == 0:
+            return self._empty() if self.columns is not None else pd.DataFrame()
+        if len(self._frames) > 1:
+            self._frames = [pd.concat(self._frames)]
+        return self._frames[0]
+
+
+def iter_density_steps(file_path, columns=("x", "y", "count"), time_step_size=1.0, chunksize=100000):
+    """
+    Iterate over the time steps of a density output file (space separated, time in the first
+    column, the rows of a step are consecutive) with memory bounded by chunksize rows and the
+    rows of one step.
+
+    :param time_step_size: time of the file / time_step_size = time step
+    :return: generator of (time step, array (n, len(columns)))
+    """
+    time_steps, values = np.empty(0), np.empty((0, len(columns)))
+    for chunk in pd.read_csv(file_path, delimiter=" ", index_col=[0], chunksize=chunksize):
+        # the last step of the previous chunk may continue in this chunk
+        time_steps = np.concatenate([time_steps, np.round(chunk.index.to_numpy(float) / time_step_size, PRECISION)])
+        values = np.concatenate([values, chunk[list(columns)].to_numpy(float)])
+        starts = np.flatnonzero(np.diff(time_steps)) + 1
+        for start, end in zip(np.r_[0, starts[:-1]], starts):
+            yield time_steps[start], values[start:end]
+        if len(starts) > 0:
+            time_steps, values = time_steps[starts[-1]:], values[starts[-1]:]
+    if len(time_steps) > 0:
+        yield time_steps[0], values
+
+
+class CellErrors:
+    """
+    Running per-cell error metrics of estimated counts against reference counts,
+    updated step by step (arrays of the grid shape).
+    """
+
+    def __init__(self, shape):
+        self.steps = 0
+        self.error_sum = np.zeros(shape)
+        self.absolute_error_sum = np.zeros(shape)
+        self.squared_error_sum = np.zeros(shape)
+
+    def add(self, estimate, reference):
+        error = estimate - reference
+        self.steps += 1
+        self.error_sum += error
+        self.absolute_error_sum += np.abs(error)
+        self.squared_error_sum += error ** 2
+
+    def _mean(self, total):
+        return total / self.steps if self.steps > 0 else np.full(total.shape, np.nan)
+
+    @property
+    def bias(self):
+        return self._mean(self.error_sum)
+
+    @property
+    def mae(self):
+        return self._mean(self.absolute_error_sum)
+
+    @property
+    def rmse(self):
+        return np.sqrt(self._mean(self.squared_error_sum))
 
 
 class DensityMapCheck:
 
+    # one TailReader per (kind, file), the getters only parse rows appended since their last call
+    _readers = dict()
+
     @classmethod
     def _wait_until_file_exists(cls, file_path):
-        while os.path.isfile(file_path) is False:
-            time.sleep(1)
-        time.sleep(1)
-        return True
+        return TailReader(file_path).wait()
+
+    @classmethod
+    def _reader(cls, file_path, new_reader):
+        key = (new_reader.__name__, os.path.abspath(file_path))
+        if key not in cls._readers:
+            cls._readers[key] = new_reader(file_path)
+        return cls._readers[key]
+
+    @classmethod
+    def drop_readers(cls, file_path=None):
+        """drop the cached TailReaders of file_path (of all files if None)"""
+        if file_path is None:
+            cls._readers.clear()
+            return
+        file_path = os.path.abspath(file_path)
+        for key in [k for k in cls._readers if k[1] == file_path]:
+            del cls._readers[key]
+
+    @classmethod
+    def omnett_truth_reader(cls, file_path):
+        """TailReader of the OMNeT++ density map output that yields the rows of get_cell_density_omnett_truth"""
+        return TailReader(file_path, transform=cls._omnett_rows)
+
+    @classmethod
+    def vadere_truth_reader(cls, file_path):
+        """TailReader of the Vadere cell counts output that yields the rows of get_cell_density_vadere_truth"""
+        return TailReader(file_path, transform=cls._vadere_rows)
+
+    @classmethod
+    def _omnett_rows(cls, rows):
+        rows = rows.sort_index(axis=1).round(PRECISION)
+        rows.index = rows.index/0.4 # simTime to simstep
+        return rows[["x", "y", "count"]]
+
+    @classmethod
+    def _vadere_rows(cls, rows):
+        rows = rows.sort_index(axis=1).round(PRECISION)
+        if rows['size'].nunique() > 1:
+            raise ValueError("Only squares as cells allowed.")
+        cell_size = rows['size'].iloc[0] if len(rows) > 0 else 1.0
+        rows = rows.drop(['size'], axis=1)
+        rows = rows.loc[(rows['x'] >= 0.0) & (rows['y'] >= 0.0)].copy()
+        counts = [column for column in rows.columns if column not in ('x', 'y')]
+        rows[counts] = rows[counts] / cell_size ** 2
+        return rows
 
     @classmethod
     def get_cell_density_omnett_truth(cls, file_path):
-        cls._wait_until_file_exists(file_path)
-        globalDensityMap = pd.read_csv(
-            file_path,
-            delimiter=" ",
-            index_col=[0],
-            header=[0],
-        ).sort_index(axis=1).round(PRECISION)
-        globalDensityMap.index = globalDensityMap.index/0.4 # simTime to simstep
-        globalDensityMap = globalDensityMap[["x", "y", "count"]]
-        return globalDensityMap
+        reader = cls._reader(file_path, cls.omnett_truth_reader)
+        reader.wait()
+        reader.read()
+        return reader.frame
+
+    @classmethod
+    def iter_omnett_steps(cls, file_path, chunksize=100000):
+        """(time step, array (n, 3) of x, y, count) of the OMNeT++ density map output, see iter_density_steps"""
+        return iter_density_steps(file_path, time_step_size=0.4, chunksize=chunksize)
+
+    @classmethod
+    def iter_vadere_steps(cls, file_path, count_column="count", chunksize=100000):
+        """(time step, array (n, 3) of x, y, count) of the Vadere cell counts output, see iter_density_steps"""
+        return iter_density_steps(file_path, columns=("x", "y", count_column), chunksize=chunksize)
+
+    @classmethod
+    def compare_cell_counts(cls, omnett_file, vadere_file, grid, count_column="count", chunksize=100000):
+        """
+        Per-cell errors (CellErrors) of the OMNeT++ counts against the Vadere counts in one pass
+        over both files. Only time steps in both files are compared, cells missing in a step
+        count as 0 and rows with negative coordinates (outside the grid) are ignored.
+        """
+        errors = CellErrors(grid.shape)
+        omnett = cls.iter_omnett_steps(omnett_file, chunksize)
+        vadere = cls.iter_vadere_steps(vadere_file, count_column, chunksize)
+        estimate, reference = next(omnett, None), next(vadere, None)
+        while estimate is not None and reference is not None:
+            if np.isclose(estimate[0], reference[0]):
+                errors.add(cls._to_grid(estimate[1], grid), cls._to_grid(reference[1], grid))
+                estimate, reference = next(omnett, None), next(vadere, None)
+            elif estimate[0] < reference[0]:
+                estimate = next(omnett, None)
+            else:
+                reference = next(vadere, None)
+        return errors
+
+    @classmethod
+    def _to_grid(cls, rows, grid):
+        counts = np.zeros(grid.shape)
+        rows = rows[(rows[:, 0] >= 0.0) & (rows[:, 1] >= 0.0)]
+        i, j = grid.index(rows[:, 0], rows[:, 1])
+        counts[i, j] = rows[:, 2]
+        return counts
 
     @classmethod
     def get_cell_density_vadere_truth(cls, file_path):
-        cls._wait_until_file_exists(file_path)
-        countsCellwiseVadere = pd.read_csv(
-            file_path,
-            delimiter=" ",
-            index_col=[0],
-        ).sort_index(axis=1).round(PRECISION)
-        if (countsCellwiseVadere['size'].std() == 0) is False:
-            raise ValueError("Only squares as cells allowed.")
-            cell_size = countsCellwiseVadere['size'].mean()
-            countsCellwiseVadere.drop(['size'], inplace=True, axis=1)
-            keep = countCellwiseVadere.drop[['x', 'y']] >= 0.0
-            densitiesCellWise = countsCellwiseVadere.loc[keep] / cell_size ** 2
-        return densitiesCellWise
\ No newline at end of file
+        reader = cls._reader(file_path, cls.vadere_truth_reader)
+        reader.wait()
+        reader.read()
+        return reader.frame
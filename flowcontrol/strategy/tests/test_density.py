@@ -0,0 +1,430 @@
+import os
+import shutil
+import tempfile
+from unittest import TestCase, mock
+
+import numpy as np
+import pandas as pd
+from shapely.geometry import Polygon, box
+
+from flowcontrol.strategy.sensor.density import (
+    AreaWeights,
+    CellErrors,
+    CellGrid,
+    DensityMapCheck,
+    DensityMapper,
+    LocalDensitySensor,
+    MeasurementArea,
+    ObstacleIndex,
+    TailReader,
+    iter_density_steps,
+    load_contribution_array,
+)
+
+
+def counts_result(counts, cell_size=0.5):
+    """density map result (x, y, count) of the count array counts[i, j]"""
+    return np.array([[i * cell_size, j * cell_size, c] for (i, j), c in np.ndenumerate(counts)])
+
+
+class TestCellGrid(TestCase):
+
+    def setUp(self):
+        self.grid = CellGrid([10, 5], [0.5, 0.5])
+
+    def test__shape(self):
+        assert self.grid.shape == (20, 10)
+        assert len(self.grid) == 200
+
+    def test__index(self):
+        i, j = self.grid.index(np.array([0.0, 1.5, 9.5]), np.array([0.0, 4.5, 2.0]))
+        np.testing.assert_array_equal(i, [0, 3, 19])
+        np.testing.assert_array_equal(j, [0, 9, 4])
+
+    def test__index_not_a_corner(self):
+        with self.assertRaises(ValueError):
+            self.grid.index(0.2, 0.0)
+        with self.assertRaises(ValueError):
+            self.grid.index(10.0, 0.0)
+
+    def test__cells_in_bounds(self):
+        assert self.grid.cells_in_bounds(0.6, 0.0, 1.2, 0.5) == [(1, 0), (2, 0)]
+        assert self.grid.cells_in_bounds(20.0, 20.0, 30.0, 30.0) == []
+
+    def test__lazy_cells(self):
+        cell = self.grid.get_cell(3, 2)
+        assert cell.polygon.equals(box(1.5, 1.0, 2.0, 1.5))
+        assert self.grid.get_cell(3, 2) is cell
+        assert len(self.grid.get_all_cells()) == 200
+
+
+class TestObstacleIndex(TestCase):
+
+    def test__overlapping_obstacles(self):
+        index = ObstacleIndex([box(0.0, 0.0, 0.3, 0.5), box(0.2, 0.0, 0.4, 0.5), box(0.8, 0.8, 0.9, 0.9)])
+        areas = index.non_reachable_areas([box(0.0, 0.0, 0.5, 0.5), box(0.5, 0.5, 1.0, 1.0), box(2, 2, 3, 3)])
+        np.testing.assert_allclose(areas, [0.2, 0.01, 0.0])
+
+    def test__fractions_of_cells(self):
+        grid = CellGrid([1, 1], [0.5, 0.5])
+        index = ObstacleIndex([box(0.0, 0.0, 0.25, 1.0)], grid)
+        fractions = index.non_reachable_fractions(np.array([0, 1]), np.array([1, 1]))
+        np.testing.assert_allclose(fractions, [0.5, 0.0])
+        assert np.isnan(index.non_reachable[0, 0])
+
+
+class TestMeasurementArea(TestCase):
+
+    def test__cell_contribution(self):
+        grid = CellGrid([2, 1], [0.5, 0.5])
+        area = MeasurementArea(1, box(0.2, 0.0, 1.0, 0.5))
+        contribution = area.get_cell_contribution(grid, obstacles=[box(0.0, 0.0, 0.1, 0.5)])
+        # cell (2, 0) only touches the area
+        assert list(contribution) == [(0, 0), (1, 0)]
+        assert np.isclose(contribution[(0, 0)]["area"], 0.6)
+        assert np.isclose(contribution[(0, 0)]["count"], 0.6 / 0.8)
+        assert contribution[(1, 0)] == {"area": 1.0, "count": 1}
+
+    def test__cell_covered_by_obstacle(self):
+        grid = CellGrid([2, 1], [0.5, 0.5])
+        area = MeasurementArea(1, box(0.2, 0.0, 1.0, 0.5))
+        contribution = area.get_cell_contribution(grid, obstacles=[box(0.0, 0.0, 0.5, 0.5)])
+        assert contribution[(0, 0)]["count"] == 0
+
+
+class TestDensityMapper(TestCase):
+
+    def test__get_cells(self):
+        mapper = DensityMapper([2, 1], [0.5, 0.5], {}, [])
+        cells = mapper.get_cells()
+        assert len(cells) == 8
+        assert cells["x=1.5_y=0.5"].polygon.equals(box(1.5, 0.5, 2.0, 1.0))
+        assert cells["x=1.5_y=0.5"].id == 7
+
+    def test__update_cell(self):
+        mapper = DensityMapper([2, 1], [0.5, 0.5], {}, [])
+        mapper.update_cell(1.0, 0.5, 3)
+        assert mapper.get_cells()["x=1.0_y=0.5"].get_count() == 3
+        with self.assertRaises(ValueError):
+            mapper.update_cell(1.1, 0.5, 3)
+        with self.assertRaises(ValueError):
+            mapper.update_cell(1.0, 0.5, 0.5)
+
+    def test__update_density(self):
+        mapper = DensityMapper([1, 1], [0.25, 0.25], {}, [])
+        counts = np.arange(16.0).reshape(4, 4)
+        mapper.update_density(counts_result(counts, cell_size=0.25))
+        np.testing.assert_array_equal(mapper.grid.counts, counts)
+        assert mapper.get_cells()["x=0.2_y=0.5"].get_count() == counts[1, 2]
+
+    def test__update_density_not_int(self):
+        mapper = DensityMapper([1, 1], [0.5, 0.5], {}, [])
+        with self.assertRaises(ValueError):
+            mapper.update_density([[0.0, 0.0, 1.0], [0.5, 0.0, 1.5]])
+        with self.assertRaises(ValueError):
+            mapper.update_density([[0.0, 0.3, 1.0]])
+
+    def test__density_uniform(self):
+        areas = {1: MeasurementArea(1, box(1.0, 1.0, 3.0, 2.0)), 2: MeasurementArea(2, box(0.25, 0.0, 0.75, 1.0))}
+        mapper = DensityMapper([4, 4], [0.5, 0.5], areas, [])
+        counts = np.zeros((8, 8))
+        counts[2:6, 2:4] = 1.0
+        counts[0:2, 0:2] = 2.0
+        mapper.update_density(counts_result(counts))
+        densities = mapper.get_density_in_area()
+        assert np.isclose(densities[1], 8 / 2.0)
+        assert np.isclose(densities[2], 4 / 0.5)
+
+    def test__weights(self):
+        areas = {"a": MeasurementArea("a", box(0.0, 0.0, 0.5, 0.5)), "b": MeasurementArea("b", box(0.25, 0.0, 1.0, 0.5))}
+        mapper = DensityMapper([1, 1], [0.5, 0.5], areas, [])
+        weights = mapper.get_weights()
+        assert weights.ids == ["a", "b"]
+        np.testing.assert_array_equal(weights.indptr, [0, 1, 3])
+        np.testing.assert_array_equal(weights.indices, [0, 0, 2])
+        np.testing.assert_allclose(weights.data, [1.0, 0.5, 1.0])
+        np.testing.assert_allclose(weights.areas, [0.25, 0.375])
+        assert mapper.get_weights() is weights
+
+        areas["c"] = MeasurementArea("c", box(0.5, 0.5, 1.0, 1.0))
+        assert mapper.get_weights().ids == ["a", "b", "c"]
+
+    def test__weights_empty_area(self):
+        grid = CellGrid([1, 1], [0.5, 0.5])
+        weights = AreaWeights.from_contributions(grid, {1: {}, 2: {(1, 1): {"area": 1.0, "count": 1}}})
+        np.testing.assert_array_equal(weights.dot(np.arange(4.0)), [0.0, 3.0])
+
+
+class TestLocalDensity(TestCase):
+
+    def setUp(self):
+        areas = {1: MeasurementArea(1, box(0.0, 0.0, 1.0, 1.0))}
+        self.mapper = DensityMapper([2, 1], [0.5, 0.5], areas, [])
+        self.positions = np.array([[0.1, 0.1], [0.2, 0.4], [1.9, 0.6], [0.7, 0.5], [-0.1, 0.2], [2.5, 0.1], [np.nan, 0.2]])
+
+    def test__update_density_from_positions(self):
+        self.mapper.update_density_from_positions(self.positions)
+        expected = np.zeros((4, 2))
+        expected[0, 0] = 2
+        expected[1, 1] = 1
+        expected[3, 1] = 1
+        np.testing.assert_array_equal(self.mapper.grid.counts, expected)
+
+    def test__sensor(self):
+        listener = mock.Mock(pedestrian_positions=self.positions)
+        densities = LocalDensitySensor(self.mapper, listener).get_density_in_area()
+        assert densities == {1: 3.0}
+        listener.pedestrian_positions = np.empty((0, 2))
+        assert LocalDensitySensor(self.mapper, listener).get_density_in_area() == {1: 0.0}
+
+
+class TestGaussianDensity(TestCase):
+
+    def setUp(self):
+        areas = {1: MeasurementArea(1, box(3.0, 3.0, 7.0, 7.0))}
+        self.mapper = DensityMapper([10, 10], [0.5, 0.5], areas, [])
+
+    def test__smooth_counts(self):
+        counts = np.zeros(self.mapper.grid.shape)
+        counts[10, 6] = 1.0
+        self.mapper.grid.counts[:] = counts
+        smoothed = self.mapper.smooth_counts(bandwidth=0.5)
+        # separable Gaussian with standard deviation of one cell, centered at the agent
+        kernel = np.exp(-0.5 * np.arange(-4, 5) ** 2)
+        kernel /= kernel.sum()
+        np.testing.assert_allclose(smoothed[6:15, 2:11], np.outer(kernel, kernel), atol=1e-12)
+        assert np.isclose(smoothed.sum(), 1.0)
+
+    def test__constant_counts(self):
+        self.mapper.grid.counts[:] = 2.0
+        densities = self.mapper.get_density_in_area(distribution="gaussian", bandwidth=0.5)
+        assert np.isclose(densities[1], 2.0 / 0.25)
+
+    def test__kernel_cached(self):
+        spectrum = self.mapper.get_kernel_spectrum(1.0)
+        assert self.mapper.get_kernel_spectrum(1.0) is spectrum
+        assert self.mapper.get_kernel_spectrum(0.5) is not spectrum
+        with self.assertRaises(ValueError):
+            self.mapper.get_kernel_spectrum(0.0)
+
+    def test__unknown_distribution(self):
+        with self.assertRaises(NotImplementedError):
+            self.mapper.get_density_in_area(distribution="triangular")
+
+
+class TestParallelContributions(TestCase):
+
+    def areas(self):
+        return {
+            "corridor": MeasurementArea("corridor", box(0.2, 0.3, 4.1, 1.7)),
+            "exit": MeasurementArea("exit", Polygon([(3.1, 3.2), (4.6, 3.3), (3.8, 4.9)])),
+            "small": MeasurementArea("small", box(2.0, 2.0, 2.3, 2.3)),
+        }
+
+    def test__same_as_serial(self):
+        obstacles = [box(1.0, 0.2, 1.1, 0.7), box(3.5, 3.6, 3.7, 3.9)]
+        serial = DensityMapper([5, 5], [0.5, 0.5], self.areas(), obstacles)
+        serial.get_weights()
+        parallel = DensityMapper([5, 5], [0.5, 0.5], self.areas(), obstacles, max_workers=2)
+        for id, measurement_area in parallel.measurement_areas.items():
+            expected = serial.measurement_areas[id].cell_contribution
+            assert list(measurement_area.cell_contribution.items()) == list(expected.items())
+
+
+class TestContributionCache(TestCase):
+
+    def setUp(self):
+        self.cache_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.cache_dir)
+
+    def mapper(self, obstacles):
+        areas = {1: MeasurementArea(1, Polygon([(0.2, 0.1), (1.7, 0.3), (1.1, 1.8)]))}
+        return DensityMapper([2, 2], [0.5, 0.5], areas, obstacles, cache_dir=self.cache_dir)
+
+    def test__load_from_cache(self):
+        obstacles = [box(1.0, 0.2, 1.1, 0.7), box(0.6, 0.6, 0.7, 0.7)]
+        expected = self.mapper(obstacles).get_weights()
+        assert len(os.listdir(self.cache_dir)) == 1
+
+        mapper = self.mapper(obstacles[::-1])
+        with mock.patch.object(MeasurementArea, "get_cell_contribution", side_effect=AssertionError):
+            weights = mapper.get_weights()
+        np.testing.assert_array_equal(weights.indices, expected.indices)
+        np.testing.assert_array_equal(weights.data, expected.data)
+        np.testing.assert_array_equal(weights.areas, expected.areas)
+        # the cached array is used directly, no dict of the cells is built
+        assert mapper.measurement_areas[1].cell_contribution == {}
+
+    def test__key_changes_with_obstacles(self):
+        self.mapper([box(1.0, 0.2, 1.1, 0.7)]).get_weights()
+        self.mapper([box(1.0, 0.2, 1.2, 0.7)]).get_weights()
+        assert len(os.listdir(self.cache_dir)) == 2
+
+    def test__key_changes_with_cache_version(self):
+        mapper = self.mapper([])
+        key = mapper.get_cache_key(mapper.measurement_areas[1])
+        with mock.patch("flowcontrol.strategy.sensor.density.CONTRIBUTION_CACHE_VERSION", 1):
+            assert mapper.get_cache_key(mapper.measurement_areas[1]) != key
+
+    def test__broken_file(self):
+        mapper = self.mapper([])
+        file_path = os.path.join(self.cache_dir, f"{mapper.get_cache_key(mapper.measurement_areas[1])}.npy")
+        with open(file_path, "wb") as f:
+            f.write(b"no numpy file")
+        mapper.get_weights()
+        assert len(load_contribution_array(file_path)) > 0
+
+    def test__parallel_uses_cache(self):
+        self.mapper([]).get_weights()
+        mapper = self.mapper([])
+        with mock.patch("flowcontrol.strategy.sensor.density.ProcessPoolExecutor", side_effect=AssertionError):
+            mapper.compute_cell_contributions_parallel(max_workers=2)
+        with mock.patch.object(MeasurementArea, "get_cell_contribution", side_effect=AssertionError):
+            mapper.get_weights()
+
+
+class TestTailReader(TestCase):
+
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.dir)
+        self.file_path = os.path.join(self.dir, "globalDensity.txt")
+        self.addCleanup(DensityMapCheck.drop_readers)
+
+    def append(self, text):
+        with open(self.file_path, "a") as f:
+            f.write(text)
+
+    def test__wait(self):
+        reader = TailReader(self.file_path)
+        assert reader.wait(timeout=0.01) is False
+        self.append("time x y")
+        assert reader.wait(timeout=0.01) is False
+        self.append(" count\n")
+        assert reader.wait(timeout=0.01)
+        assert reader.columns == ["time", "x", "y", "count"]
+
+    def test__read_appended_rows(self):
+        reader = TailReader(self.file_path)
+        assert reader.read().empty
+        self.append("time x y count\n0.4 0.0 0.0 1\n0.4 0.5 0.0 2\n0.8 0.0")
+        assert reader.read()["count"].tolist() == [1, 2]
+        offset = reader.offset
+        assert reader.read().empty and reader.offset == offset
+
+        self.append(" 0.0 3\n0.8 0.5 0.0 4\n")
+        rows = reader.read()
+        assert rows.index.tolist() == [0.8, 0.8] and rows["count"].tolist() == [3, 4]
+        assert reader.frame["count"].tolist() == [1, 2, 3, 4]
+
+    def test__omnett_truth(self):
+        self.append("time y x count\n0.4 0.0 0.5 1\n0.8 0.5 0.0 2\n")
+        expected = pd.read_csv(self.file_path, delimiter=" ", index_col=[0], header=[0]).sort_index(axis=1)
+        expected.index = expected.index / 0.4
+        pd.testing.assert_frame_equal(DensityMapCheck.get_cell_density_omnett_truth(self.file_path), expected[["x", "y", "count"]])
+
+        reader = DensityMapCheck.omnett_truth_reader(self.file_path)
+        reader.wait()
+        reader.read()
+        self.append("1.2 0.5 0.5 3\n")
+        rows = reader.read()
+        np.testing.assert_allclose(rows.index, [3.0])
+        assert rows.columns.tolist() == ["x", "y", "count"]
+
+    def test__getter_reads_appended_rows(self):
+        self.append("time x y count\n0.4 0.0 0.0 1\n0.4 0.5 0.0 2\n")
+        assert len(DensityMapCheck.get_cell_density_omnett_truth(self.file_path)) == 2
+
+        self.append("0.8 0.0 0.0 3\n")
+        with mock.patch("flowcontrol.strategy.sensor.density.pd.read_csv", wraps=pd.read_csv) as read_csv:
+            frame = DensityMapCheck.get_cell_density_omnett_truth(self.file_path)
+        assert read_csv.call_args[0][0].getvalue() == b"0.8 0.0 0.0 3\n"
+        assert frame["count"].tolist() == [1, 2, 3]
+
+    def test__next_run_replaces_file(self):
+        self.append("time x y count\n0.4 0.0 0.0 1\n")
+        assert DensityMapCheck.get_cell_density_omnett_truth(self.file_path)["count"].tolist() == [1]
+
+        # new, longer file at the same path
+        new_file = os.path.join(self.dir, "new.txt")
+        with open(new_file, "w") as f:
+            f.write("time x y count\n0.4 0.0 0.0 5\n0.4 0.5 0.0 6\n0.8 0.0 0.0 7\n")
+        os.replace(new_file, self.file_path)
+        assert DensityMapCheck.get_cell_density_omnett_truth(self.file_path)["count"].tolist() == [5, 6, 7]
+
+        # rewritten in place (same inode and header)
+        with open(self.file_path, "w") as f:
+            f.write("time x y count\n0.4 0.0 0.0 8\n0.4 0.5 0.0 9\n0.8 0.0 0.0 3\n0.8 0.5 0.0 1\n")
+        assert DensityMapCheck.get_cell_density_omnett_truth(self.file_path)["count"].tolist() == [8, 9, 3, 1]
+
+    def test__drop_readers(self):
+        self.append("time x y count\n0.4 0.0 0.0 1\n")
+        DensityMapCheck.get_cell_density_omnett_truth(self.file_path)
+        assert len(DensityMapCheck._readers) == 1
+        DensityMapCheck.drop_readers(os.path.join(self.dir, ".", "globalDensity.txt"))
+        assert len(DensityMapCheck._readers) == 0
+
+    def test__vadere_truth(self):
+        self.append("timeStep x y size count\n1 0.0 0.0 0.5 1\n1 -0.5 0.0 0.5 4\n")
+        frame = DensityMapCheck.get_cell_density_vadere_truth(self.file_path)
+        assert frame.columns.tolist() == ["count", "x", "y"]
+        assert frame["count"].tolist() == [4.0]
+
+        self.append("2 0.5 0.0 0.5 2\n")
+        with mock.patch("flowcontrol.strategy.sensor.density.pd.read_csv", wraps=pd.read_csv) as read_csv:
+            frame = DensityMapCheck.get_cell_density_vadere_truth(self.file_path)
+        assert read_csv.call_count == 1
+        assert frame["count"].tolist() == [4.0, 8.0]
+
+        self.append("3 0.5 0.0 1.0 2\n3 0.0 0.0 0.5 2\n")
+        with self.assertRaises(ValueError):
+            DensityMapCheck.get_cell_density_vadere_truth(self.file_path)
+
+
+class TestStreamingAnalysis(TestCase):
+
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.dir)
+        self.grid = CellGrid([1, 1], [0.5, 0.5])
+        rng = np.random.default_rng(7)
+        self.vadere = rng.integers(0, 4, (5, 2, 2)).astype(float)
+        self.omnett = self.vadere + rng.integers(-1, 2, (5, 2, 2))
+
+        self.vadere_file = os.path.join(self.dir, "countsCellwise.txt")
+        with open(self.vadere_file, "w") as f:
+            f.write("timeStep x y size count\n")
+            for step in range(5):
+                f.write(f"{step + 1} -0.5 0.0 0.5 9\n")
+                for (i, j), count in np.ndenumerate(self.vadere[step]):
+                    f.write(f"{step + 1} {i * 0.5} {j * 0.5} 0.5 {count}\n")
+
+        # OMNeT++ map starts one step later and leaves out empty cells
+        self.omnett_file = os.path.join(self.dir, "globalDensity.txt")
+        with open(self.omnett_file, "w") as f:
+            f.write("time x y count\n")
+            for step in range(1, 5):
+                for (i, j), count in np.ndenumerate(self.omnett[step]):
+                    if count != 0:
+                        f.write(f"{(step + 1) * 0.4:.1f} {i * 0.5} {j * 0.5} {count}\n")
+
+    def test__iter_steps(self):
+        for chunksize in (1, 4, 7, 100):
+            steps = list(iter_density_steps(self.vadere_file, chunksize=chunksize))
+            assert [step for step, _ in steps] == [1, 2, 3, 4, 5]
+            np.testing.assert_array_equal(steps[2][1][1:, 2], self.vadere[2].ravel())
+        steps = [step for step, _ in DensityMapCheck.iter_omnett_steps(self.omnett_file, chunksize=3)]
+        assert steps == [2, 3, 4, 5]
+
+    def test__compare_cell_counts(self):
+        errors = DensityMapCheck.compare_cell_counts(self.omnett_file, self.vadere_file, self.grid, chunksize=3)
+        error = self.omnett[1:] - self.vadere[1:]
+        assert errors.steps == 4
+        np.testing.assert_allclose(errors.bias, error.mean(axis=0))
+        np.testing.assert_allclose(errors.mae, np.abs(error).mean(axis=0))
+        np.testing.assert_allclose(errors.rmse, np.sqrt((error ** 2).mean(axis=0)))
+
+    def test__no_steps(self):
+        errors = CellErrors(self.grid.shape)
+        assert errors.steps == 0
+        assert np.isnan(errors.rmse).all()
@@ -28,10 +28,11 @@ class PingPong(Controller):
 
         aa =  self.con_manager.domains.v_person.get_id_list()
 
-        for ped_id in aa: #["1", "2", "3", "4"]:
-            self.con_manager.domains.v_person.set_target_list(
-                str(ped_id), [str(target_id)]
-            )
+        with self.con_manager.traci.batch():
+            for ped_id in aa: #["1", "2", "3", "4"]:
+                self.con_manager.domains.v_person.set_target_list(
+                    str(ped_id), [str(target_id)]
+                )
         self.time_stepper.forward_time()
 
 if __name__ == "__main__":
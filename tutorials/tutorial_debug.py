@@ -26,10 +26,12 @@ class PingPong(Controller):
         print(f"TikTokController: {sim_time} handle_sim_step evaluate control...")
 
         print(f"TikTokController: {sim_time} apply control action ")
-        for ped_id in ["1", "2", "3", "4"]:
-            self.con_manager.domains.v_person.set_target_list(
-                str(ped_id), self.control[self.count][1]
-            )
+        # send all set commands in one message (one round trip)
+        with self.con_manager.traci.batch():
+            for ped_id in ["1", "2", "3", "4"]:
+                self.con_manager.domains.v_person.set_target_list(
+                    str(ped_id), self.control[self.count][1]
+                )
 
         self.count += 1
 